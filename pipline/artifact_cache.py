@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+# artifact_cache.py
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+# Bump when the layout of stored entries or the meaning of step outputs changes.
+CACHE_FORMAT_VERSION = 1
+_HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def hash_file(path):
+    """Returns the SHA-256 hex digest of a file's content, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class NotCacheableError(TypeError):
+    """Raised when a step output cannot be represented in a cache entry."""
+
+
+def compute_step_key(step_id, params, input_files, upstream_keys):
+    """
+    Hashes a step's id, configuration constants, input file contents and upstream keys.
+    Returns None if an upstream key or an input file is missing.
+    """
+    if any(k is None for k in upstream_keys):
+        return None
+    file_digests = []
+    for path in input_files:
+        if not path or not Path(path).is_file():
+            return None
+        file_digests.append(hash_file(path))
+    payload = {
+        'format': CACHE_FORMAT_VERSION,
+        'step': step_id,
+        'params': params,
+        'files': file_digests,
+        'upstream': list(upstream_keys),
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=repr).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class ArtifactCache:
+    """
+    Content-addressed store for pipeline step outputs.
+
+    A step's key is a hash of its id, its configuration constants, the content of its
+    external input files (e.g. the defect CSV) and the keys of the upstream steps it
+    consumes. Chaining upstream keys instead of hashing intermediate files keeps keys
+    stable even though formats like GPKG embed timestamps, so changing one constant
+    only invalidates the step that uses it and the steps downstream of it.
+
+    An entry holds the values the step put into the run context. Files and directories
+    inside the run's output directory are archived with the entry and copied back on restore.
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def step_key(self, step_id, params, input_files, upstream_keys):
+        """Returns the cache key for a step, or None if an input is missing."""
+        return compute_step_key(step_id, params, input_files, upstream_keys)
+
+    def _entry_dir(self, key):
+        return self.cache_dir / key[:2] / key
+
+    def has(self, key):
+        return (self._entry_dir(key) / 'values.json').is_file()
+
+    def load(self, key, output_dir):
+        """Restores an entry into output_dir. Returns the decoded values, or None on a miss."""
+        entry_dir = self._entry_dir(key)
+        values_path = entry_dir / 'values.json'
+        if not values_path.is_file():
+            return None
+        try:
+            with open(values_path, 'r', encoding='utf-8') as f:
+                encoded = json.load(f)
+            return {name: decode_value(value, Path(output_dir), entry_dir / 'files') for name, value in encoded.items()}
+        except Exception as e:
+            print(f"  Warning: Could not restore cache entry {key[:12]}: {e}")
+            return None
+
+    def store(self, key, values, output_dir):
+        """Archives a step's output values. Returns False if they cannot be cached."""
+        entry_dir = self._entry_dir(key)
+        entry_dir.parent.mkdir(parents=True, exist_ok=True)
+        staging_dir = Path(tempfile.mkdtemp(prefix=f".{key[:12]}_", dir=entry_dir.parent))
+        try:
+            encoded = {name: encode_value(value, Path(output_dir), staging_dir / 'files') for name, value in values.items()}
+            with open(staging_dir / 'values.json', 'w', encoding='utf-8') as f:
+                json.dump(encoded, f, indent=1)
+            if entry_dir.exists():
+                shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(staging_dir, entry_dir)
+            return True
+        except NotCacheableError as e:
+            print(f"  Note: Step outputs not cached: {e}")
+            return False
+        except Exception as e:
+            print(f"  Warning: Could not store cache entry {key[:12]}: {e}")
+            return False
+        finally:
+            if staging_dir.exists():
+                shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def _relative_output_path(value, output_dir):
+    """Returns the path relative to output_dir if value names an existing file/dir inside it."""
+    try:
+        path = Path(value)
+        if not path.exists():
+            return None
+        rel_path = path.resolve().relative_to(output_dir.resolve())
+        return rel_path if rel_path.parts else None # Never archive the output dir itself
+    except (ValueError, OSError, TypeError):
+        return None
+
+
+def encode_value(value, output_dir, files_dir=None):
+    """
+    Encodes a run context value as JSON-serializable data. Files and directories inside
+    output_dir are stored by their relative path and, if files_dir is given, copied into it.
+    Raises NotCacheableError for values that have no encoding.
+    """
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, (str, Path)):
+        rel_path = _relative_output_path(value, output_dir)
+        if rel_path is None:
+            return str(value) if isinstance(value, Path) else value
+        if files_dir is not None:
+            target = files_dir / rel_path
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if Path(value).is_dir():
+                shutil.copytree(value, target, dirs_exist_ok=True)
+            else:
+                shutil.copy2(value, target)
+        return {'__path__': rel_path.as_posix(), '__as__': 'Path' if isinstance(value, Path) else 'str'}
+    if type(value).__name__ == 'Affine':
+        return {'__affine__': list(value)[:6]}
+    if type(value).__name__ == 'CRS' and hasattr(value, 'to_wkt'):
+        return {'__crs__': value.to_wkt()}
+    if isinstance(value, tuple):
+        return {'__tuple__': [encode_value(v, output_dir, files_dir) for v in value]}
+    if isinstance(value, list):
+        return [encode_value(v, output_dir, files_dir) for v in value]
+    if isinstance(value, dict) and all(isinstance(k, str) for k in value):
+        return {'__dict__': {k: encode_value(v, output_dir, files_dir) for k, v in value.items()}}
+    raise NotCacheableError(f"value of type {type(value).__name__} cannot be cached")
+
+
+def decode_value(value, output_dir, files_dir=None):
+    """
+    Inverse of encode_value(). Stored files are copied back from files_dir into output_dir;
+    without files_dir they must still exist in output_dir (FileNotFoundError otherwise).
+    """
+    if isinstance(value, list):
+        return [decode_value(v, output_dir, files_dir) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if '__path__' in value:
+        target = output_dir / value['__path__']
+        if files_dir is None:
+            if not target.exists():
+                raise FileNotFoundError(f"Output {target} no longer exists.")
+        else:
+            source = files_dir / value['__path__']
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if source.is_dir():
+                shutil.copytree(source, target, dirs_exist_ok=True)
+            else:
+                shutil.copy2(source, target)
+        return target if value.get('__as__') == 'Path' else str(target)
+    if '__affine__' in value:
+        from affine import Affine # Installed with rasterio
+        return Affine(*value['__affine__'])
+    if '__crs__' in value:
+        import pyproj
+        return pyproj.CRS.from_wkt(value['__crs__'])
+    if '__tuple__' in value:
+        return tuple(decode_value(v, output_dir, files_dir) for v in value['__tuple__'])
+    if '__dict__' in value:
+        return {k: decode_value(v, output_dir, files_dir) for k, v in value['__dict__'].items()}
+    return value
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+# batch_runner.py
+"""
+Runs the pipeline for many sites (defect CSVs) in one go.
+
+The manifest is either a text file with one defect CSV path per line, or a JSON list whose
+entries are CSV paths or objects {"name": ..., "csv": ..., "config": {CONSTANT: value}}.
+Relative CSV paths are resolved against the manifest's directory. Sites without a name are
+named after their CSV path (e.g. 'campaign_12/defects.csv' -> 'campaign_12_defects').
+
+Usage:
+    python batch_runner.py sites.json --workers 4 --output-dir output_batch
+    python batch_runner.py sites.json --resume    # re-run only what failed last time
+"""
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import re
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import main_orchestrator
+from step_scheduler import COMPLETED_STATUSES
+
+BATCH_SUMMARY_FILENAME = "batch_summary.json"
+SITE_LOG_FILENAME = "pipeline.log"
+
+
+def load_manifest(manifest_path_str):
+    """
+    Reads a batch manifest.
+
+    Returns:
+        list: dicts with 'name', 'csv' and 'config' (constant overrides) per site.
+    """
+    manifest_path = Path(manifest_path_str)
+    if manifest_path.suffix.lower() == '.json':
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            raw_entries = json.load(f)
+        if not isinstance(raw_entries, list):
+            raise ValueError(f"Manifest {manifest_path} must contain a JSON list of sites.")
+    else:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            raw_entries = [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+    sites, used_names = [], set()
+    for index, entry in enumerate(raw_entries):
+        if isinstance(entry, str):
+            entry = {'csv': entry}
+        if not isinstance(entry, dict) or not entry.get('csv'):
+            raise ValueError(f"Manifest entry {index} has no 'csv' path: {entry!r}")
+        csv_path = Path(entry['csv'])
+        if not csv_path.is_absolute():
+            csv_path = manifest_path.parent / csv_path
+        name = _site_dir_name(entry.get('name') or Path(entry['csv']).with_suffix('').as_posix())
+        if name in used_names: # Output directories must not collide
+            name = f"{name}_{index}"
+        used_names.add(name)
+        sites.append({'name': name, 'csv': str(csv_path), 'config': dict(entry.get('config') or {})})
+    return sites
+
+def _site_dir_name(name):
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', str(name)).strip('_') or 'site'
+
+
+def _init_batch_worker():
+    """
+    Process pool initializer. Warms the per-process state once so that every site handled
+    by this worker reuses it: the step modules (including the CadQuery import), the HTTP
+    session and the pyproj transformers for the default CRS pair.
+    """
+    from helpers import use_headless_plotting
+    from http_session import get_session
+    from transformer_cache import get_transformer
+    try:
+        importlib.import_module("step6_generate_cut_obj_model") # Imports CadQuery/OCCT once per worker
+    except ImportError as e:
+        print(f"  Warning: Could not preload Step 6 in batch worker (reported again by Step 6): {e}")
+    use_headless_plotting()
+    get_session()
+    try: get_transformer(main_orchestrator.SOURCE_CRS, main_orchestrator.TARGET_CRS, always_xy=True)
+    except Exception as e: print(f"  Warning: Could not pre-create transformer in batch worker: {e}")
+
+
+def run_site(site, output_dir_base_str, step_max_workers, resume=False):
+    """
+    Runs the pipeline for one site in the current (worker) process. The pipeline output is
+    written to a log file in the site's output directory instead of the shared console.
+    With resume=True the site continues from its run manifest (see main_orchestrator.run_pipeline).
+
+    Returns:
+        dict: summary of the site run (JSON serializable).
+    """
+    output_dir = Path(output_dir_base_str) / site['name']
+    output_dir.mkdir(parents=True, exist_ok=True)
+    log_path = output_dir / SITE_LOG_FILENAME
+    overrides = {'SCHEDULER_MAX_WORKERS': step_max_workers}
+    overrides.update(site['config'])
+    summary = {'name': site['name'], 'csv': site['csv'], 'output_dir': str(output_dir),
+               'log': str(log_path), 'pid': os.getpid(), 'status': {}, 'error': None}
+
+    start_time = time.time()
+    with open(log_path, 'a' if resume else 'w', encoding='utf-8') as log_file, \
+         contextlib.redirect_stdout(log_file), contextlib.redirect_stderr(log_file):
+        try:
+            status, ctx = main_orchestrator.run_pipeline(csv_file=site['csv'], output_dir_base=str(output_dir),
+                                                         config_overrides=overrides, resume=resume)
+            summary['status'] = dict(status)
+            summary['outputs'] = {key: str(ctx[key]) for key in
+                                  ('transformed_obj_path', 'nav2_map_yaml_path', 'tiles_index_path', 'waypoints_yaml_path',
+                                   'gazebo_world_path')
+                                  if ctx.get(key)}
+        except Exception as e:
+            summary['error'] = f"{type(e).__name__}: {e}"
+            traceback.print_exc()
+    summary['elapsed_s'] = round(time.time() - start_time, 2)
+    summary['ok'] = summary['error'] is None and bool(summary['status']) and \
+                    all(s in COMPLETED_STATUSES for s in summary['status'].values())
+    return summary
+
+
+def run_batch(manifest_path_str, output_dir_base=None, max_workers=None, config_overrides=None, resume=False):
+    """
+    Runs all sites of a manifest in a process pool and writes an aggregated summary.
+    With resume=True every site continues from the steps it completed in the previous batch run.
+
+    Returns:
+        list: per-site summaries in manifest order.
+    """
+    cfg = main_orchestrator.load_config(config_overrides)
+    output_dir_base = Path(output_dir_base or cfg.BATCH_OUTPUT_DIR_BASE)
+    max_workers = max(1, int(max_workers or cfg.BATCH_MAX_WORKERS))
+    sites = load_manifest(manifest_path_str)
+    for site in sites: # Batch-wide overrides apply to every site unless the site sets its own
+        site['config'] = {**(config_overrides or {}), **site['config']}
+    output_dir_base.mkdir(parents=True, exist_ok=True)
+
+    print(f"--- Batch Start: {len(sites)} site(s), {max_workers} worker process(es) ---")
+    print(f"Site outputs will be saved in: {output_dir_base.resolve()}")
+    start_time = time.time()
+    summaries = {}
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_batch_worker) as executor:
+        futures = {executor.submit(run_site, site, str(output_dir_base), cfg.BATCH_STEP_MAX_WORKERS, resume): site
+                   for site in sites}
+        for future in as_completed(futures):
+            site = futures[future]
+            try:
+                summary = future.result()
+            except Exception as e: # Worker process died or the summary could not be returned
+                summary = {'name': site['name'], 'csv': site['csv'], 'status': {}, 'ok': False,
+                           'error': f"{type(e).__name__}: {e}"}
+            summaries[site['name']] = summary
+            print(f"  [{len(summaries)}/{len(sites)}] {site['name']}: {'OK' if summary['ok'] else 'FAILED'}"
+                  f" ({summary.get('elapsed_s', 0.0):.1f}s)" + (f" - {summary['error']}" if summary.get('error') else ""))
+
+    ordered = [summaries[site['name']] for site in sites]
+    total_elapsed = time.time() - start_time
+    _write_batch_summary(ordered, output_dir_base / BATCH_SUMMARY_FILENAME, total_elapsed)
+    return ordered
+
+def _write_batch_summary(summaries, summary_path, total_elapsed):
+    step_totals = {}
+    for summary in summaries:
+        for status in summary['status'].values():
+            step_totals[status] = step_totals.get(status, 0) + 1
+    failed = [s['name'] for s in summaries if not s['ok']]
+
+    print("\n--- Batch Complete ---")
+    print(f"Total execution time: {total_elapsed:.2f} seconds")
+    print(f"Sites: {len(summaries) - len(failed)} ok, {len(failed)} failed")
+    print("Step outcomes: " + (", ".join(f"{k}={v}" for k, v in sorted(step_totals.items())) or "-"))
+    for summary in summaries:
+        not_done = [f"{sid}={st}" for sid, st in summary['status'].items() if st not in COMPLETED_STATUSES]
+        if not_done or summary.get('error'):
+            print(f"  {summary['name']}: {', '.join(not_done) or summary['error']}  (log: {summary.get('log', '-')})")
+
+    try:
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            json.dump({'total_elapsed_s': round(total_elapsed, 2), 'sites_ok': len(summaries) - len(failed),
+                       'sites_failed': failed, 'step_outcomes': step_totals, 'sites': summaries}, f, indent=2)
+        print(f"Batch summary saved to: {summary_path.resolve()}")
+    except Exception as e:
+        print(f"  Warning: Could not write batch summary {summary_path}: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the pipeline for every site listed in a manifest.")
+    parser.add_argument('manifest', help="Text file with one defect CSV per line, or a JSON list of sites.")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: BATCH_MAX_WORKERS).")
+    parser.add_argument('--output-dir', default=None, help="Base output directory (default: BATCH_OUTPUT_DIR_BASE).")
+    parser.add_argument('--resume', action='store_true', help="Continue each site from its first incomplete step.")
+    parser.add_argument('--offline', action='store_true', help="No network: WFS data from the WFS cache only, OSM streets from OSM_PBF_PATH only (WFS_OFFLINE).")
+    args = parser.parse_args()
+    summaries = run_batch(args.manifest, output_dir_base=args.output_dir, max_workers=args.workers, resume=args.resume,
+                          config_overrides={'WFS_OFFLINE': True} if args.offline else None)
+    return 0 if all(s['ok'] for s in summaries) else 1
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# benchmarks/__init__.py
+"""
+Offline benchmark suite for the pipeline steps.
+
+All inputs are generated synthetically (see generators.py), so no network access is needed:
+a grid-shaped road network (road polygons and curb/centre lines as GML), a defect CSV, a
+convex hull, sampled points, a georeferenced texture and an OBJ mesh. Each benchmark in
+bench_steps.py times one step function on these inputs.
+
+Run from the pipline/ directory:
+    python -m benchmarks                          # all benchmarks, 'small' scale
+    python -m benchmarks --scale medium --repeat 5
+    python -m benchmarks --only alpha_shape nav2_map
+    python -m benchmarks --update-baselines       # store the results as the new baselines
+
+Results are compared with the baselines in baselines.json (per scale); the run fails (exit
+status 1) if a benchmark is slower than its baseline by more than the regression threshold,
+or has no baseline for the scale (record it with --update-baselines).
+"""
@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+# benchmarks/__main__.py
+from benchmarks.run_benchmarks import main
+
+raise SystemExit(main())
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+# benchmarks/bench_steps.py
+"""
+One benchmark per step function. A benchmark's setup(site, out_dir) imports the step module
+(so import time is not measured) and returns (run, before_each): run() calls the step once
+and returns True if it succeeded, before_each() (or None) restores inputs the step modifies.
+Steps are called with the orchestrator's configuration constants and without plots.
+"""
+import shutil
+from pathlib import Path
+
+import main_orchestrator
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+@benchmark('convex_hull')
+def setup_convex_hull(site, out_dir):
+    from step1_compute_hull import compute_and_save_convex_hull
+    cfg = main_orchestrator.load_config()
+    def run():
+        return bool(compute_and_save_convex_hull(site['defect_csv'], cfg.SOURCE_CRS, cfg.TARGET_CRS,
+                                                 cfg.BUFFER_METERS_FOR_HULL, str(out_dir / cfg.OUTPUT_HULL_GPKG)))
+    return run, None
+
+
+@benchmark('analyze_gml')
+def setup_analyze_gml(site, out_dir):
+    from step3_analyze_gml import analyze_gml_and_sample_points
+    cfg = main_orchestrator.load_config()
+    def run():
+        points_xy = analyze_gml_and_sample_points(site['road_lines_gml'], site['hull_gpkg'], str(out_dir), 'road_lines',
+                                                  analysis_offset=cfg.ANALYSIS_OFFSET_METERS,
+                                                  sample_interval=site['params']['sample_interval_m'],
+                                                  show_plots=False, save_plots=False)
+        return points_xy is not None and len(points_xy) > 0 # An (N, 2) array
+    return run, None
+
+
+@benchmark('alpha_shape')
+def setup_alpha_shape(site, out_dir):
+    from step4_calculate_alpha_shape import calculate_and_save_alpha_shape
+    cfg = main_orchestrator.load_config()
+    def run():
+        return bool(calculate_and_save_alpha_shape(site['sampled_points'], cfg.TARGET_CRS, str(out_dir),
+                                                   Path(cfg.ALPHA_SHAPE_OUTPUT_GML).stem,
+                                                   alpha_parameter=cfg.ALPHA_SHAPE_PARAMETER,
+                                                   default_alpha_if_optimize_fails=cfg.ALPHA_DEFAULT_IF_OPTIMIZE_FAILS,
+                                                   show_plots=False, save_plots=False))
+    return run, None
+
+
+@benchmark('mark_defects')
+def setup_mark_defects(site, out_dir):
+    from step5b_mark_defects_on_texture import mark_defects_on_texture
+    texture_path = out_dir / Path(site['texture_path']).name
+    def before_each(): # Step 5b draws into the texture in place
+        shutil.copy2(site['texture_path'], texture_path)
+    def run():
+        return bool(mark_defects_on_texture(str(texture_path), site['texture_transform'], site['texture_crs'],
+                                            site['defect_csv']))
+    return run, before_each
+
+
+@benchmark('cut_obj_model')
+def setup_cut_obj_model(site, out_dir):
+    from step6_generate_cut_obj_model import generate_cut_obj_model
+    cfg = main_orchestrator.load_config()
+    def run():
+        return bool(generate_cut_obj_model(
+            site['road_polygon_gml'], site['free_space_gml'], str(out_dir), cfg.TARGET_CRS,
+            cfg.BASE_EXTRUSION_CUT_M, cfg.TOOL_EXTRUSION_CUT_M, cfg.CUT_SIMPLIFY_TOLERANCE_M,
+            cfg.CUT_OBJ_OUTPUT_FILENAME, cfg.CUT_MTL_OUTPUT_FILENAME, Path(site['texture_path']).name,
+            cfg.CONVERT_MATERIAL_TOP, cfg.CONVERT_MATERIAL_BOTTOM, cfg.CONVERT_MATERIAL_SIDES,
+            cfg.CONVERT_GENERATE_VT, cfg.CONVERT_Z_TOLERANCE,
+            show_plots=False, save_plots=False, plot_dpi=cfg.PLOT_DPI_ALL_STEPS))
+    return run, None
+
+
+@benchmark('transform_obj')
+def setup_transform_obj(site, out_dir):
+    from step6b_transform_obj import transform_obj_file
+    cfg = main_orchestrator.load_config()
+    def run():
+        success, _, _, _ = transform_obj_file(site['obj_path'], str(out_dir / cfg.TRANSFORMED_OBJ_OUTPUT_FILENAME),
+                                              cfg.TRANSFORM_Z_ADDITIONAL_OFFSET)
+        return bool(success)
+    return run, None
+
+
+@benchmark('nav2_map')
+def setup_nav2_map(site, out_dir):
+    from step7_generate_nav2_map import generate_nav2_map
+    cfg = main_orchestrator.load_config()
+    def run():
+        return bool(generate_nav2_map(site['road_polygon_gml'], site['free_space_gml'], site['local_frame_origin_xy'],
+                                      cfg.TRANSFORM_Z_ADDITIONAL_OFFSET, str(out_dir), cfg.NAV2_MAP_OUTPUT_BASENAME,
+                                      cfg.NAV2_MAP_RESOLUTION, cfg.NAV2_MAP_PADDING_M))
+    return run, None
+
+
+@benchmark('waypoints_yaml')
+def setup_waypoints_yaml(site, out_dir):
+    from step7b_generate_waypoints_yaml import generate_waypoints_yaml
+    cfg = main_orchestrator.load_config()
+    def run():
+        return bool(generate_waypoints_yaml(site['defect_csv'], cfg.SOURCE_CRS, cfg.TARGET_CRS,
+                                            site['local_frame_origin_xy'], cfg.TRANSFORM_Z_ADDITIONAL_OFFSET,
+                                            str(out_dir / cfg.WAYPOINTS_OUTPUT_YAML_FILENAME),
+                                            map_frame_id=cfg.WAYPOINTS_MAP_FRAME_ID))
+    return run, None
+
+
+# Step 2a's tiled, paged download from the local stand-in WFS; every 10th request fails (503), every 7th is slow
+@benchmark('wfs_download')
+def setup_wfs_download(site, out_dir):
+    import http_session
+    from step2a_fetch_wfs import fetch_wfs_tile, wfs_request_tiles
+    from benchmarks.standin_server import StandinServer
+    cfg = main_orchestrator.load_config()
+    streets = [line.buffer(4.0, cap_style=2) for line in site['centerlines']]
+    server = StandinServer(streets, fail_every=10, slow_every=7, slow_s=0.2) # Lives until the benchmark process exits
+    http_session.configure(retries=cfg.HTTP_RETRIES, backoff_base_s=0.01, backoff_max_s=0.1,
+                           hedge_percentile=cfg.HTTP_HEDGE_PERCENTILE, hedge_min_samples=cfg.HTTP_HEDGE_MIN_SAMPLES)
+    tiles = wfs_request_tiles([site['hull_polygon']], tile_size_m=200.0)
+    def run():
+        n_features = 0
+        for bbox, _ in tiles:
+            chunks, _, _, complete = fetch_wfs_tile(server.url('wfs'), cfg.WFS_FEATURE_TYPES[0], bbox, cfg.TARGET_CRS,
+                                                    page_size=50, timeout_s=cfg.WFS_TIMEOUT_S)
+            if not complete: return False
+            n_features += sum(len(chunk) for chunk in chunks)
+        return n_features > 0
+    return run, None
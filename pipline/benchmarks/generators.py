@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+# benchmarks/generators.py
+"""
+Synthetic, reproducible inputs for the benchmarks.
+
+The site is a jittered street grid in the target CRS: open centre lines between the
+intersections (the lines Step 3 samples), closed curb rings around every block (the rings
+Filter 1 removes), the road surface polygon (base for Step 6 and the Nav2 map bounds) and a
+narrower free-space polygon (stand-in for the alpha shape). Defects are small polygons on
+the streets, written in the CSV layout the pipeline reads.
+"""
+import math
+from pathlib import Path
+
+import numpy as np
+from shapely.geometry import LineString, Polygon, box
+from shapely.ops import unary_union
+
+from main_orchestrator import SOURCE_CRS, TARGET_CRS
+
+SITE_ORIGIN_XY = (382400.0, 5748000.0) # Lower-left corner of the street grid (in TARGET_CRS, EPSG:25832 in NRW)
+
+# Input sizes per scale. grid_n streets in each direction -> (grid_n - 1)^2 blocks.
+SCALES = {
+    'small':  {'grid_n': 6,  'n_defects': 50,   'sample_interval_m': 5.0, 'texture_px': 1000, 'mesh_n': 100},
+    'medium': {'grid_n': 15, 'n_defects': 500,  'sample_interval_m': 2.0, 'texture_px': 3000, 'mesh_n': 300},
+    'large':  {'grid_n': 30, 'n_defects': 5000, 'sample_interval_m': 1.0, 'texture_px': 5000, 'mesh_n': 700},
+}
+
+
+def make_road_network(grid_n, block_m=60.0, road_width_m=8.0, jitter_m=2.0, origin_xy=SITE_ORIGIN_XY, seed=0):
+    """
+    Builds a jittered street grid.
+
+    Returns:
+        dict: 'centerlines' (open LineStrings between intersections), 'curb_rings' (closed
+              LineStrings around the blocks), 'road_polygon' and 'free_space_polygon'.
+    """
+    rng = np.random.default_rng(seed)
+    ox, oy = origin_xy
+    nodes = np.empty((grid_n, grid_n, 2))
+    for i in range(grid_n):
+        for j in range(grid_n):
+            nodes[i, j] = (ox + i * block_m, oy + j * block_m)
+    nodes += rng.normal(0.0, jitter_m, size=nodes.shape)
+
+    centerlines = []
+    for i in range(grid_n):
+        for j in range(grid_n):
+            if i + 1 < grid_n: centerlines.append(_bent_segment(nodes[i, j], nodes[i + 1, j], rng, jitter_m))
+            if j + 1 < grid_n: centerlines.append(_bent_segment(nodes[i, j], nodes[i, j + 1], rng, jitter_m))
+
+    road_polygon = unary_union([line.buffer(road_width_m / 2.0, cap_style=2) for line in centerlines])
+    free_space_polygon = unary_union([line.buffer(road_width_m / 2.0 - 1.0, cap_style=2) for line in centerlines])
+    curb_rings = []
+    for interior in getattr(road_polygon, 'interiors', []): # Holes of the road surface are the blocks
+        curb_rings.append(LineString(interior.coords))
+    return {'centerlines': centerlines, 'curb_rings': curb_rings,
+            'road_polygon': road_polygon, 'free_space_polygon': free_space_polygon}
+
+def _bent_segment(start, end, rng, jitter_m, n_mid=3):
+    """Straight segment with a few slightly displaced intermediate vertices (like digitized streets)."""
+    t = np.linspace(0.0, 1.0, n_mid + 2)[:, None]
+    coords = start + t * (end - start)
+    coords[1:-1] += rng.normal(0.0, jitter_m / 4.0, size=(n_mid, 2))
+    return LineString(coords)
+
+
+def write_gml(geometries, path, crs=TARGET_CRS):
+    """Writes geometries as a GML feature collection, the same way Step 2a saves the clipped WFS layers."""
+    import geopandas as gpd
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    gdf = gpd.GeoDataFrame(geometry=list(geometries), crs=crs)
+    gdf.to_file(path, driver='GML', GML_FEATURE_COLLECTION=True, GML_ID='auto')
+    return str(path)
+
+def write_hull_gpkg(polygon, path, crs=TARGET_CRS):
+    import geopandas as gpd
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    gpd.GeoDataFrame([{'id': 1, 'geometry': polygon}], crs=crs).to_file(path, driver='GPKG')
+    return str(path)
+
+
+def make_defect_csv(path, centerlines, n_defects, seed=0, target_crs=TARGET_CRS, source_crs=SOURCE_CRS):
+    """
+    Writes a defect CSV with 'latitude', 'longitude' (source CRS), 'geometry_wkt' and
+    'optimal_epsg_code' (defect polygon in the target CRS). Defects lie on random streets.
+    """
+    import pandas as pd
+    from transformer_cache import get_transformer
+    rng = np.random.default_rng(seed)
+    to_source = get_transformer(target_crs, source_crs, always_xy=True)
+    epsg_code = int(str(target_crs).split(':')[-1])
+    rows = []
+    for _ in range(n_defects):
+        line = centerlines[rng.integers(len(centerlines))]
+        center = line.interpolate(rng.uniform(0.0, line.length))
+        length, width, angle = rng.uniform(0.3, 2.0), rng.uniform(0.2, 1.0), rng.uniform(0.0, math.pi)
+        dx, dy = math.cos(angle), math.sin(angle)
+        corners = [(center.x + sx * length / 2 * dx - sy * width / 2 * dy,
+                    center.y + sx * length / 2 * dy + sy * width / 2 * dx)
+                   for sx, sy in ((-1, -1), (1, -1), (1, 1), (-1, 1))]
+        lon, lat = to_source.transform(center.x, center.y)
+        rows.append({'latitude': lat, 'longitude': lon, 'geometry_wkt': Polygon(corners).wkt,
+                     'optimal_epsg_code': epsg_code})
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame(rows).to_csv(path, index=False)
+    return str(path)
+
+
+def make_sampled_points(centerlines, sample_interval_m):
+    """Points every sample_interval_m along the centre lines as an (N, 2) array (the shape of Step 3's output)."""
+    coords = []
+    for line in centerlines:
+        coords.extend((p.x, p.y) for p in (line.interpolate(d) for d in np.arange(0.0, line.length, sample_interval_m)))
+        coords.append(line.coords[-1])
+    return np.unique(np.array(coords, dtype=float), axis=0)
+
+
+def make_texture(path, bounds, size_px, seed=0):
+    """
+    Writes an RGB PNG covering bounds (minx, miny, maxx, maxy) and returns its georeferencing.
+
+    Returns:
+        tuple: (path_str, affine.Affine, pyproj.CRS), like Step 5.
+    """
+    import pyproj
+    from affine import Affine
+    from PIL import Image
+    rng = np.random.default_rng(seed)
+    minx, miny, maxx, maxy = bounds
+    pixel_size = max(maxx - minx, maxy - miny) / float(size_px)
+    width = max(1, int(math.ceil((maxx - minx) / pixel_size)))
+    height = max(1, int(math.ceil((maxy - miny) / pixel_size)))
+    gray = rng.integers(90, 140, size=(height, width, 1), dtype=np.uint8) # Asphalt-like noise
+    image = np.repeat(gray, 3, axis=2)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.fromarray(image, mode='RGB').save(path)
+    transform = Affine(pixel_size, 0.0, minx, 0.0, -pixel_size, maxy)
+    return str(path), transform, pyproj.CRS.from_user_input(TARGET_CRS)
+
+
+def make_obj_mesh(path, bounds, mesh_n, seed=0):
+    """Writes a triangulated mesh_n x mesh_n height field over bounds in world coordinates (OBJ)."""
+    rng = np.random.default_rng(seed)
+    minx, miny, maxx, maxy = bounds
+    xs, ys = np.linspace(minx, maxx, mesh_n), np.linspace(miny, maxy, mesh_n)
+    zs = rng.normal(0.0, 0.05, size=(mesh_n, mesh_n)) - 0.5
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        f.write("# Synthetic benchmark mesh\nmtllib model.mtl\no synthetic_road\n")
+        for j in range(mesh_n):
+            for i in range(mesh_n):
+                f.write(f"v {xs[i]:.6f} {ys[j]:.6f} {zs[j, i]:.6f}\n")
+        f.write("usemtl RoadSurface\n")
+        for j in range(mesh_n - 1):
+            for i in range(mesh_n - 1):
+                a = j * mesh_n + i + 1 # OBJ indices are 1-based
+                b, c, d = a + 1, a + mesh_n, a + mesh_n + 1
+                f.write(f"f {a} {b} {d}\nf {a} {d} {c}\n")
+    return str(path)
+
+
+def make_site(workdir, scale='small', seed=0):
+    """
+    Generates every benchmark input for one scale into workdir.
+
+    Returns:
+        dict: paths and in-memory inputs, see the keys below.
+    """
+    params = SCALES[scale]
+    workdir = Path(workdir)
+    workdir.mkdir(parents=True, exist_ok=True)
+    network = make_road_network(params['grid_n'], seed=seed)
+    road_polygon = network['road_polygon']
+    bounds = road_polygon.bounds
+    hull_polygon = box(*bounds).buffer(15.0)
+    texture_path, texture_transform, texture_crs = make_texture(workdir / 'texture.png', hull_polygon.bounds,
+                                                                params['texture_px'], seed=seed)
+    return {
+        'params': params,
+        'workdir': str(workdir),
+        'defect_csv': make_defect_csv(workdir / 'defects.csv', network['centerlines'], params['n_defects'], seed=seed),
+        'hull_polygon': hull_polygon,
+        'hull_gpkg': write_hull_gpkg(hull_polygon, workdir / 'hull.gpkg'),
+        'road_lines_gml': write_gml(network['centerlines'] + network['curb_rings'], workdir / 'road_lines.gml'),
+        'road_polygon_gml': write_gml([road_polygon], workdir / 'road_polygons.gml'),
+        'free_space_gml': write_gml([network['free_space_polygon']], workdir / 'free_space.gml'),
+        'centerlines': network['centerlines'],
+        'sampled_points': make_sampled_points(network['centerlines'], params['sample_interval_m']),
+        'texture_path': texture_path,
+        'texture_transform': texture_transform,
+        'texture_crs': texture_crs,
+        'obj_path': make_obj_mesh(workdir / 'mesh.obj', bounds, params['mesh_n'], seed=seed),
+        'local_frame_origin_xy': (bounds[0], bounds[1]),
+    }
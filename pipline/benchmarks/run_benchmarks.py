@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+# benchmarks/run_benchmarks.py
+"""
+Runs the step benchmarks on synthetic inputs and compares them with the stored baselines.
+See benchmarks/__init__.py for usage.
+"""
+import argparse
+import contextlib
+import io
+import json
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import traceback
+from pathlib import Path
+
+from benchmarks.bench_steps import BENCHMARKS
+from benchmarks.generators import SCALES, make_site
+
+BASELINES_PATH = Path(__file__).resolve().parent / "baselines.json"
+DEFAULT_REPEAT = 3
+REGRESSION_THRESHOLD = 0.25 # Fail if the median time exceeds the baseline by more than 25 %
+
+STATUS_OK = "ok"
+STATUS_NO_BASELINE = "NO BASELINE" # No baseline for this benchmark/scale: fails unless --update-baselines
+STATUS_REGRESSION = "REGRESSION"
+STATUS_FAILED = "FAILED"        # The step returned a failure or raised
+
+
+class StepFailedError(RuntimeError):
+    """The benchmarked step returned a failure value."""
+
+
+def run_benchmark(name, site, out_dir, repeat=DEFAULT_REPEAT, warmup=0, verbose=False):
+    """
+    Times one benchmark. The step's console output is captured unless verbose is set.
+
+    Returns:
+        dict: 'name', 'ok', 'timings_s', 'median_s', 'min_s' and 'error' (None on success).
+    """
+    result = {'name': name, 'ok': False, 'timings_s': [], 'median_s': None, 'min_s': None, 'error': None}
+    out_dir = Path(out_dir) / name
+    out_dir.mkdir(parents=True, exist_ok=True)
+    captured = io.StringIO()
+    redirect = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(captured)
+    try:
+        with redirect:
+            run, before_each = BENCHMARKS[name](site, out_dir)
+            for iteration in range(warmup + repeat):
+                if before_each is not None: before_each()
+                start = time.perf_counter()
+                succeeded = run()
+                elapsed = time.perf_counter() - start
+                if not succeeded:
+                    raise StepFailedError("step reported failure")
+                if iteration >= warmup:
+                    result['timings_s'].append(elapsed)
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+        if not verbose:
+            tail = captured.getvalue().strip().splitlines()[-15:]
+            print("\n".join(f"    | {line}" for line in tail))
+        if not isinstance(e, StepFailedError): traceback.print_exc()
+        return result
+    result['ok'] = True
+    result['median_s'] = statistics.median(result['timings_s'])
+    result['min_s'] = min(result['timings_s'])
+    return result
+
+
+def load_baselines(path=BASELINES_PATH):
+    if not Path(path).is_file():
+        print(f"  Warning: Baselines file {path} not found; record it with --update-baselines.")
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def update_baselines(results, scale, path=BASELINES_PATH):
+    """Stores the successful results as the baselines of their scale (other entries are kept)."""
+    baselines = load_baselines(path) if Path(path).is_file() else {}
+    scale_baselines = baselines.setdefault(scale, {})
+    for result in results:
+        if not result['ok']: continue
+        scale_baselines[result['name']] = {
+            'median_s': round(result['median_s'], 6), 'min_s': round(result['min_s'], 6),
+            'repeat': len(result['timings_s']), 'recorded': time.strftime('%Y-%m-%d'),
+            'python': platform.python_version(), 'machine': platform.machine(), 'processor': platform.processor(),
+        }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+    print(f"Baselines for scale '{scale}' saved to: {path}")
+
+
+def compare_with_baselines(results, baselines, scale, threshold=REGRESSION_THRESHOLD):
+    """
+    Prints the result table and sets result['status']. Returns the names of the benchmarks that
+    failed, regressed or have no baseline (so the gate cannot pass without being checked).
+    """
+    scale_baselines = baselines.get(scale, {})
+    failed = []
+    print(f"\n{'Benchmark':<18} {'median s':>10} {'min s':>10} {'baseline s':>11} {'change':>8}  Result")
+    for result in results:
+        baseline = scale_baselines.get(result['name'])
+        change = None
+        if not result['ok']:
+            result['status'] = STATUS_FAILED
+        elif baseline is None:
+            result['status'] = STATUS_NO_BASELINE
+        else:
+            change = result['median_s'] / baseline['median_s'] - 1.0 if baseline['median_s'] > 0 else 0.0
+            result['status'] = STATUS_REGRESSION if change > threshold else STATUS_OK
+        if result['status'] in (STATUS_FAILED, STATUS_REGRESSION, STATUS_NO_BASELINE):
+            failed.append(result['name'])
+        fmt = lambda v: f"{v:.3f}" if v is not None else "-"
+        print(f"{result['name']:<18} {fmt(result['median_s']):>10} {fmt(result['min_s']):>10} "
+              f"{fmt(baseline['median_s'] if baseline else None):>11} "
+              f"{(f'{change:+.0%}' if change is not None else '-'):>8}  {result['status']}"
+              + (f" ({result['error']})" if result['error'] else ""))
+    machines = {(b.get('machine'), b.get('processor')) for b in scale_baselines.values()}
+    if machines and (platform.machine(), platform.processor()) not in machines:
+        print("  Note: The baselines were recorded on a different machine; compare with care.")
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmark the pipeline steps on synthetic inputs.")
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small', help="Input size (default: small).")
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help="Run only these benchmarks.")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="Timed runs per benchmark; the median is compared.")
+    parser.add_argument('--warmup', type=int, default=0, help="Untimed runs before the timed ones.")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help="Allowed slowdown against the baseline as a fraction (default: 0.25).")
+    parser.add_argument('--baselines', default=str(BASELINES_PATH), help="Baselines JSON file.")
+    parser.add_argument('--update-baselines', action='store_true', help="Store this run's results as the baselines.")
+    parser.add_argument('--output', default=None, help="Also write the results to this JSON file.")
+    parser.add_argument('--workdir', default=None, help="Directory for the generated inputs/outputs (default: temporary).")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic input generators.")
+    parser.add_argument('--verbose', action='store_true', help="Show the output of the steps.")
+    args = parser.parse_args(argv)
+
+    from helpers import use_headless_plotting
+    use_headless_plotting()
+    workdir = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix="pipeline_bench_"))
+    names = args.only or list(BENCHMARKS)
+    try:
+        print(f"--- Benchmarks: scale '{args.scale}' {SCALES[args.scale]}, {args.repeat} run(s) each ---")
+        start = time.perf_counter()
+        site = make_site(workdir / 'inputs', args.scale, seed=args.seed)
+        print(f"Synthetic inputs generated in {time.perf_counter() - start:.1f}s: {workdir / 'inputs'}")
+        results = []
+        for name in names:
+            print(f"  Running {name}...")
+            results.append(run_benchmark(name, site, workdir / 'outputs', repeat=max(1, args.repeat),
+                                         warmup=max(0, args.warmup), verbose=args.verbose))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    failed = compare_with_baselines(results, load_baselines(args.baselines), args.scale, args.threshold)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'scale': args.scale, 'threshold': args.threshold, 'results': results}, f, indent=2)
+    if args.update_baselines:
+        update_baselines(results, args.scale, args.baselines)
+        failed = [r['name'] for r in results if not r['ok']]
+    if failed:
+        print(f"Failed, regressed or without baseline: {', '.join(failed)}")
+        if not args.update_baselines and any(r['status'] == STATUS_NO_BASELINE for r in results):
+            print(f"  Record missing baselines for scale '{args.scale}' with --update-baselines.")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# benchmarks/standin_server.py
+"""
+Local stand-in for the WFS and WMS servers, so the HTTP layer (pooling, compression, paging,
+retries and hedging, see http_session.py) can be measured and tested without the network.
+
+StandinServer serves, on 127.0.0.1 and a free port:
+  - WFS 2.0 GetFeature (KVP, path /wfs): the polygons intersecting BBOX (all of them for a
+    FILTER request) as a GML 3.2 FeatureCollection of typename features with an adv:position,
+    paged with COUNT/STARTINDEX and reporting numberMatched/numberReturned,
+  - WMS GetMap (path /wms): the same PNG for every request.
+Responses are gzip-compressed if the client accepts it. Faults are injected by request number:
+every fail_every-th request returns fail_status (Retry-After: retry_after), every slow_every-th is
+delayed by slow_s. It backs the wfs_download benchmark and tests/test_http_session.py.
+"""
+import gzip
+import itertools
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from shapely.geometry import box
+
+WFS_NAMESPACE = 'http://www.opengis.net/wfs/2.0'
+GML_NAMESPACE = 'http://www.opengis.net/gml/3.2'
+ADV_NAMESPACE = 'http://www.adv-online.de/namespaces/adv/gid/7.1'
+
+
+def _gml_polygon(polygon, srs_name):
+    def ring(coords): return " ".join(f"{x:.2f} {y:.2f}" for x, y in coords)
+    interiors = "".join(f"<gml:interior><gml:LinearRing><gml:posList>{ring(r.coords)}</gml:posList></gml:LinearRing></gml:interior>"
+                        for r in polygon.interiors)
+    return (f'<gml:Polygon srsName="{srs_name}"><gml:exterior><gml:LinearRing><gml:posList>{ring(polygon.exterior.coords)}'
+            f'</gml:posList></gml:LinearRing></gml:exterior>{interiors}</gml:Polygon>')
+
+
+class StandinServer:
+    """Threaded local WFS/WMS server. Use as a context manager or call close()."""
+    def __init__(self, polygons, image_png=b'', fail_every=None, slow_every=None, slow_s=0.0,
+                 fail_status=503, retry_after='0'):
+        self.polygons = list(polygons)
+        self.image_png = image_png
+        self.fail_every, self.slow_every, self.slow_s = fail_every, slow_every, slow_s
+        self.fail_status, self.retry_after = fail_status, retry_after
+        self.stats = {'requests': 0, 'failed': 0, 'slowed': 0, 'bytes': 0}
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="standin-server", daemon=True)
+        self._thread.start()
+
+    def url(self, path):
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}/{path.lstrip('/')}"
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self.stats[key] += value
+
+    def getfeature_body(self, params):
+        """GML FeatureCollection for GetFeature KVP params (upper-case keys, single values)."""
+        typename = params.get('TYPENAMES', 'adv:AX_Strassenverkehr')
+        srs_name = params.get('SRSNAME', 'EPSG:25832')
+        if 'BBOX' in params:
+            area = box(*map(float, params['BBOX'].split(',')[:4]))
+            matched = [(i, p) for i, p in enumerate(self.polygons) if p.intersects(area)]
+        else:
+            matched = list(enumerate(self.polygons))
+        start = int(params.get('STARTINDEX', 0))
+        page = matched[start:start + int(params['COUNT'])] if 'COUNT' in params else matched[start:]
+        members = "".join(f'<wfs:member><{typename} gml:id="f{i}"><adv:position>{_gml_polygon(p, srs_name)}</adv:position>'
+                          f'</{typename}></wfs:member>' for i, p in page)
+        return (f'<?xml version="1.0" encoding="UTF-8"?><wfs:FeatureCollection xmlns:wfs="{WFS_NAMESPACE}" '
+                f'xmlns:gml="{GML_NAMESPACE}" xmlns:adv="{ADV_NAMESPACE}" numberMatched="{len(matched)}" '
+                f'numberReturned="{len(page)}">{members}</wfs:FeatureCollection>').encode('utf-8')
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1' # Keep-alive, so the client's connection pooling is exercised
+
+            def log_message(self, format, *args): # Quiet
+                pass
+
+            def do_GET(self):
+                number = next(server._counter)
+                server._count('requests')
+                if server.slow_every and number % server.slow_every == 0:
+                    server._count('slowed')
+                    time.sleep(server.slow_s)
+                if server.fail_every and number % server.fail_every == 0:
+                    server._count('failed')
+                    headers = {'Retry-After': server.retry_after} if server.retry_after is not None else {}
+                    return self._send(server.fail_status, b'Service temporarily unavailable', 'text/plain', headers)
+                split = urlsplit(self.path)
+                params = {key.upper(): values[0] for key, values in parse_qs(split.query).items()}
+                if split.path.rstrip('/') == '/wfs' and params.get('REQUEST') == 'GetFeature':
+                    return self._send(200, server.getfeature_body(params), 'text/xml; subtype=gml/3.2.1')
+                if split.path.rstrip('/') == '/wms' and params.get('REQUEST') == 'GetMap':
+                    return self._send(200, server.image_png, 'image/png')
+                self._send(404, b'Unknown request', 'text/plain')
+
+            def _send(self, status, body, content_type, headers=None):
+                encoding = None
+                if 'gzip' in self.headers.get('Accept-Encoding', '') and content_type != 'image/png':
+                    body, encoding = gzip.compress(body, 5), 'gzip'
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                if encoding: self.send_header('Content-Encoding', encoding)
+                for key, value in (headers or {}).items(): self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+                server._count('bytes', len(body))
+
+        return Handler
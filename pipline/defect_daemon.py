@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+# defect_daemon.py
+"""
+Resident worker that ingests new defects for one site incrementally.
+
+On start the pipeline runs once (or resumes, see --resume) and the worker keeps the run
+context warm: hull polygon, clipped WFS layers, texture and its georeferencing, the
+transformed mesh and its local frame, plus the imported step modules and pyproj transformers.
+It then polls an inbox directory for new defect CSVs (same columns as the site CSV).
+
+Defects inside the current hull only touch the outputs that depend on them:
+  - Step 5b draws just the new defect polygons onto the (already marked) texture,
+  - Step 7b rewrites the waypoints YAML from all defects,
+  - Step 8 re-copies the Gazebo assets (the texture changed).
+If a defect lies outside the hull, the hull would grow, so the whole pipeline runs again on
+all defects. Processed inbox files are moved to inbox/processed (or inbox/failed).
+
+Usage:
+    python defect_daemon.py --csv site_defects.csv --output-dir output_site --inbox defect_inbox
+"""
+import argparse
+import shutil
+import time
+import traceback
+from pathlib import Path
+
+import main_orchestrator
+
+PROCESSED_SUBDIR = "processed"
+FAILED_SUBDIR = "failed"
+INCOMING_DEFECTS_CSV_FILENAME = "_incoming_defects.csv"
+INBOX_FILE_MIN_AGE_S = 1.0 # Files modified more recently may still be being written
+
+
+class DefectDaemon:
+    """Keeps one site's pipeline state in memory and applies new defect batches to it."""
+    def __init__(self, csv_file, output_dir_base=None, inbox_dir=None, config_overrides=None):
+        self.config_overrides = dict(config_overrides or {})
+        self.cfg = main_orchestrator.load_config(self.config_overrides)
+        self.output_dir = Path(output_dir_base or self.cfg.OUTPUT_DIR_BASE)
+        self.inbox_dir = Path(inbox_dir or self.cfg.DAEMON_INBOX_DIR)
+        self.source_csv = Path(csv_file or self.cfg.CSV_FILE)
+        # The pipeline runs on a copy of the site CSV that accumulates the ingested defects
+        self.defects_csv = self.output_dir / self.cfg.DAEMON_DEFECTS_CSV_FILENAME
+        self.ctx = None
+        self.hull_polygon = None
+
+    # --- Full runs ---
+    def start(self, resume=False):
+        """Runs (or resumes) the full pipeline once and loads the warm state."""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        for subdir in ('', PROCESSED_SUBDIR, FAILED_SUBDIR):
+            (self.inbox_dir / subdir).mkdir(parents=True, exist_ok=True)
+        if not (resume and self.defects_csv.is_file()):
+            shutil.copyfile(self.source_csv, self.defects_csv)
+        from http_session import get_session
+        get_session()
+        self.full_run(resume=resume)
+
+    def full_run(self, resume=False):
+        print(f"\n[daemon] Full pipeline run for {self.defects_csv}")
+        status, self.ctx = main_orchestrator.run_pipeline(csv_file=str(self.defects_csv), output_dir_base=str(self.output_dir),
+                                                          config_overrides=self.config_overrides, resume=resume)
+        self.hull_polygon = self._load_hull_polygon()
+        if not self.incremental_ready():
+            print("[daemon] Warning: The run did not produce all outputs needed for incremental updates; "
+                  "new defects will trigger full runs.")
+        return status
+
+    def _load_hull_polygon(self):
+        hull_gpkg_path = self.ctx.get('hull_gpkg_path')
+        if not hull_gpkg_path: return None
+        try:
+            import geopandas as gpd
+            import shapely
+            from shapely.ops import unary_union
+            hull_gdf = gpd.read_file(hull_gpkg_path)
+            if hull_gdf.empty: return None
+            from transformer_cache import reproject_gdf
+            if hull_gdf.crs is not None:
+                hull_gdf = reproject_gdf(hull_gdf, self.cfg.TARGET_CRS)
+            hull_polygon = unary_union(list(hull_gdf.geometry)) # One feature per defect cluster if clustered
+            hull_polygon = hull_polygon if hull_polygon.is_valid else hull_polygon.buffer(0)
+            shapely.prepare(hull_polygon) # Speeds up the containment tests of every batch
+            return hull_polygon
+        except Exception as e:
+            print(f"[daemon] Warning: Could not load hull {hull_gpkg_path}: {e}")
+            return None
+
+    def incremental_ready(self):
+        ctx = self.ctx or {}
+        return bool(self.hull_polygon is not None and ctx.get('final_texture_path') and ctx.get('cropped_texture_transform')
+                    and ctx.get('cropped_texture_crs_obj') and ctx.get('transformed_obj_path')
+                    and ctx.get('obj_local_frame_origin_world_xy') is not None)
+
+    # --- Incremental updates ---
+    def defects_outside_hull(self, new_df):
+        """
+        Returns the number of defects (polygon, or point if it has none) not covered by the current
+        hull. Defects without a usable polygon or point count as outside, so they cause a full run.
+        """
+        import numpy as np
+        import shapely
+        from defect_store import DefectStore
+        store = DefectStore(new_df, source="inbox batch")
+        geometries = np.full(len(store), None, dtype=object)
+        if store.has_polygons:
+            geometries[:] = store.geometries_in(self.cfg.TARGET_CRS)
+        missing = shapely.is_missing(geometries)
+        if missing.any() and store.has_points:
+            coords, rows = store.projected_points(self.cfg.SOURCE_CRS, self.cfg.TARGET_CRS)
+            use_point = missing[rows]
+            geometries[rows[use_point]] = shapely.points(coords[use_point])
+        return int(np.count_nonzero(~shapely.contains(self.hull_polygon, geometries)))
+
+    def apply_defects(self, new_df):
+        """Adds a batch of defects. Returns 'incremental' or 'full' (the kind of update done)."""
+        import pandas as pd
+        all_df = pd.read_csv(self.defects_csv)
+        missing = set(all_df.columns) - set(new_df.columns)
+        if missing:
+            raise ValueError(f"New defects lack columns: {sorted(missing)}")
+        outside = self.defects_outside_hull(new_df) if self.incremental_ready() else None
+        pd.concat([all_df, new_df[all_df.columns]], ignore_index=True).to_csv(self.defects_csv, index=False)
+
+        if outside is None or outside > 0:
+            if outside: print(f"[daemon] {outside} defect(s) outside the hull; the hull grows.")
+            self.full_run()
+            return 'full'
+
+        ctx, cfg = self.ctx, self.cfg
+        if cfg.MARK_DEFECTS_ON_TEXTURE:
+            from step5b_mark_defects_on_texture import mark_defects_on_texture
+            incoming_csv = self.output_dir / INCOMING_DEFECTS_CSV_FILENAME
+            new_df[all_df.columns].to_csv(incoming_csv, index=False)
+            if not mark_defects_on_texture(base_texture_path_str=ctx['final_texture_path'],
+                                           texture_affine_transform=ctx['cropped_texture_transform'],
+                                           texture_crs_pyproj_obj=ctx['cropped_texture_crs_obj'],
+                                           csv_path_str=str(incoming_csv)):
+                print("[daemon] Warning: Marking the new defects on the texture failed.")
+        main_orchestrator.run_step7b_waypoints(ctx)
+        main_orchestrator.run_step8_gazebo_world(ctx)
+        return 'incremental'
+
+    # --- Inbox ---
+    def pending_inbox_files(self):
+        now = time.time()
+        files = [p for p in self.inbox_dir.glob('*.csv') if p.is_file() and now - p.stat().st_mtime >= INBOX_FILE_MIN_AGE_S]
+        return sorted(files, key=lambda p: p.stat().st_mtime)
+
+    def process_file(self, path):
+        import pandas as pd
+        start = time.time()
+        print(f"\n[daemon] Ingesting {path.name}")
+        try:
+            new_df = pd.read_csv(path)
+            if new_df.empty:
+                kind = 'empty'
+            else:
+                kind = self.apply_defects(new_df)
+            target_subdir = PROCESSED_SUBDIR
+            print(f"[daemon] {path.name}: {len(new_df)} defect(s), {kind} update in {time.time() - start:.1f}s")
+        except Exception as e:
+            print(f"[daemon] ERROR processing {path.name}: {e}")
+            traceback.print_exc()
+            target_subdir = FAILED_SUBDIR
+        target = self.inbox_dir / target_subdir / f"{time.strftime('%Y%m%d-%H%M%S')}_{path.name}"
+        shutil.move(str(path), str(target))
+
+    def poll_once(self):
+        files = self.pending_inbox_files()
+        for path in files:
+            self.process_file(path)
+        return len(files)
+
+    def run_forever(self, poll_interval_s=None):
+        poll_interval_s = poll_interval_s or self.cfg.DAEMON_POLL_INTERVAL_S
+        print(f"[daemon] Watching {self.inbox_dir.resolve()} every {poll_interval_s:.1f}s (Ctrl+C to stop)")
+        try:
+            while True:
+                if not self.poll_once():
+                    time.sleep(poll_interval_s)
+        except KeyboardInterrupt:
+            print("[daemon] Stopped.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest new defects for one site incrementally.")
+    parser.add_argument('--csv', default=None, help="Initial defect CSV of the site (default: CSV_FILE).")
+    parser.add_argument('--output-dir', default=None, help="Output directory (default: OUTPUT_DIR_BASE).")
+    parser.add_argument('--inbox', default=None, help="Directory watched for new defect CSVs (default: DAEMON_INBOX_DIR).")
+    parser.add_argument('--interval', type=float, default=None, help="Polling interval in seconds (default: DAEMON_POLL_INTERVAL_S).")
+    parser.add_argument('--resume', action='store_true', help="Resume the previous run instead of a full run on start.")
+    parser.add_argument('--once', action='store_true', help="Process the files currently in the inbox and exit.")
+    args = parser.parse_args()
+    daemon = DefectDaemon(args.csv, output_dir_base=args.output_dir, inbox_dir=args.inbox)
+    daemon.start(resume=args.resume)
+    if args.once:
+        daemon.poll_once()
+    else:
+        daemon.run_forever(args.interval)
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
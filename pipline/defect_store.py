@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+# defect_store.py
+"""
+Defect data of a run, parsed once and shared by Steps 1, 5b and 7b.
+
+Input formats (by file suffix):
+  - CSV (default): 'latitude'/'longitude' in SOURCE_CRS, optionally 'geometry_wkt' (defect
+    polygon) and 'optimal_epsg_code' (EPSG code of that polygon, per row),
+  - Parquet (.parquet/.pq): the same columns,
+  - GeoParquet (.parquet/.geoparquet with geo metadata): a geometry column with the defect
+    polygons; its CRS replaces 'optimal_epsg_code'. 'latitude'/'longitude' are still required.
+
+load_defects() keeps the parsed store per file (path, size and modification time), so the
+steps of a run and consecutive runs in one process don't parse the file again.
+"""
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from transformer_cache import get_transformer
+
+POINT_COLUMNS = ('longitude', 'latitude')
+POLYGON_COLUMNS = ('geometry_wkt', 'optimal_epsg_code')
+PARQUET_SUFFIXES = ('.parquet', '.pq', '.geoparquet')
+_STORE_CACHE_SIZE = 4
+
+_STORES = OrderedDict()
+_STORES_LOCK = threading.Lock()
+
+
+class DefectStore:
+    """
+    Columnar view of the defects: validated columns, coordinate arrays and parsed geometries.
+    Derived arrays are computed on first use and kept; the store is safe to share between threads.
+    """
+    def __init__(self, df, geometries=None, geometry_epsg=None, source=None):
+        """
+        df: defect table. geometries: optional array of shapely geometries (one per row, None where
+        missing); without it they are parsed from 'geometry_wkt'. geometry_epsg: EPSG code of all
+        geometries, used instead of the per-row 'optimal_epsg_code'.
+        """
+        self.df = df.reset_index(drop=True)
+        self.source = source
+        self.has_points = set(POINT_COLUMNS).issubset(self.df.columns)
+        if geometries is not None:
+            self._geometries = np.asarray(geometries, dtype=object)
+            self._epsg_codes = np.full(len(self.df), geometry_epsg if geometry_epsg is not None else -1, dtype=np.int64)
+            if geometry_epsg is None and 'optimal_epsg_code' in self.df.columns:
+                self._epsg_codes = self._epsg_column()
+            self.has_polygons = geometry_epsg is not None or 'optimal_epsg_code' in self.df.columns
+        else:
+            self._geometries = None
+            self._epsg_codes = None
+            self.has_polygons = set(POLYGON_COLUMNS).issubset(self.df.columns)
+        self._lock = threading.Lock()
+        self._lonlat = None
+        self._projected = {}
+        self._reprojected = {}
+
+    def __len__(self):
+        return len(self.df)
+
+    def __repr__(self):
+        return f"DefectStore({len(self)} defects, points={self.has_points}, polygons={self.has_polygons}, source={self.source!r})"
+
+    def require(self, points=False, polygons=False):
+        """Raises ValueError if the columns needed for points and/or polygons are missing."""
+        if points and not self.has_points:
+            raise ValueError(f"Defect data must contain columns: {set(POINT_COLUMNS) - set(self.df.columns)}")
+        if polygons and not self.has_polygons:
+            raise ValueError(f"Defect data must contain columns: {set(POLYGON_COLUMNS) - set(self.df.columns)}")
+
+    def _epsg_column(self):
+        return pd.to_numeric(self.df['optimal_epsg_code'], errors='coerce').fillna(-1).to_numpy(dtype=np.int64)
+
+    # --- Points ---
+    def lonlat(self):
+        """
+        Returns:
+            tuple: (lon, lat, valid) arrays; valid is False where a coordinate is missing or not numeric.
+        """
+        self.require(points=True)
+        with self._lock:
+            if self._lonlat is None:
+                lon = pd.to_numeric(self.df['longitude'], errors='coerce').to_numpy(dtype=float)
+                lat = pd.to_numeric(self.df['latitude'], errors='coerce').to_numpy(dtype=float)
+                self._lonlat = (lon, lat, np.isfinite(lon) & np.isfinite(lat))
+            return self._lonlat
+
+    def projected_points(self, source_crs, target_crs):
+        """
+        Projects the valid points with one array call.
+
+        Returns:
+            tuple: (Nx2 array of projected coordinates, array of their row indices). Rows whose
+                   coordinates are invalid or do not project to finite values are left out.
+        """
+        key = (str(source_crs), str(target_crs))
+        lon, lat, valid = self.lonlat()
+        with self._lock:
+            if key not in self._projected:
+                rows = np.flatnonzero(valid)
+                x, y = get_transformer(source_crs, target_crs, always_xy=True).transform(lon[rows], lat[rows])
+                coords = np.column_stack([np.asarray(x, dtype=float), np.asarray(y, dtype=float)])
+                projected = np.isfinite(coords).all(axis=1) # pyproj returns inf for points it cannot transform
+                self._projected[key] = (coords[projected], rows[projected])
+            return self._projected[key]
+
+    # --- Polygons ---
+    def geometries(self):
+        """
+        Returns:
+            tuple: (array of shapely geometries in their own CRS, None where missing/unparsable,
+                    array of their EPSG codes, -1 where unknown).
+        """
+        self.require(polygons=True)
+        with self._lock:
+            if self._geometries is None:
+                wkt_strings = np.array([v if isinstance(v, str) else None for v in self.df['geometry_wkt']], dtype=object)
+                self._geometries = shapely.from_wkt(wkt_strings, on_invalid='ignore')
+                self._epsg_codes = self._epsg_column()
+            return self._geometries, self._epsg_codes
+
+    def geometries_in(self, target_crs):
+        """
+        The defect geometries reprojected to target_crs, one array transform per source EPSG code.
+
+        Returns:
+            np.ndarray: shapely geometries per row, None where missing or not reprojectable.
+        """
+        geometries, epsg_codes = self.geometries()
+        key = str(target_crs)
+        with self._lock:
+            if key in self._reprojected:
+                return self._reprojected[key]
+        reprojected = np.full(len(geometries), None, dtype=object)
+        present = ~shapely.is_missing(geometries) & (epsg_codes > 0)
+        for epsg_code in np.unique(epsg_codes[present]):
+            rows = np.flatnonzero(present & (epsg_codes == epsg_code))
+            try:
+                transformer = get_transformer(f"EPSG:{int(epsg_code)}", target_crs, always_xy=True)
+            except Exception as e:
+                print(f"  Warning: No transformation from EPSG:{int(epsg_code)} ({len(rows)} defects skipped): {e}")
+                continue
+            reprojected[rows] = shapely.transform(geometries[rows],
+                                                  lambda xy: np.column_stack(transformer.transform(xy[:, 0], xy[:, 1])))
+        with self._lock:
+            self._reprojected[key] = reprojected
+        return reprojected
+
+
+def read_defects(path):
+    """Reads a defect file into a new DefectStore (see the module docstring for the formats)."""
+    path = Path(path)
+    if path.suffix.lower() in PARQUET_SUFFIXES:
+        return _read_parquet(path)
+    return DefectStore(pd.read_csv(path), source=str(path))
+
+def _read_parquet(path):
+    import pyarrow.parquet as pq
+    if b'geo' in (pq.read_schema(path).metadata or {}): # GeoParquet
+        import geopandas as gpd
+        gdf = gpd.read_parquet(path)
+        epsg_code = gdf.crs.to_epsg() if gdf.crs is not None else None
+        df = pd.DataFrame(gdf.drop(columns=gdf.geometry.name))
+        geometries = gdf.geometry.to_numpy(dtype=object)
+        return DefectStore(df, geometries=np.where(pd.isna(geometries), None, geometries), geometry_epsg=epsg_code, source=str(path))
+    return DefectStore(pd.read_parquet(path), source=str(path))
+
+def load_defects(path):
+    """
+    Returns the DefectStore of a defect file, parsing it only if it was not loaded before in this
+    process or changed since. Raises FileNotFoundError if the file does not exist.
+    """
+    path = Path(path).resolve()
+    stat = path.stat()
+    key = (str(path), stat.st_size, stat.st_mtime_ns)
+    with _STORES_LOCK:
+        if key in _STORES:
+            _STORES.move_to_end(key)
+            return _STORES[key]
+    store = read_defects(path) # Outside the lock; two threads may parse the same new file once each
+    with _STORES_LOCK:
+        store = _STORES.setdefault(key, store)
+        while len(_STORES) > _STORE_CACHE_SIZE:
+            _STORES.popitem(last=False)
+    return store
@@ -1,25 +1,57 @@
 # -*- coding: utf-8 -*-
-import matplotlib.pyplot as plt
-from matplotlib.lines import Line2D
-from matplotlib.patches import PathPatch
-from matplotlib.path import Path as MplPath
-from descartes import PolygonPatch
-import geopandas as gpd
-import pyproj
+import functools
+import sys
+import threading
 from shapely.geometry import Point, LineString, Polygon, MultiPoint, box
-import rasterio
-from rasterio.plot import show as rio_show
 import numpy as np
 from pathlib import Path
+# matplotlib, descartes, geopandas, pyproj and rasterio are imported on first use below:
+# every step module imports helpers, and most runs never draw a plot.
+
+# =============================================================================
+# Thread Safety for Plotting
+# =============================================================================
+# pyplot keeps global state, so plots from steps running concurrently are serialized.
+_PLOT_LOCK = threading.RLock()
+_HEADLESS_PLOTTING = False
+
+def serialized_plot(plot_func):
+    """Decorator: runs a plotting function while holding the shared pyplot lock."""
+    @functools.wraps(plot_func)
+    def wrapper(*args, **kwargs):
+        with _PLOT_LOCK:
+            return plot_func(*args, **kwargs)
+    return wrapper
+
+def use_headless_plotting():
+    """Switches pyplot to the non-interactive Agg backend so plots can be saved from worker threads."""
+    global _HEADLESS_PLOTTING
+    with _PLOT_LOCK:
+        _HEADLESS_PLOTTING = True
+        if 'matplotlib.pyplot' in sys.modules: # Otherwise applied when pyplot is first imported
+            sys.modules['matplotlib.pyplot'].switch_backend('Agg')
+
+def _pyplot():
+    """Imports pyplot on first use. Call with the plot lock held."""
+    if _HEADLESS_PLOTTING and 'matplotlib.pyplot' not in sys.modules:
+        import matplotlib
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
 
 # =============================================================================
 # Helper Plotting Function for GML Analysis
 # =============================================================================
 # helpers.py
+@serialized_plot
 def plot_analysis_step(title, step_num, total_steps, elements_to_plot,
                        output_dir, filename_prefix,
                        hull_polygon=None, hull_centroid=None,
                        show_plots=True, save_plots=True, plot_dpi=150):
+    if not show_plots and not save_plots: return
+    plt = _pyplot()
+    from matplotlib.lines import Line2D
+    import geopandas as gpd
     print(f"\nGenerating Plot {step_num}/{total_steps}: {title}")
     fig, ax = plt.subplots(figsize=(12, 10))
     ax.set_title(f"Step {step_num}/{total_steps}: {title}")
@@ -180,11 +212,15 @@ def plot_analysis_step(title, step_num, total_steps, elements_to_plot,
 # =============================================================================
 # Helper Plotting Functions for Texture Generation
 # =============================================================================
+@serialized_plot
 def plot_geometries(geoms, crs, title, output_dir, filename_base,
                     raster_bounds_tuple=None, highlight_geom=None,
                     show_plots=True, save_plots=True, plot_dpi=150):
     if not show_plots and not save_plots:
         return
+    plt = _pyplot()
+    import geopandas as gpd
+    import pyproj
     try:
         if not isinstance(geoms, list): geoms = [geoms]
         try: plot_crs = pyproj.CRS.from_user_input(crs).to_wkt()
@@ -221,9 +257,13 @@ def plot_geometries(geoms, crs, title, output_dir, filename_base,
         plt.close(fig)
     except Exception as e: print(f"Warning: Could not generate plot '{title}': {e}")
 
+@serialized_plot
 def plot_image_array(image_array, transform, crs, title, output_dir, filename_base,
                      show_plots=True, save_plots=True, plot_dpi=150):
     if not show_plots and not save_plots: return
+    plt = _pyplot()
+    import pyproj
+    from rasterio.plot import show as rio_show
     try:
         try: plot_crs_str = pyproj.CRS.from_user_input(crs).srs if isinstance(crs, (pyproj.CRS, str)) else "Unknown CRS"
         except: plot_crs_str = str(crs) if isinstance(crs, str) else "Invalid CRS"
@@ -240,16 +280,20 @@ def plot_image_array(image_array, transform, crs, title, output_dir, filename_ba
 # =============================================================================
 # Helper Plotting Function for Alpha Shape
 # =============================================================================
-def plot_alpha_shape_result(original_points, alpha_shape_polygon, actual_alpha_display_val, # << Changed param name
+@serialized_plot
+def plot_alpha_shape_result(points_xy, alpha_shape_polygon, actual_alpha_display_val, # << Changed param name
                             target_crs_str, output_dir, filename_base,
                             show_plots=True, save_plots=True, plot_dpi=150):
+    if not show_plots and not save_plots: return
+    plt = _pyplot()
+    from matplotlib.patches import PathPatch
+    from matplotlib.path import Path as MplPath
+    from descartes import PolygonPatch
     print("\nPlotting Alpha Shape...")
     fig, ax = plt.subplots(figsize=(12, 10))
 
-    if original_points:
-        x_coords = [pt.x for pt in original_points]
-        y_coords = [pt.y for pt in original_points]
-        ax.scatter(x_coords, y_coords, c='k', s=5, label=f'Input Points ({len(original_points)})', zorder=1)
+    if points_xy is not None and len(points_xy): # (N, 2) array of x, y
+        ax.scatter(points_xy[:, 0], points_xy[:, 1], c='k', s=5, label=f'Input Points ({len(points_xy)})', zorder=1)
 
     if alpha_shape_polygon and not alpha_shape_polygon.is_empty:
         label_alpha_val = str(actual_alpha_display_val)
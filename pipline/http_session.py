@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+# http_session.py
+"""
+Shared HTTP layer for the WFS and WMS requests of all steps.
+
+  - Pooled keep-alive connections: one requests.Session per thread, kept for the lifetime of
+    the process (consecutive runs in a batch worker or the daemon reuse the connections),
+  - gzip/deflate content negotiation,
+  - bounded retries with jittered exponential backoff for connection errors, timeouts, 429
+    and 5xx responses (a Retry-After header is respected),
+  - optional hedging: a GET that has not answered after the hedge_percentile latency of its
+    host is sent a second time, and the first response wins,
+  - metrics per host: requests, failures, retries, hedges, bytes and latency percentiles.
+
+configure() sets the policy for the process; run_pipeline() applies the HTTP_* constants and
+adds metrics() to the run report.
+"""
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+# Errors worth another attempt; the urllib3 ones surface when a streamed body is read from response.raw
+TRANSIENT_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                    urllib3.exceptions.ProtocolError, urllib3.exceptions.ReadTimeoutError)
+ACCEPT_ENCODING = 'gzip, deflate'
+_LATENCY_WINDOW = 200 # Latencies kept per host for the percentiles
+
+_SETTINGS = {
+    'retries': 3,               # Retries after the first attempt
+    'backoff_base_s': 1.0,      # Backoff before retry n is uniform in [0, min(backoff_max_s, backoff_base_s * 2**n)]
+    'backoff_max_s': 30.0,
+    'hedge_percentile': None,   # e.g. 95: hedge GETs slower than the host's 95th percentile; None = no hedging
+    'hedge_min_samples': 10,    # Latencies needed before a host is hedged
+    'pool_maxsize': 16,         # Keep-alive connections per host and session
+    'hedge_workers': 8,         # Threads sending hedged GETs (the original and its duplicate each take one)
+}
+_SESSIONS = threading.local()
+_METRICS_LOCK = threading.Lock()
+_METRICS = {}
+_HEDGE_POOL = None # (hedge_workers, ThreadPoolExecutor)
+_HEDGE_POOL_LOCK = threading.Lock()
+
+
+def configure(**settings):
+    """
+    Sets the retry/hedging/pool policy for the process (keys of _SETTINGS). None values are
+    ignored, except hedge_percentile=None, which turns hedging off. pool_maxsize applies to
+    sessions created afterwards, hedge_workers to the next hedged request.
+    """
+    unknown = set(settings) - set(_SETTINGS)
+    if unknown: raise ValueError(f"Unknown HTTP settings: {sorted(unknown)}")
+    _SETTINGS.update({key: value for key, value in settings.items() if value is not None or key == 'hedge_percentile'})
+
+
+def get_session():
+    """Returns this thread's pooled requests.Session (kept alive across runs in the same process)."""
+    session = getattr(_SESSIONS, 'session', None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=_SETTINGS['pool_maxsize'], max_retries=0) # Retries are done in request()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+        session.hooks['response'].append(_record_response_bytes)
+        _SESSIONS.session = session
+    return session
+
+
+def _record_response_bytes(response, *args, **kwargs):
+    """
+    requests response hook: reports transferred bytes to the metrics and the active run report (if any).
+    A streamed body has not been read yet; its reader reports it with record_received().
+    """
+    import run_report
+    received = 0
+    if not kwargs.get('stream'):
+        received = len(response.content) # Reads the body, then count what came over the wire (before decoding)
+        if hasattr(response.raw, 'tell'): received = response.raw.tell()
+    body = response.request.body if response.request is not None else None
+    sent = len(body) if isinstance(body, (bytes, str)) else 0
+    run_report.add_network_bytes(received=received, sent=sent)
+    _count(urlsplit(response.url).netloc, bytes=received)
+
+def record_received(url, received):
+    """Reports the bytes read from a streamed (stream=True) response of url once its body has been consumed."""
+    import run_report
+    run_report.add_network_bytes(received=received)
+    _count(urlsplit(url).netloc, bytes=received)
+
+
+# --- Metrics ---
+def _host_metrics(host):
+    metrics = _METRICS.get(host)
+    if metrics is None:
+        metrics = _METRICS[host] = {'requests': 0, 'failures': 0, 'retries': 0, 'hedged': 0, 'hedge_wins': 0,
+                                    'bytes': 0, 'latencies': deque(maxlen=_LATENCY_WINDOW)}
+    return metrics
+
+def _count(host, latency_s=None, **counts):
+    with _METRICS_LOCK:
+        metrics = _host_metrics(host)
+        for key, value in counts.items():
+            metrics[key] += value
+        if latency_s is not None: metrics['latencies'].append(latency_s)
+
+def _percentile(values, percentile):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(percentile / 100.0 * (len(ordered) - 1))))]
+
+def latency_percentile(host, percentile):
+    """Latency (s) percentile of the recent requests to host, or None without enough samples."""
+    with _METRICS_LOCK:
+        latencies = list(_host_metrics(host)['latencies'])
+    if len(latencies) < _SETTINGS['hedge_min_samples']: return None
+    return _percentile(latencies, percentile)
+
+def metrics():
+    """
+    Returns:
+        dict: per host 'requests', 'failures', 'retries', 'hedged', 'hedge_wins', 'bytes' and
+              'latency_p50_s'/'latency_p95_s' (None without requests).
+    """
+    with _METRICS_LOCK:
+        snapshot = {host: dict(m, latencies=list(m['latencies'])) for host, m in _METRICS.items()}
+    for m in snapshot.values():
+        latencies = m.pop('latencies')
+        m['latency_p50_s'] = round(_percentile(latencies, 50), 4) if latencies else None
+        m['latency_p95_s'] = round(_percentile(latencies, 95), 4) if latencies else None
+    return snapshot
+
+def reset_metrics():
+    with _METRICS_LOCK:
+        _METRICS.clear()
+
+
+# --- Requests ---
+def backoff_delay(attempt, retry_after_s=None):
+    """Seconds to wait before retry number attempt (0-based): full jitter, at least Retry-After."""
+    cap = min(_SETTINGS['backoff_max_s'], _SETTINGS['backoff_base_s'] * 2 ** attempt)
+    delay = random.uniform(0, cap)
+    if retry_after_s is not None: delay = max(delay, min(retry_after_s, _SETTINGS['backoff_max_s']))
+    return delay
+
+def _retry_after_s(response):
+    try: return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError): return None # Absent, or an HTTP date (not used by our servers)
+
+def wait_before_retry(attempt, url, error, retries=None):
+    """
+    Counts a failed attempt (error: a TRANSIENT_ERRORS instance) and sleeps the backoff before
+    retry number attempt (0-based). Returns False instead if the retries are used up. Also for
+    callers that retry themselves, e.g. when a streamed body breaks off.
+    """
+    host = urlsplit(url).netloc
+    retries = _SETTINGS['retries'] if retries is None else retries
+    _count(host, failures=1)
+    if attempt >= retries: return False
+    delay = backoff_delay(attempt)
+    print(f"    HTTP {host} failed ({type(error).__name__}); retry {attempt + 1}/{retries} in {delay:.1f}s")
+    _count(host, retries=1)
+    time.sleep(delay)
+    return True
+
+def _send(method, url, kwargs):
+    start = time.perf_counter()
+    response = get_session().request(method, url, **kwargs)
+    return response, time.perf_counter() - start
+
+def _send_attached(span, method, url, kwargs):
+    """_send() in a hedging thread, reporting its bytes to the caller's span (see run_report.attach)."""
+    import run_report
+    with run_report.attach(span):
+        return _send(method, url, kwargs)
+
+def _hedge_pool():
+    """
+    The process's hedging pool. It is replaced when hedge_workers changed; the old pool is not shut
+    down (another thread may be submitting to it) and its threads exit once it is garbage collected.
+    """
+    global _HEDGE_POOL
+    workers = max(2, int(_SETTINGS['hedge_workers']))
+    with _HEDGE_POOL_LOCK:
+        if _HEDGE_POOL is None or _HEDGE_POOL[0] != workers:
+            _HEDGE_POOL = (workers, ThreadPoolExecutor(max_workers=workers, thread_name_prefix="http-hedge"))
+        return _HEDGE_POOL[1]
+
+def _close_response(future):
+    if future.exception() is None: future.result()[0].close()
+
+def _send_hedged(method, url, kwargs, hedge_after_s, host):
+    """Sends the request; if it has not answered after hedge_after_s, sends a duplicate. The first response wins."""
+    import run_report
+    pool, span = _hedge_pool(), run_report.current_span()
+    primary = pool.submit(_send_attached, span, method, url, kwargs)
+    if wait([primary], timeout=hedge_after_s).done:
+        return primary.result()
+    hedge = pool.submit(_send_attached, span, method, url, kwargs)
+    _count(host, hedged=1)
+    pending, error = [primary, hedge], None
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            pending.remove(future)
+            if future.exception() is not None:
+                error = future.exception()
+                continue
+            for other in pending: other.add_done_callback(_close_response) # The loser is closed when it arrives
+            if future is hedge: _count(host, hedge_wins=1)
+            return future.result()
+    raise error
+
+def request(method, url, retries=None, hedge=True, **kwargs):
+    """
+    requests.request() through this thread's pooled session with the process policy: transient
+    errors and retryable statuses are retried with backoff, and GETs may be hedged (hedge=False
+    turns it off for this call). kwargs are passed to requests (params, timeout, stream, ...).
+
+    Returns:
+        requests.Response: the final response (its status is not checked beyond the retries).
+    Raises:
+        requests.RequestException: the last error if all attempts failed.
+    """
+    host = urlsplit(url).netloc
+    retries = _SETTINGS['retries'] if retries is None else retries
+    for attempt in range(retries + 1):
+        hedge_after_s = None
+        if hedge and method.upper() == 'GET' and _SETTINGS['hedge_percentile']:
+            hedge_after_s = latency_percentile(host, _SETTINGS['hedge_percentile'])
+        try:
+            if hedge_after_s is not None:
+                response, latency_s = _send_hedged(method, url, kwargs, hedge_after_s, host)
+            else:
+                response, latency_s = _send(method, url, kwargs)
+        except TRANSIENT_ERRORS as e:
+            if not wait_before_retry(attempt, url, e, retries): raise
+            continue
+        _count(host, latency_s=latency_s, requests=1)
+        if response.status_code in RETRY_STATUS_CODES and attempt < retries:
+            delay = backoff_delay(attempt, _retry_after_s(response))
+            print(f"    HTTP {method} {host} returned {response.status_code}; retry {attempt + 1}/{retries} in {delay:.1f}s")
+            response.close()
+            _count(host, retries=1)
+            time.sleep(delay)
+            continue
+        return response
+
+def get(url, **kwargs):
+    """GET via request()."""
+    return request('GET', url, **kwargs)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# import_budget.py
+"""
+Measures the import time of each pipeline module and checks it against a budget.
+
+Every module is imported in a fresh interpreter with `python -X importtime`, so the
+cumulative time includes all of its (transitive) dependencies. Each measurement is
+repeated and the fastest run is used, which filters out disk-cache effects.
+
+Usage:
+    python import_budget.py                  # all modules
+    python import_budget.py step6_generate_cut_obj_model --repeat 5
+Exits with status 1 if a module exceeds its budget.
+"""
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+PIPELINE_DIR = Path(__file__).resolve().parent
+
+# Budgets in milliseconds (cumulative import time, including dependencies).
+# The orchestrator and the infrastructure modules must stay light: step modules and
+# their heavy dependencies are only imported when a step runs.
+IMPORT_TIME_BUDGET_MS = {
+    'main_orchestrator': 150,
+    'step_scheduler': 50,
+    'artifact_cache': 50,
+    'run_report': 50,
+    'batch_runner': 200,
+    'helpers': 400,                           # shapely + numpy; plotting libraries load on first plot
+    'step1_compute_hull': 1500,               # pandas, geopandas, pyproj
+    'step2a_fetch_wfs': 2000,                 # + owslib
+    'step2b_fetch_osm': 4000,                 # osmnx (networkx, requests, ...)
+    'step3_analyze_gml': 1500,
+    'step4_calculate_alpha_shape': 2500,      # alphashape (scipy, trimesh)
+    'step5_generate_texture': 2500,           # rasterio, PIL, requests
+    'step5b_mark_defects_on_texture': 2000,   # cv2
+    'step6_generate_cut_obj_model': 6000,     # CadQuery / OCCT
+    'step6b_transform_obj': 50,
+    'step7_generate_nav2_map': 2000,          # cv2, yaml
+    'step7b_generate_waypoints_yaml': 1500,
+    'step8_generate_gazebo_world': 500,
+}
+
+
+def measure_import_ms(module_name, python_exe=sys.executable):
+    """
+    Imports a module in a fresh interpreter and returns its cumulative import time in ms.
+
+    Returns:
+        float or None: None if the import failed (the error is printed).
+    """
+    result = subprocess.run([python_exe, '-X', 'importtime', '-c', f'import {module_name}'],
+                            cwd=str(PIPELINE_DIR), capture_output=True, text=True)
+    if result.returncode != 0:
+        last_line = (result.stderr.strip().splitlines() or ["unknown error"])[-1]
+        print(f"  Warning: Could not import {module_name}: {last_line}")
+        return None
+    # Lines look like: "import time:   self [us] | cumulative | imported package"
+    for line in reversed(result.stderr.splitlines()):
+        if not line.startswith('import time:'): continue
+        fields = [f.strip() for f in line[len('import time:'):].split('|')]
+        if len(fields) == 3 and fields[2] == module_name:
+            return int(fields[1]) / 1000.0
+    return None
+
+
+def check_import_budgets(module_names=None, repeat=3):
+    """
+    Measures the given modules (default: all with a budget) and prints a table.
+
+    Returns:
+        dict: module -> (best_ms or None, budget_ms, within_budget)
+    """
+    results = {}
+    module_names = list(module_names or IMPORT_TIME_BUDGET_MS)
+    print(f"{'Module':<34} {'import ms':>10} {'budget ms':>10}  Result")
+    for module_name in module_names:
+        budget_ms = IMPORT_TIME_BUDGET_MS.get(module_name)
+        timings = [measure_import_ms(module_name) for _ in range(max(1, repeat))]
+        timings = [t for t in timings if t is not None]
+        best_ms = min(timings) if timings else None
+        within_budget = best_ms is not None and (budget_ms is None or best_ms <= budget_ms)
+        results[module_name] = (best_ms, budget_ms, within_budget)
+        outcome = "n/a (import failed)" if best_ms is None else ("ok" if within_budget else "OVER BUDGET")
+        print(f"{module_name:<34} {(f'{best_ms:.1f}' if best_ms is not None else '-'):>10} "
+              f"{(str(budget_ms) if budget_ms is not None else '-'):>10}  {outcome}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check pipeline module import times against their budgets.")
+    parser.add_argument('modules', nargs='*', help="Modules to measure (default: all with a budget).")
+    parser.add_argument('--repeat', type=int, default=3, help="Measurements per module; the fastest is used.")
+    args = parser.parse_args()
+    results = check_import_budgets(args.modules, repeat=args.repeat)
+    over_budget = [m for m, (best_ms, _, ok) in results.items() if best_ms is not None and not ok]
+    if over_budget:
+        print(f"Over budget: {', '.join(over_budget)}")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
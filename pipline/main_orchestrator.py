@@ -1,43 +1,69 @@
 # -*- coding: utf-8 -*-
-import os
 import time
+import traceback
 from pathlib import Path
+from types import SimpleNamespace
 import math
 
-# Import functions from our step modules
-from step1_compute_hull import compute_and_save_convex_hull
-from step2a_fetch_wfs import fetch_clip_and_save_wfs
-from step2b_fetch_osm import fetch_clip_and_save_osm_streets
-from step3_analyze_gml import analyze_gml_and_sample_points
-from step4_calculate_alpha_shape import calculate_and_save_alpha_shape
-from step5_generate_texture import generate_texture_from_polygon
-from step5b_mark_defects_on_texture import mark_defects_on_texture
-from step6_generate_cut_obj_model import generate_cut_obj_model
-from step6b_transform_obj import transform_obj_file # <<< NEW IMPORT
-from step7_generate_nav2_map import generate_nav2_map
-from step7b_generate_waypoints_yaml import generate_waypoints_yaml # <<< NEW IMPORT
-from step8_generate_gazebo_world import create_gazebo_model_and_world
+# Step modules are imported inside the run_step* functions, so their heavy dependencies
+# (CadQuery/OCCT, osmnx, rasterio, cv2, ...) are only loaded by steps that actually run
+# and not at all for steps restored from the artifact cache. See import_budget.py.
+from step_scheduler import PipelineStep, StepScheduler
+from artifact_cache import ArtifactCache
+from run_manifest import RunManifest
+from run_report import RunProfiler
 
 # --- Main Configuration ---
 # Input Data
 CSV_FILE = 'defect_coordinates.csv' # Make sure this file exists in the same directory or provide full path
+                                    # (.parquet/.geoparquet also accepted, see defect_store.py)
 
 # CRS Configuration
 SOURCE_CRS = 'EPSG:4326'  # CRS of the input CSV coordinates
 TARGET_CRS = 'EPSG:25832' # Target CRS for most processing (UTM 32N for NRW, Germany)
 
+# HTTP (WFS and WMS requests, see http_session.py)
+HTTP_RETRIES = 3 # Retries of a request after connection errors, timeouts, 429 and 5xx
+HTTP_BACKOFF_BASE_S = 1.0 # Retry n waits a random time up to min(HTTP_BACKOFF_MAX_S, HTTP_BACKOFF_BASE_S * 2**n) (or Retry-After)
+HTTP_BACKOFF_MAX_S = 30.0
+HTTP_HEDGE_PERCENTILE = 95 # A GET slower than this latency percentile of its host is sent a second time; None = no hedging
+HTTP_HEDGE_MIN_SAMPLES = 10 # Requests to a host before it is hedged
+HTTP_POOL_MAXSIZE = 16 # Keep-alive connections per host (at least WFS_MAX_WORKERS)
+
 # Step 1: Convex Hull
 BUFFER_METERS_FOR_HULL = 15
+HULL_CLUSTER_DISTANCE_M = None # e.g. 500: one hull per defect cluster (sparse campaigns); None = a single hull
 OUTPUT_HULL_GPKG = "convex_hull.gpkg" # Will be saved in OUTPUT_DIR
 
 # Step 2: External Data Fetching
 WFS_URL = 'https://www.wfs.nrw.de/geobasis/wfs_nw_alkis_aaa-modell-basiert'
 WFS_FEATURE_TYPES = ['adv:AX_Strassenverkehr', 'adv:AX_Strassenverkehrsanlage']
+WFS_TILE_SIZE_M = 1000.0 # Hull bboxes are requested in tiles of this size (large areas time out or get truncated); None = one request per hull
+WFS_PAGE_SIZE = 5000 # Features per request page (WFS 2.0 startIndex/count); None = server default, still paged if it reports more matches
+WFS_MAX_WORKERS = 4 # Concurrent WFS requests (tiles, pages and feature types)
+WFS_TIMEOUT_S = 60
+WFS_SPATIAL_FILTER = True # Send an FES Intersects filter with the hull instead of the plain bbox (the client-side clip stays)
+WFS_GEOMETRY_PROPERTY = 'adv:position' # Geometry property of the ALKIS feature types, used by the filter
+WFS_PROPERTY_NAMES = ['adv:position'] # Properties requested (no later step reads ALKIS attributes); None = all
+WFS_NAMESPACES = {'adv': 'http://www.adv-online.de/namespaces/adv/gid/7.1'} # Prefixes used in the two settings above
+WFS_DEBUG_SAVE_RAW = False # Also write the raw GML responses (<typename>_raw_t<tile>_p<page>.gml); they are parsed while streaming
+WFS_CACHE_ENABLED = True # Downloaded request tiles are kept in WFS_CACHE_PATH and reused by later runs (see wfs_cache.py)
+WFS_CACHE_PATH = 'wfs_cache.sqlite' # Shared by all runs
+WFS_CACHE_TTL_S = 30 * 24 * 3600 # Cadastral road geometry changes only a few times a year; None = never expires. Also ages Step 2a's artifact cache entry
+WFS_OFFLINE = False # Serve Step 2a from the WFS cache only (`--offline`); uncached tiles fail instead of being downloaded. Step 2b then needs OSM_PBF_PATH
 OSM_OUTPUT_GPKG = "osm_streets_clipped.gpkg" # Will be saved in OUTPUT_DIR
+RUN_OSM_FETCH = False # Step 2b is optional; nothing downstream consumes the OSM streets yet
+OSM_PBF_PATH = None # e.g. 'nordrhein-westfalen-latest.osm.pbf': Step 2b reads the streets from this local extract instead of the Overpass API
+OSM_PBF_INDEX_PATH = None # Street index of the extract, built on first use (see osm_pbf_index.py); None = <OSM_PBF_PATH>.ways.sqlite
 
 # Step 3: GML Analysis (for a specific WFS layer)
 ANALYSIS_OFFSET_METERS = 0.1
+ANALYSIS_MIN_COMPONENT_LINES = 2 # Filter 2 keeps groups of connected lines with at least this many lines...
+ANALYSIS_MIN_COMPONENT_LENGTH_M = 0.0 # ...and this total length (e.g. 50.0 drops isolated fragments)
 POINT_SAMPLE_INTERVAL_METERS = 5.0
+POINT_SAMPLING_MODE = 'fixed' # 'adaptive': samples follow the curvature (far fewer points on straight kerbs, see step3_analyze_gml.py)
+POINT_SAMPLE_MAX_DEVIATION_M = 0.05 # Adaptive: maximum distance between the lines and the polyline through their samples
+POINT_SAMPLE_MAX_SPACING_M = 20.0 # Adaptive: maximum distance between neighbouring samples on straight stretches
 SAMPLED_POINTS_CSV = "analyzed_gml_sampled_points.csv" # Output from GML analysis
 
 # Step 4: Alpha Shape
@@ -56,6 +82,7 @@ WMS_TEXTURE_WIDTH = 5000
 WMS_TEXTURE_HEIGHT = 5000
 WMS_TEXTURE_TARGET_CRS = TARGET_CRS
 WMS_BBOX_PADDING_METERS = 20.0
+WMS_CACHE_TTL_S = 30 * 24 * 3600 # Step 5 (or 'T') artifact cache entries are re-downloaded after this age; None = never expire
 POLYGON_CRS_FALLBACK_FOR_TEXTURE = TARGET_CRS
 TEXTURE_FILL_COLOR_RGB = [128, 128, 128]
 
@@ -105,411 +132,786 @@ SHOW_PLOTS_ALL_STEPS = False
 SAVE_PLOTS_ALL_STEPS = True
 PLOT_DPI_ALL_STEPS = 150
 
-def main():
-    print("--- Orchestrator Script Start ---")
-    start_time_script = time.time()
-
-    output_dir = Path(OUTPUT_DIR_BASE)
-    output_dir.mkdir(parents=True, exist_ok=True)
-    print(f"All outputs will be saved in: {output_dir.resolve()}")
+# Scheduling
+SCHEDULER_MAX_WORKERS = 4 # Independent steps (e.g. WMS texture vs. GML analysis) run concurrently; 1 = sequential
+
+# Artifact Cache (steps whose inputs and config constants are unchanged are restored, not recomputed)
+ARTIFACT_CACHE_ENABLED = True
+ARTIFACT_CACHE_DIR = 'artifact_cache' # Shared by all runs; delete it to force a full recomputation
+
+# Run Manifest (checkpoint of the completed steps; `--resume` continues a failed run from it)
+RUN_MANIFEST_FILENAME = "run_manifest.json" # Saved in OUTPUT_DIR
+
+# Run Report (per-step/sub-phase wall & CPU time, peak memory, disk and network bytes)
+RUN_REPORT_ENABLED = True
+RUN_REPORT_FILENAME = "run_report.json" # Saved in OUTPUT_DIR
+RUN_TRACE_FILENAME = "run_trace.json"   # Chrome trace-event format (chrome://tracing, ui.perfetto.dev)
+RUN_REPORT_TRACEMALLOC = False # Also track Python heap peaks with tracemalloc (slows the run down noticeably)
+RUN_REPORT_SAMPLE_INTERVAL_S = 0.05 # Memory sampling interval
+
+# Batch Mode (see batch_runner.py)
+BATCH_MAX_WORKERS = 2 # Sites processed concurrently, one worker process each
+BATCH_OUTPUT_DIR_BASE = 'output_batch' # Each site gets its own subdirectory
+BATCH_STEP_MAX_WORKERS = 2 # SCHEDULER_MAX_WORKERS inside each batch worker process
+
+# Defect Daemon (see defect_daemon.py)
+DAEMON_INBOX_DIR = 'defect_inbox' # New defect CSVs are dropped here (write to a temporary name, then rename to *.csv)
+DAEMON_POLL_INTERVAL_S = 5.0
+DAEMON_DEFECTS_CSV_FILENAME = "defects_accumulated.csv" # All defects ingested so far; saved in OUTPUT_DIR
+
+# Tiled Processing (see tiling.py) - for large AOIs, Steps 5-7 run per tile in one shared local frame
+TILING_ENABLED = False # Replaces Steps 5-7 and 8 (no Gazebo world) with the tiled step
+TILE_SIZE_M = 250.0
+TILE_OVERLAP_M = 10.0
+TILE_MAX_WORKERS = 4 # Tiles processed concurrently, one worker process each; 1 = in the pipeline process
+TILES_OUTPUT_SUBDIR = "tiles"
+TILES_INDEX_FILENAME = "tiles_index.yaml" # Shared frame and per-tile assets; saved in TILES_OUTPUT_SUBDIR
+# Note: WMS_TEXTURE_WIDTH/HEIGHT apply to every tile texture; lower them for tiled runs if needed
+
+
+def load_config(overrides=None):
+    """Returns the module-level configuration constants as a namespace, with optional overrides applied."""
+    config = {name: value for name, value in globals().items() if name.isupper()}
+    for name, value in (overrides or {}).items():
+        if name not in config:
+            raise KeyError(f"Unknown configuration constant: {name}")
+        config[name] = value
+    return SimpleNamespace(**config)
+
+# =============================================================================
+# Pipeline Steps
+# Each step reads its inputs from the shared run context `ctx`, stores its outputs
+# in it and returns True if it produced them. See build_pipeline_steps() for the DAG.
+# =============================================================================
+def run_step1_hull(ctx):
+    cfg = ctx['cfg']
+    print("\n=== STEP 1: Computing Convex Hull ===")
+    from step1_compute_hull import compute_and_save_convex_hull
+    hull_gpkg_path = compute_and_save_convex_hull(
+        csv_path_str=ctx['csv_path'],
+        source_crs_str=cfg.SOURCE_CRS,
+        target_crs_str=cfg.TARGET_CRS,
+        buffer_m=cfg.BUFFER_METERS_FOR_HULL,
+        output_hull_gpkg_str=str(ctx['output_dir'] / cfg.OUTPUT_HULL_GPKG),
+        cluster_distance_m=cfg.HULL_CLUSTER_DISTANCE_M
+    )
+    if not hull_gpkg_path: raise Exception("Hull computation failed to return a path.")
+    print(f"Convex Hull GPKG: {hull_gpkg_path}")
+    ctx['hull_gpkg_path'] = hull_gpkg_path
+    return True
+
+def run_step2a_wfs(ctx):
+    cfg = ctx['cfg']
+    ctx['fetched_wfs_gml_paths'] = {}
+    ctx['fetched_wfs_gdfs'] = {} # In-memory copies of the clipped GML, used by Steps 3, 5, 6 and 7
+    print("\n=== STEP 2a: Fetching WFS Data ===")
+    try:
+        from step2a_fetch_wfs import fetch_clip_and_save_wfs
+        wfs_cache = None
+        if cfg.WFS_CACHE_ENABLED or cfg.WFS_OFFLINE:
+            from wfs_cache import WFSCache
+            wfs_cache = WFSCache(cfg.WFS_CACHE_PATH, ttl_s=cfg.WFS_CACHE_TTL_S)
+        ctx['fetched_wfs_gml_paths'], ctx['fetched_wfs_gdfs'] = fetch_clip_and_save_wfs(
+            hull_polygon_gpkg_path_str=ctx['hull_gpkg_path'],
+            wfs_url=cfg.WFS_URL,
+            feature_types=cfg.WFS_FEATURE_TYPES,
+            target_crs_str=cfg.TARGET_CRS,
+            out_dir_str=str(ctx['output_dir']),
+            return_gdfs=True,
+            tile_size_m=cfg.WFS_TILE_SIZE_M,
+            page_size=cfg.WFS_PAGE_SIZE,
+            max_workers=cfg.WFS_MAX_WORKERS,
+            timeout_s=cfg.WFS_TIMEOUT_S,
+            cache=wfs_cache,
+            offline=cfg.WFS_OFFLINE,
+            debug_raw=cfg.WFS_DEBUG_SAVE_RAW,
+            geometry_property=cfg.WFS_GEOMETRY_PROPERTY if cfg.WFS_SPATIAL_FILTER else None,
+            property_names=cfg.WFS_PROPERTY_NAMES,
+            namespaces=cfg.WFS_NAMESPACES
+        )
+        print("Fetched WFS GML paths:", ctx['fetched_wfs_gml_paths'])
+    except Exception as e:
+        print(f"ERROR in Step 2a (WFS Fetch): {e}")
+    return bool(ctx['fetched_wfs_gml_paths'])
 
-    # ... (Steps 1 to 5 remain the same) ...
-    # --- Step 1: Compute Convex Hull ---
-    hull_gpkg_path = None
+def run_step2b_osm(ctx):
+    cfg = ctx['cfg']
+    ctx['osm_gpkg_path'] = None
+    print("\n=== STEP 2b: Fetching OSM Data ===")
     try:
-        print("\n=== STEP 1: Computing Convex Hull ===")
-        hull_gpkg_path = compute_and_save_convex_hull(
-            csv_path_str=CSV_FILE,
-            source_crs_str=SOURCE_CRS,
-            target_crs_str=TARGET_CRS,
-            buffer_m=BUFFER_METERS_FOR_HULL,
-            output_hull_gpkg_str=str(output_dir / OUTPUT_HULL_GPKG)
+        from step2b_fetch_osm import fetch_clip_and_save_osm_streets
+        ctx['osm_gpkg_path'] = fetch_clip_and_save_osm_streets(
+            hull_polygon_gpkg_path_str=ctx['hull_gpkg_path'],
+            target_crs_str=cfg.TARGET_CRS,
+            out_dir_str=str(ctx['output_dir']),
+            pbf_path=cfg.OSM_PBF_PATH,
+            pbf_index_path=cfg.OSM_PBF_INDEX_PATH,
+            offline=cfg.WFS_OFFLINE
         )
-        if not hull_gpkg_path: raise Exception("Hull computation failed to return a path.")
-        print(f"Convex Hull GPKG: {hull_gpkg_path}")
+        if ctx['osm_gpkg_path']: print(f"Fetched OSM Streets GPKG: {ctx['osm_gpkg_path']}")
     except Exception as e:
-        print(f"FATAL ERROR in Step 1 (Convex Hull): {e}")
-        return
-
-    # --- Step 2: Fetch External Data ---
-    fetched_wfs_gml_paths = {}
-    # ... (WFS/OSM fetching logic) ...
-    if hull_gpkg_path:
-        print("\n=== STEP 2a: Fetching WFS Data ===")
-        try:
-            fetched_wfs_gml_paths = fetch_clip_and_save_wfs(
-                hull_polygon_gpkg_path_str=hull_gpkg_path,
-                wfs_url=WFS_URL,
-                feature_types=WFS_FEATURE_TYPES,
-                target_crs_str=TARGET_CRS,
-                out_dir_str=str(output_dir)
-            )
-            print("Fetched WFS GML paths:", fetched_wfs_gml_paths)
-        except Exception as e:
-            print(f"ERROR in Step 2a (WFS Fetch): {e}")
-    
-    # print("\n=== STEP 2b: Fetching OSM Data ===")
-        # try:
-        #     osm_gpkg_path = fetch_clip_and_save_osm_streets(
-        #         hull_polygon_gpkg_path_str=hull_gpkg_path,
-        #         target_crs_str=TARGET_CRS,
-        #         out_dir_str=str(output_dir)
-        #     )
-        #     if osm_gpkg_path: print(f"Fetched OSM Streets GPKG: {osm_gpkg_path}")
-        # except Exception as e:
-        #     print(f"ERROR in Step 2b (OSM Fetch): {e}")
-
-    # --- Step 3: Analyze GML ---
-    sampled_points_list = None
+        print(f"ERROR in Step 2b (OSM Fetch): {e}")
+    return bool(ctx['osm_gpkg_path'])
+
+def run_step3_analyze_gml(ctx):
+    cfg = ctx['cfg']
+    output_dir = ctx['output_dir']
+    ctx['sampled_points_xy'] = None
+    ctx['sampled_points_npy_path'] = None
+    ctx['sampled_points_csv_path'] = None
+    fetched_wfs_gml_paths = ctx['fetched_wfs_gml_paths']
     gml_to_analyze_path = None
     gml_to_analyze_stem = None
-    # ... (GML analysis logic) ...
-    FEATURE_TYPE_TO_ANALYZE = WFS_FEATURE_TYPES[1] if len(WFS_FEATURE_TYPES) > 1 else (WFS_FEATURE_TYPES[0] if WFS_FEATURE_TYPES else None)
+    FEATURE_TYPE_TO_ANALYZE = cfg.WFS_FEATURE_TYPES[1] if len(cfg.WFS_FEATURE_TYPES) > 1 else (cfg.WFS_FEATURE_TYPES[0] if cfg.WFS_FEATURE_TYPES else None)
     if FEATURE_TYPE_TO_ANALYZE and FEATURE_TYPE_TO_ANALYZE in fetched_wfs_gml_paths:
         gml_to_analyze_path = fetched_wfs_gml_paths[FEATURE_TYPE_TO_ANALYZE]
         gml_to_analyze_stem = Path(gml_to_analyze_path).stem
-    # ...
 
-    if gml_to_analyze_path and hull_gpkg_path:
-        print("\n=== STEP 3: Analyzing GML and Sampling Points ===")
-        # ... (call analyze_gml_and_sample_points) ...
-        try:
-            sampled_points_list = analyze_gml_and_sample_points(
-                gml_file_path_str=gml_to_analyze_path,
-                hull_polygon_gpkg_path_str=hull_gpkg_path,
-                output_dir_str=str(output_dir),
-                gml_filename_stem_for_plots=gml_to_analyze_stem,
-                analysis_offset=ANALYSIS_OFFSET_METERS,
-                sample_interval=POINT_SAMPLE_INTERVAL_METERS,
-                show_plots=SHOW_PLOTS_ALL_STEPS,
-                save_plots=SAVE_PLOTS_ALL_STEPS,
-                plot_dpi=PLOT_DPI_ALL_STEPS
-            )
-        except Exception as e: print(f"ERROR in Step 3 (GML Analysis): {e}")
-    # ...
-
-    # --- Step 4: Calculate Alpha Shape ---
-    alpha_shape_gml_path = None
-    # ... (Alpha shape logic) ...
-    points_input_for_alpha = None
-    if gml_to_analyze_stem:
-        potential_csv_path = output_dir / f"{gml_to_analyze_stem}_sampled_points.csv"
-        if potential_csv_path.exists(): points_input_for_alpha = str(potential_csv_path)
-        elif sampled_points_list: points_input_for_alpha = sampled_points_list
-
-    if points_input_for_alpha:
-        print("\n=== STEP 4: Calculating Alpha Shape ===")
-        # ... (call calculate_and_save_alpha_shape) ...
-        try:
-            alpha_shape_gml_path = calculate_and_save_alpha_shape(
-                sampled_points_input=points_input_for_alpha,
-                target_crs_str=TARGET_CRS,
-                output_dir_str=str(output_dir),
-                output_filename_stem=Path(ALPHA_SHAPE_OUTPUT_GML).stem,
-                alpha_parameter=ALPHA_SHAPE_PARAMETER,
-                default_alpha_if_optimize_fails=ALPHA_DEFAULT_IF_OPTIMIZE_FAILS,
-                show_plots=SHOW_PLOTS_ALL_STEPS,
-                save_plots=SAVE_PLOTS_ALL_STEPS,
-                plot_dpi=PLOT_DPI_ALL_STEPS
-            )
-        except Exception as e: print(f"ERROR in Step 4 (Alpha Shape): {e}")
-    # ...
-
-    # --- Setup for Step 5, 6, 6b, 8 ---
-    final_model_output_dir = output_dir / CUT_MODEL_OUTPUT_SUBDIR # e.g. output_project/cut_model_output/
-    final_model_output_dir.mkdir(parents=True, exist_ok=True)
-    print(f"\nModel outputs (OBJ/MTL/PNG) will be in: {final_model_output_dir.resolve()}")
+    if not (gml_to_analyze_path and ctx['hull_gpkg_path']):
+        print("Skipping Step 3 (GML Analysis): GML to analyze not available.")
+        return False
 
-    gml_for_texture_footprint_path = fetched_wfs_gml_paths.get(TEXTURE_SOURCE_GML_KEY)
+    print("\n=== STEP 3: Analyzing GML and Sampling Points ===")
+    try:
+        from step3_analyze_gml import analyze_gml_and_sample_points
+        ctx['sampled_points_xy'] = analyze_gml_and_sample_points(
+            gml_file_path_str=gml_to_analyze_path,
+            hull_polygon_gpkg_path_str=ctx['hull_gpkg_path'],
+            output_dir_str=str(output_dir),
+            gml_filename_stem_for_plots=gml_to_analyze_stem,
+            analysis_offset=cfg.ANALYSIS_OFFSET_METERS,
+            sample_interval=cfg.POINT_SAMPLE_INTERVAL_METERS,
+            show_plots=cfg.SHOW_PLOTS_ALL_STEPS,
+            save_plots=cfg.SAVE_PLOTS_ALL_STEPS,
+            plot_dpi=cfg.PLOT_DPI_ALL_STEPS,
+            lines_gdf=_wfs_gdf(ctx, FEATURE_TYPE_TO_ANALYZE),
+            min_component_lines=cfg.ANALYSIS_MIN_COMPONENT_LINES,
+            min_component_length=cfg.ANALYSIS_MIN_COMPONENT_LENGTH_M,
+            sampling_mode=cfg.POINT_SAMPLING_MODE,
+            max_chord_deviation=cfg.POINT_SAMPLE_MAX_DEVIATION_M,
+            max_sample_spacing=cfg.POINT_SAMPLE_MAX_SPACING_M
+        )
+    except Exception as e: print(f"ERROR in Step 3 (GML Analysis): {e}")
+
+    potential_npy_path = output_dir / f"{gml_to_analyze_stem}_sampled_points.npy"
+    if potential_npy_path.exists(): ctx['sampled_points_npy_path'] = str(potential_npy_path)
+    potential_csv_path = output_dir / f"{gml_to_analyze_stem}_sampled_points.csv"
+    if potential_csv_path.exists(): ctx['sampled_points_csv_path'] = str(potential_csv_path)
+    return bool(ctx['sampled_points_npy_path'] or ctx['sampled_points_csv_path'])
+
+def run_step4_alpha_shape(ctx):
+    cfg = ctx['cfg']
+    ctx['alpha_shape_gml_path'] = None
+    ctx['alpha_shape_gdf'] = None
+    # The in-memory array from Step 3 avoids reading a file; after a cache restore only the files are there
+    points_input_for_alpha = ctx.get('sampled_points_xy')
+    if points_input_for_alpha is None or not len(points_input_for_alpha):
+        points_input_for_alpha = ctx.get('sampled_points_npy_path') or ctx['sampled_points_csv_path']
+    if points_input_for_alpha is None:
+        print("Skipping Step 4 (Alpha Shape): No sampled points available from Step 3.")
+        return False
+
+    print("\n=== STEP 4: Calculating Alpha Shape ===")
+    try:
+        from step4_calculate_alpha_shape import calculate_and_save_alpha_shape
+        ctx['alpha_shape_gml_path'], ctx['alpha_shape_gdf'] = calculate_and_save_alpha_shape(
+            sampled_points_input=points_input_for_alpha,
+            target_crs_str=cfg.TARGET_CRS,
+            output_dir_str=str(ctx['output_dir']),
+            output_filename_stem=Path(cfg.ALPHA_SHAPE_OUTPUT_GML).stem,
+            alpha_parameter=cfg.ALPHA_SHAPE_PARAMETER,
+            default_alpha_if_optimize_fails=cfg.ALPHA_DEFAULT_IF_OPTIMIZE_FAILS,
+            show_plots=cfg.SHOW_PLOTS_ALL_STEPS,
+            save_plots=cfg.SAVE_PLOTS_ALL_STEPS,
+            plot_dpi=cfg.PLOT_DPI_ALL_STEPS,
+            return_gdf=True
+        )
+    except Exception as e: print(f"ERROR in Step 4 (Alpha Shape): {e}")
+    return bool(ctx['alpha_shape_gml_path'])
 
-    # --- Step 5: Generate Texture ---
+def run_step5_texture(ctx):
+    cfg = ctx['cfg']
     # Initialize variables that will hold results from step 5
-    base_texture_path_str = None
-    cropped_texture_transform = None
-    cropped_texture_crs_obj = None
+    ctx['base_texture_path_str'] = None
+    ctx['cropped_texture_transform'] = None
+    ctx['cropped_texture_crs_obj'] = None
 
-    if gml_for_texture_footprint_path and Path(gml_for_texture_footprint_path).exists():
-        print(f"\n=== STEP 5: Generating Texture (based on {Path(gml_for_texture_footprint_path).name}) ===")
-        try:
-            # Unpack all three return values
-            temp_texture_path, temp_transform, temp_crs_obj = generate_texture_from_polygon(
-                polygon_gml_path_str=gml_for_texture_footprint_path,
-                output_dir_str=str(final_model_output_dir),
-                output_texture_filename=OUTPUT_TEXTURE_FILENAME,
-                wms_url=WMS_TEXTURE_URL, wms_layer=WMS_TEXTURE_LAYER,
-                wms_version=WMS_TEXTURE_VERSION, wms_format=WMS_TEXTURE_FORMAT,
-                wms_width=WMS_TEXTURE_WIDTH, wms_height=WMS_TEXTURE_HEIGHT,
-                target_wms_crs_str=WMS_TEXTURE_TARGET_CRS,
-                wms_bbox_padding=WMS_BBOX_PADDING_METERS,
-                polygon_crs_fallback_str=TARGET_CRS,
-                fill_color_rgb=TEXTURE_FILL_COLOR_RGB,
-                show_plots=SHOW_PLOTS_ALL_STEPS, save_plots=SAVE_PLOTS_ALL_STEPS, plot_dpi=PLOT_DPI_ALL_STEPS
-            )
-            # Assign to broader scope variables only if successful
-            if temp_texture_path and temp_transform and temp_crs_obj:
-                base_texture_path_str = temp_texture_path # Store as string
-                cropped_texture_transform = temp_transform
-                cropped_texture_crs_obj = temp_crs_obj
-                print(f"  Base Texture PNG Saved: {base_texture_path_str}")
-                print(f"  Texture CRS: {cropped_texture_crs_obj.srs}")
-            else:
-                print("  Error: Texture generation in Step 5 did not return all necessary info or failed.")
-        except Exception as e:
-            print(f"ERROR in Step 5 (Texture Generation): {e}")
-            traceback.print_exc()
-    else:
+    gml_for_texture_footprint_path = ctx['fetched_wfs_gml_paths'].get(cfg.TEXTURE_SOURCE_GML_KEY)
+    if not (gml_for_texture_footprint_path and Path(gml_for_texture_footprint_path).exists()):
         print("Skipping Step 5 (Texture Generation): Input GML for texture footprint not found or invalid.")
+        return False
 
-    # Path to the texture that will be used by subsequent steps (might be modified by 5b)
-    # Initialize with the path from step 5, even if it's None
-    final_texture_path = Path(base_texture_path_str) if base_texture_path_str else None
-
-
-    # --- Step 5b: Mark Defects on Texture ---
-    if MARK_DEFECTS_ON_TEXTURE:
-        if base_texture_path_str and cropped_texture_transform and cropped_texture_crs_obj and Path(CSV_FILE).exists():
-            print("\n=== STEP 5b: Marking Defect Polygons on Texture ===")
-            try:
-                success_step5b = mark_defects_on_texture(
-                    base_texture_path_str=base_texture_path_str, # Pass the string path
-                    texture_affine_transform=cropped_texture_transform,
-                    texture_crs_pyproj_obj=cropped_texture_crs_obj,
-                    csv_path_str=CSV_FILE,
-                    defect_color_bgr=(0, 0, 0) # Black
-                )
-                if success_step5b:
-                    print(f"  Defect polygons marked on texture: {base_texture_path_str}")
-                    # final_texture_path_for_model remains the same Path object,
-                    # but its content is now modified.
-                else:
-                    print("  Warning: Defect polygon marking on texture failed. Using original texture from Step 5 if available.")
-            except Exception as e_defect_mark:
-                print(f"ERROR during Step 5b (Defect Polygon Marking): {e_defect_mark}")
-                traceback.print_exc()
-        else:
-            print("Skipping Step 5b (Defect Marking):")
-            if not (base_texture_path_str and cropped_texture_transform and cropped_texture_crs_obj):
-                 print("  - Base texture or its georeferencing info not available from Step 5.")
-            if not Path(CSV_FILE).exists():
-                 print(f"  - Input defect CSV file '{CSV_FILE}' not found.")
-    else:
+    print(f"\n=== STEP 5: Generating Texture (based on {Path(gml_for_texture_footprint_path).name}) ===")
+    try:
+        # Unpack all three return values
+        from step5_generate_texture import generate_texture_from_polygon
+        temp_texture_path, temp_transform, temp_crs_obj = generate_texture_from_polygon(
+            polygon_gml_path_str=gml_for_texture_footprint_path,
+            output_dir_str=str(ctx['final_model_output_dir']),
+            output_texture_filename=cfg.OUTPUT_TEXTURE_FILENAME,
+            wms_url=cfg.WMS_TEXTURE_URL, wms_layer=cfg.WMS_TEXTURE_LAYER,
+            wms_version=cfg.WMS_TEXTURE_VERSION, wms_format=cfg.WMS_TEXTURE_FORMAT,
+            wms_width=cfg.WMS_TEXTURE_WIDTH, wms_height=cfg.WMS_TEXTURE_HEIGHT,
+            target_wms_crs_str=cfg.WMS_TEXTURE_TARGET_CRS,
+            wms_bbox_padding=cfg.WMS_BBOX_PADDING_METERS,
+            polygon_crs_fallback_str=cfg.TARGET_CRS,
+            fill_color_rgb=cfg.TEXTURE_FILL_COLOR_RGB,
+            show_plots=cfg.SHOW_PLOTS_ALL_STEPS, save_plots=cfg.SAVE_PLOTS_ALL_STEPS, plot_dpi=cfg.PLOT_DPI_ALL_STEPS,
+            polygon_gdf=_wfs_gdf(ctx, cfg.TEXTURE_SOURCE_GML_KEY)
+        )
+        # Assign to the run context only if successful
+        if temp_texture_path and temp_transform and temp_crs_obj:
+            ctx['base_texture_path_str'] = temp_texture_path # Store as string
+            ctx['cropped_texture_transform'] = temp_transform
+            ctx['cropped_texture_crs_obj'] = temp_crs_obj
+            print(f"  Base Texture PNG Saved: {temp_texture_path}")
+            print(f"  Texture CRS: {temp_crs_obj.srs}")
+            return True
+        print("  Error: Texture generation in Step 5 did not return all necessary info or failed.")
+    except Exception as e:
+        print(f"ERROR in Step 5 (Texture Generation): {e}")
+        traceback.print_exc()
+    return False
+
+def run_step5b_mark_defects(ctx):
+    cfg = ctx['cfg']
+    csv_file = ctx['csv_path']
+    base_texture_path_str = ctx['base_texture_path_str']
+    # Path to the texture that will be used by subsequent steps (modified in place by 5b)
+    ctx['final_texture_path'] = base_texture_path_str
+
+    if not cfg.MARK_DEFECTS_ON_TEXTURE:
         print("Skipping Step 5b (Defect Marking) as per configuration.")
+        return bool(base_texture_path_str)
+
+    if not (base_texture_path_str and ctx['cropped_texture_transform'] and ctx['cropped_texture_crs_obj'] and Path(csv_file).exists()):
+        print("Skipping Step 5b (Defect Marking):")
+        if not (base_texture_path_str and ctx['cropped_texture_transform'] and ctx['cropped_texture_crs_obj']):
+             print("  - Base texture or its georeferencing info not available from Step 5.")
+        if not Path(csv_file).exists():
+             print(f"  - Input defect CSV file '{csv_file}' not found.")
+        return bool(base_texture_path_str)
 
-    # --- Step 6: Generate Textured Cut OBJ Model (Intermediate) ---
-    cut_model_generated_step6 = False
+    print("\n=== STEP 5b: Marking Defect Polygons on Texture ===")
+    try:
+        from step5b_mark_defects_on_texture import mark_defects_on_texture
+        success_step5b = mark_defects_on_texture(
+            base_texture_path_str=base_texture_path_str, # Pass the string path
+            texture_affine_transform=ctx['cropped_texture_transform'],
+            texture_crs_pyproj_obj=ctx['cropped_texture_crs_obj'],
+            csv_path_str=csv_file,
+            defect_color_bgr=(0, 0, 0) # Black
+        )
+        if success_step5b:
+            # final_texture_path remains the same file, but its content is now modified.
+            print(f"  Defect polygons marked on texture: {base_texture_path_str}")
+        else:
+            print("  Warning: Defect polygon marking on texture failed. Using original texture from Step 5 if available.")
+    except Exception as e_defect_mark:
+        print(f"ERROR during Step 5b (Defect Polygon Marking): {e_defect_mark}")
+        traceback.print_exc()
+    return True
+
+def run_step6_cut_model(ctx):
+    cfg = ctx['cfg']
+    final_model_output_dir = ctx['final_model_output_dir']
+    ctx['cut_obj_path'] = None
+    ctx['cut_mtl_path'] = None
     # This is the path to the UNTRANSFORMED OBJ, e.g., .../cut_model_output/final_cut_road_model.obj
-    intermediate_obj_path_step6 = final_model_output_dir / CUT_OBJ_OUTPUT_FILENAME
+    intermediate_obj_path_step6 = final_model_output_dir / cfg.CUT_OBJ_OUTPUT_FILENAME
     # This is the path to its MTL, e.g., .../cut_model_output/final_cut_road_model.mtl
-    intermediate_mtl_path_step6 = final_model_output_dir / CUT_MTL_OUTPUT_FILENAME
+    intermediate_mtl_path_step6 = final_model_output_dir / cfg.CUT_MTL_OUTPUT_FILENAME
 
-    base_gml_for_cut_path = fetched_wfs_gml_paths.get(BASE_GML_KEY_FOR_CUT)
-    tool_gml_for_cut_path_step6 = alpha_shape_gml_path
+    # Step 5b edits the texture in place, so only the (stable) file name is needed here
+    texture_path = ctx['base_texture_path_str']
+    base_gml_for_cut_path = ctx['fetched_wfs_gml_paths'].get(cfg.BASE_GML_KEY_FOR_CUT)
+    tool_gml_for_cut_path_step6 = ctx['alpha_shape_gml_path']
     inputs_valid_for_cut = True
-    # ... (input validation for step 6) ...
     if not (base_gml_for_cut_path and Path(base_gml_for_cut_path).exists()): inputs_valid_for_cut = False
     if not (tool_gml_for_cut_path_step6 and Path(tool_gml_for_cut_path_step6).exists()): inputs_valid_for_cut = False
-    if not (final_texture_path and Path(final_texture_path).exists()): inputs_valid_for_cut = False
+    if not (texture_path and Path(texture_path).exists()): inputs_valid_for_cut = False
 
+    if not inputs_valid_for_cut:
+        print("Skipping Step 6 (Cut OBJ Model): Base GML, alpha shape GML or texture not available.")
+        return False
 
-    if inputs_valid_for_cut:
-        print("\n=== STEP 6: Generating Textured Cut OBJ Model (Intermediate) ===")
-        # ... (call generate_cut_obj_model) ...
-        try:
-            texture_file_name_for_mtl = Path(final_texture_path).name
-            success_step6 = generate_cut_obj_model(
-                base_gml_path_str=str(base_gml_for_cut_path),
-                tool_gml_path_str=str(tool_gml_for_cut_path_step6),
-                output_dir_str=str(final_model_output_dir),
-                target_crs=TARGET_CRS,
-                base_extrusion_height=BASE_EXTRUSION_CUT_M,
-                tool_extrusion_height=TOOL_EXTRUSION_CUT_M,
-                simplify_tolerance=CUT_SIMPLIFY_TOLERANCE_M,
-                output_obj_filename=CUT_OBJ_OUTPUT_FILENAME,
-                output_mtl_filename=CUT_MTL_OUTPUT_FILENAME,
-                texture_filename=texture_file_name_for_mtl,
-                # ... other params for step 6
-                material_top=CONVERT_MATERIAL_TOP, material_bottom=CONVERT_MATERIAL_BOTTOM, material_sides=CONVERT_MATERIAL_SIDES,
-                generate_vt=CONVERT_GENERATE_VT, z_tolerance=CONVERT_Z_TOLERANCE,
-                show_plots=SHOW_PLOTS_ALL_STEPS, save_plots=SAVE_PLOTS_ALL_STEPS, plot_dpi=PLOT_DPI_ALL_STEPS
-            )
-            if success_step6:
-                cut_model_generated_step6 = True
-                print(f"Intermediate Textured Cut OBJ generated: {intermediate_obj_path_step6}")
-            else: print("Intermediate Textured Cut OBJ generation failed.")
-        except Exception as e_cut_obj: print(f"ERROR Step 6: {e_cut_obj}")
-
-    # --- Step 6b: Transform OBJ Model ---
-    transformed_obj_path_step6b = final_model_output_dir / TRANSFORMED_OBJ_OUTPUT_FILENAME
-    transformed_obj_created = False
-    obj_local_frame_origin_world_xy = None # To store (x,y) of local frame origin in world
-    obj_original_min_z_world = None      # To store original min_z of object in world
-
-    if cut_model_generated_step6 and intermediate_obj_path_step6.exists():
-        print("\n=== STEP 6b: Transforming OBJ Model ===")
-        try:
-            # Capture all returned values
-            success_step6b, lx_world, ly_world, lz_orig_world = transform_obj_file(
-                input_obj_path_str=str(intermediate_obj_path_step6),
-                output_obj_path_str=str(transformed_obj_path_step6b),
-                z_additional_offset_val=TRANSFORM_Z_ADDITIONAL_OFFSET # This is your existing config
-            )
-            if success_step6b and transformed_obj_path_step6b.exists():
-                transformed_obj_created = True
-                obj_local_frame_origin_world_xy = (lx_world, ly_world)
-                obj_original_min_z_world = lz_orig_world # Not directly used by step7 by name, but part of concept
-                print(f"OBJ transformation successful. Final Output: {transformed_obj_path_step6b}")
-                print(f"  Local Frame Origin (World): X={lx_world:.3f}, Y={ly_world:.3f}, Original_Min_Z={lz_orig_world:.3f}")
-            else:
-                print(f"ERROR: OBJ Transformation in Step 6b failed or output file not created.")
-        except Exception as e_transform_obj:
-            print(f"ERROR during Step 6b (OBJ Transformation): {e_transform_obj}")
-            # traceback.print_exc() # Optional
-    else:
+    print("\n=== STEP 6: Generating Textured Cut OBJ Model (Intermediate) ===")
+    try:
+        texture_file_name_for_mtl = Path(texture_path).name
+        from step6_generate_cut_obj_model import generate_cut_obj_model
+        success_step6 = generate_cut_obj_model(
+            base_gml_path_str=str(base_gml_for_cut_path),
+            tool_gml_path_str=str(tool_gml_for_cut_path_step6),
+            output_dir_str=str(final_model_output_dir),
+            target_crs=cfg.TARGET_CRS,
+            base_extrusion_height=cfg.BASE_EXTRUSION_CUT_M,
+            tool_extrusion_height=cfg.TOOL_EXTRUSION_CUT_M,
+            simplify_tolerance=cfg.CUT_SIMPLIFY_TOLERANCE_M,
+            output_obj_filename=cfg.CUT_OBJ_OUTPUT_FILENAME,
+            output_mtl_filename=cfg.CUT_MTL_OUTPUT_FILENAME,
+            texture_filename=texture_file_name_for_mtl,
+            material_top=cfg.CONVERT_MATERIAL_TOP, material_bottom=cfg.CONVERT_MATERIAL_BOTTOM, material_sides=cfg.CONVERT_MATERIAL_SIDES,
+            generate_vt=cfg.CONVERT_GENERATE_VT, z_tolerance=cfg.CONVERT_Z_TOLERANCE,
+            show_plots=cfg.SHOW_PLOTS_ALL_STEPS, save_plots=cfg.SAVE_PLOTS_ALL_STEPS, plot_dpi=cfg.PLOT_DPI_ALL_STEPS,
+            base_gdf=_wfs_gdf(ctx, cfg.BASE_GML_KEY_FOR_CUT),
+            tool_gdf=ctx.get('alpha_shape_gdf')
+        )
+        if success_step6:
+            ctx['cut_obj_path'] = str(intermediate_obj_path_step6)
+            ctx['cut_mtl_path'] = str(intermediate_mtl_path_step6)
+            print(f"Intermediate Textured Cut OBJ generated: {intermediate_obj_path_step6}")
+            return True
+        print("Intermediate Textured Cut OBJ generation failed.")
+    except Exception as e_cut_obj: print(f"ERROR Step 6: {e_cut_obj}")
+    return False
+
+def run_step6b_transform_obj(ctx):
+    cfg = ctx['cfg']
+    ctx['transformed_obj_path'] = None
+    ctx['obj_local_frame_origin_world_xy'] = None # (x,y) of local frame origin in world
+    ctx['obj_original_min_z_world'] = None        # Original min_z of object in world
+    intermediate_obj_path_step6 = ctx['cut_obj_path']
+    transformed_obj_path_step6b = ctx['final_model_output_dir'] / cfg.TRANSFORMED_OBJ_OUTPUT_FILENAME
+
+    if not (intermediate_obj_path_step6 and Path(intermediate_obj_path_step6).exists()):
         print("Skipping Step 6b (OBJ Transformation): Input OBJ from Step 6 not found or Step 6 failed.")
+        return False
 
-    # --- Step 7: Generate Nav2 Map from Alpha Shape ---
-    nav2_map_generated = False
-    nav2_map_output_dir = output_dir / NAV2_MAP_OUTPUT_SUBDIR
+    print("\n=== STEP 6b: Transforming OBJ Model ===")
+    try:
+        # Capture all returned values
+        from step6b_transform_obj import transform_obj_file
+        success_step6b, lx_world, ly_world, lz_orig_world = transform_obj_file(
+            input_obj_path_str=str(intermediate_obj_path_step6),
+            output_obj_path_str=str(transformed_obj_path_step6b),
+            z_additional_offset_val=cfg.TRANSFORM_Z_ADDITIONAL_OFFSET,
+            local_frame_origin_override=ctx.get('local_frame_origin_override') # Set for tiles (shared frame)
+        )
+        if success_step6b and transformed_obj_path_step6b.exists():
+            ctx['transformed_obj_path'] = str(transformed_obj_path_step6b)
+            ctx['obj_local_frame_origin_world_xy'] = (lx_world, ly_world)
+            ctx['obj_original_min_z_world'] = lz_orig_world # Not directly used by step7 by name, but part of concept
+            print(f"OBJ transformation successful. Final Output: {transformed_obj_path_step6b}")
+            print(f"  Local Frame Origin (World): X={lx_world:.3f}, Y={ly_world:.3f}, Original_Min_Z={lz_orig_world:.3f}")
+            return True
+        print(f"ERROR: OBJ Transformation in Step 6b failed or output file not created.")
+    except Exception as e_transform_obj:
+        print(f"ERROR during Step 6b (OBJ Transformation): {e_transform_obj}")
+    return False
+
+def run_step7_nav2_map(ctx):
+    cfg = ctx['cfg']
+    ctx['nav2_map_yaml_path'] = None
+    nav2_map_output_dir = ctx['output_dir'] / cfg.NAV2_MAP_OUTPUT_SUBDIR
+    transformed_obj_created = bool(ctx['transformed_obj_path'])
+    obj_local_frame_origin_world_xy = ctx['obj_local_frame_origin_world_xy']
 
     # Get the path for the bounds GML
-    bounds_gml_for_nav2_map_path_str = fetched_wfs_gml_paths.get(NAV2_MAP_BOUNDS_GML_KEY)
-    # Get the path for the free space GML (this was the old NAV2_MAP_SOURCE_GML_FILENAME)
-    free_space_gml_for_nav2_map_path_str = str(alpha_shape_gml_path) if alpha_shape_gml_path else None
+    bounds_gml_for_nav2_map_path_str = ctx['fetched_wfs_gml_paths'].get(cfg.NAV2_MAP_BOUNDS_GML_KEY)
+    # Get the path for the free space GML (alpha shape)
+    free_space_gml_for_nav2_map_path_str = str(ctx['alpha_shape_gml_path']) if ctx['alpha_shape_gml_path'] else None
 
-    inputs_valid_for_nav2 = True # Reset or adjust based on GML paths
+    inputs_valid_for_nav2 = True
     if not (bounds_gml_for_nav2_map_path_str and Path(bounds_gml_for_nav2_map_path_str).exists()):
-        # ... handle missing bounds GML ...
         inputs_valid_for_nav2 = False
-    # ... handle missing free space GML ...
+    if not (free_space_gml_for_nav2_map_path_str and Path(free_space_gml_for_nav2_map_path_str).exists()):
+        inputs_valid_for_nav2 = False
 
     if transformed_obj_created and obj_local_frame_origin_world_xy is None:
         print("  Error: OBJ was transformed, but local frame origin details were not captured. Cannot proceed with aligned Nav2 map.")
         inputs_valid_for_nav2 = False
-        
-    if inputs_valid_for_nav2 and transformed_obj_created: # Ensure OBJ transformation succeeded to get local frame
-        print("\n=== STEP 7: Generating Nav2 Map Files (Aligned with Transformed OBJ) ===")
-        nav2_map_output_dir.mkdir(parents=True, exist_ok=True)
-        try:
-            # The Z for the map in the local frame will be the object's base Z in local frame
-            map_z_in_local_frame = TRANSFORM_Z_ADDITIONAL_OFFSET
-
-            success_step7 = generate_nav2_map(
-                bounds_gml_input_path_str=bounds_gml_for_nav2_map_path_str,
-                free_space_gml_input_path_str=free_space_gml_for_nav2_map_path_str,
-                obj_local_frame_origin_world_xy=obj_local_frame_origin_world_xy, # Pass the (x,y) world origin of local frame
-                obj_local_frame_base_z_val=map_z_in_local_frame, # Pass the Z value for map in local frame
-                output_dir_str=str(nav2_map_output_dir),
-                output_map_basename=NAV2_MAP_OUTPUT_BASENAME,
-                map_resolution=NAV2_MAP_RESOLUTION,
-                map_padding_m=NAV2_MAP_PADDING_M
-            )
-            if success_step7:
-                nav2_map_generated = True
-        except Exception as e_nav_map:
-            print(f"ERROR during Step 7 (Nav2 Map Generation): {e_nav_map}")
-            traceback.print_exc()
-    elif not transformed_obj_created:
-        print("Skipping Step 7: Transformed OBJ (and its local frame definition) not available.")
 
-    # --- Step 7b: Generate Waypoints YAML --- # <<< NEW STEP INTEGRATION
-    waypoints_yaml_generated = False
-    if transformed_obj_created and \
-       obj_local_frame_origin_world_xy is not None and \
-       obj_original_min_z_world is not None and \
-       Path(CSV_FILE).exists(): # Ensure input CSV exists
-        print("\n=== STEP 7b: Generating Nav2 Waypoints YAML ===")
-        try:
-            # Convert Euler angles from degrees to radians for the function
-            roll_rad = math.radians(WAYPOINTS_DEFAULT_ORIENTATION_EULER_DEG[0])
-            pitch_rad = math.radians(WAYPOINTS_DEFAULT_ORIENTATION_EULER_DEG[1])
-            yaw_rad = math.radians(WAYPOINTS_DEFAULT_ORIENTATION_EULER_DEG[2])
-            default_orientation_rad = [roll_rad, pitch_rad, yaw_rad]
-
-            # Waypoints Z in local frame = base Z of the transformed OBJ
-            waypoint_z_local = TRANSFORM_Z_ADDITIONAL_OFFSET
-
-            waypoints_output_path = nav2_map_output_dir / WAYPOINTS_OUTPUT_YAML_FILENAME
-
-            success_step7b = generate_waypoints_yaml(
-                csv_path_str=CSV_FILE,
-                source_crs_str=SOURCE_CRS,
-                intermediate_crs_str=TARGET_CRS,
-                obj_local_frame_origin_world_xy=obj_local_frame_origin_world_xy,
-                waypoint_z_in_local_frame=waypoint_z_local,
-                output_yaml_path_str=str(waypoints_output_path),
-                default_orientation_euler_rad=default_orientation_rad,
-                map_frame_id=WAYPOINTS_MAP_FRAME_ID
-            )
-            if success_step7b:
-                waypoints_yaml_generated = True
-                print(f"Waypoints YAML saved to: {waypoints_output_path}")
-            else:
-                print("Waypoint YAML generation failed.")
-        except Exception as e_waypoints:
-            print(f"ERROR during Step 7b (Waypoints YAML Generation): {e_waypoints}")
-            import traceback; traceback.print_exc()
-    else:
-        if not Path(CSV_FILE).exists():
-            print(f"Skipping Step 7b (Waypoints YAML): Input CSV file '{CSV_FILE}' not found.")
-        elif not (transformed_obj_created and obj_local_frame_origin_world_xy is not None and obj_original_min_z_world is not None):
-            print("Skipping Step 7b (Waypoints YAML): Required info from Step 6b (OBJ transformation) not available.")
+    if not transformed_obj_created:
+        print("Skipping Step 7: Transformed OBJ (and its local frame definition) not available.")
+        return False
+    if not inputs_valid_for_nav2:
+        print("Skipping Step 7: Bounds or free-space GML not available.")
+        return False
 
-    # --- Step 8: Generate Gazebo World ---
-    gazebo_world_generated = False
-    gazebo_files_output_dir = output_dir / GAZEBO_OUTPUT_SUBDIR
+    print("\n=== STEP 7: Generating Nav2 Map Files (Aligned with Transformed OBJ) ===")
+    nav2_map_output_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        # The Z for the map in the local frame will be the object's base Z in local frame
+        map_z_in_local_frame = cfg.TRANSFORM_Z_ADDITIONAL_OFFSET
+
+        from step7_generate_nav2_map import generate_nav2_map
+        success_step7 = generate_nav2_map(
+            bounds_gml_input_path_str=bounds_gml_for_nav2_map_path_str,
+            free_space_gml_input_path_str=free_space_gml_for_nav2_map_path_str,
+            obj_local_frame_origin_world_xy=obj_local_frame_origin_world_xy, # Pass the (x,y) world origin of local frame
+            obj_local_frame_base_z_val=map_z_in_local_frame, # Pass the Z value for map in local frame
+            output_dir_str=str(nav2_map_output_dir),
+            output_map_basename=cfg.NAV2_MAP_OUTPUT_BASENAME,
+            map_resolution=cfg.NAV2_MAP_RESOLUTION,
+            map_padding_m=cfg.NAV2_MAP_PADDING_M,
+            bounds_gdf=_wfs_gdf(ctx, cfg.NAV2_MAP_BOUNDS_GML_KEY),
+            free_space_gdf=ctx.get('alpha_shape_gdf')
+        )
+        if success_step7:
+            ctx['nav2_map_yaml_path'] = str(nav2_map_output_dir / f"{cfg.NAV2_MAP_OUTPUT_BASENAME}.yaml")
+            return True
+    except Exception as e_nav_map:
+        print(f"ERROR during Step 7 (Nav2 Map Generation): {e_nav_map}")
+        traceback.print_exc()
+    return False
+
+def run_step7b_waypoints(ctx):
+    cfg = ctx['cfg']
+    csv_file = ctx['csv_path']
+    ctx['waypoints_yaml_path'] = None
+    obj_local_frame_origin_world_xy = ctx['obj_local_frame_origin_world_xy']
+    # In tiled runs the shared local frame of the tiles takes the place of the single transformed OBJ
+    step6b_info_available = bool(ctx.get('transformed_obj_path') or ctx.get('tiles_index_path')) and \
+        obj_local_frame_origin_world_xy is not None and \
+        ctx['obj_original_min_z_world'] is not None
+
+    if not Path(csv_file).exists():
+        print(f"Skipping Step 7b (Waypoints YAML): Input CSV file '{csv_file}' not found.")
+        return False
+    if not step6b_info_available:
+        print("Skipping Step 7b (Waypoints YAML): Required info from Step 6b (OBJ transformation) not available.")
+        return False
+
+    print("\n=== STEP 7b: Generating Nav2 Waypoints YAML ===")
+    try:
+        # Convert Euler angles from degrees to radians for the function
+        roll_rad = math.radians(cfg.WAYPOINTS_DEFAULT_ORIENTATION_EULER_DEG[0])
+        pitch_rad = math.radians(cfg.WAYPOINTS_DEFAULT_ORIENTATION_EULER_DEG[1])
+        yaw_rad = math.radians(cfg.WAYPOINTS_DEFAULT_ORIENTATION_EULER_DEG[2])
+        default_orientation_rad = [roll_rad, pitch_rad, yaw_rad]
+
+        # Waypoints Z in local frame = base Z of the transformed OBJ
+        waypoint_z_local = cfg.TRANSFORM_Z_ADDITIONAL_OFFSET
+
+        waypoints_output_path = ctx['output_dir'] / cfg.NAV2_MAP_OUTPUT_SUBDIR / cfg.WAYPOINTS_OUTPUT_YAML_FILENAME
+
+        from step7b_generate_waypoints_yaml import generate_waypoints_yaml
+        success_step7b = generate_waypoints_yaml(
+            csv_path_str=csv_file,
+            source_crs_str=cfg.SOURCE_CRS,
+            intermediate_crs_str=cfg.TARGET_CRS,
+            obj_local_frame_origin_world_xy=obj_local_frame_origin_world_xy,
+            waypoint_z_in_local_frame=waypoint_z_local,
+            output_yaml_path_str=str(waypoints_output_path),
+            default_orientation_euler_rad=default_orientation_rad,
+            map_frame_id=cfg.WAYPOINTS_MAP_FRAME_ID
+        )
+        if success_step7b:
+            ctx['waypoints_yaml_path'] = str(waypoints_output_path)
+            print(f"Waypoints YAML saved to: {waypoints_output_path}")
+            return True
+        print("Waypoint YAML generation failed.")
+    except Exception as e_waypoints:
+        print(f"ERROR during Step 7b (Waypoints YAML Generation): {e_waypoints}")
+        traceback.print_exc()
+    return False
+
+def run_step8_gazebo_world(ctx):
+    cfg = ctx['cfg']
+    ctx['gazebo_world_path'] = None
+    ctx['gazebo_model_dir'] = None
+    gazebo_files_output_dir = ctx['output_dir'] / cfg.GAZEBO_OUTPUT_SUBDIR
+    transformed_obj_path_step6b = ctx['transformed_obj_path']
+    intermediate_obj_path_step6 = ctx['cut_obj_path']
+    intermediate_mtl_path_step6 = ctx['cut_mtl_path']
+    final_texture_path = ctx['final_texture_path']
 
     inputs_valid_for_gazebo = (
-        transformed_obj_created and
-        transformed_obj_path_step6b.exists() and
-        intermediate_mtl_path_step6.exists() and
-        (final_texture_path and Path(final_texture_path).exists()) and
-        intermediate_obj_path_step6.exists()
+        transformed_obj_path_step6b and Path(transformed_obj_path_step6b).exists() and
+        intermediate_mtl_path_step6 and Path(intermediate_mtl_path_step6).exists() and
+        final_texture_path and Path(final_texture_path).exists() and
+        intermediate_obj_path_step6 and Path(intermediate_obj_path_step6).exists()
     )
+    if not inputs_valid_for_gazebo:
+        print("Skipping Step 8 (Gazebo World Generation): Missing necessary input files from previous steps.")
+        return False
 
-    if inputs_valid_for_gazebo:
-        print("\n=== STEP 8: Generating Gazebo World Files ===")
-        gazebo_files_output_dir.mkdir(parents=True, exist_ok=True)
-        print(f"Gazebo files output directory: {gazebo_files_output_dir.resolve()}")
-        try:
-            success_step8 = create_gazebo_model_and_world(
-                transformed_obj_file_path=str(transformed_obj_path_step6b),
-                mtl_file_path=str(intermediate_mtl_path_step6),
-                texture_file_path=str(final_texture_path),
-                original_obj_for_origin_calc_path=str(intermediate_obj_path_step6),
-                original_obj_crs_str=TARGET_CRS, # <<< PASS THE CRS OF THE ORIGINAL OBJ
-                output_dir_str=str(gazebo_files_output_dir),
-                gazebo_model_name=GAZEBO_MODEL_NAME,
-                gazebo_world_filename=GAZEBO_WORLD_FILENAME
-            )
-            if success_step8:
-                gazebo_world_generated = True
-                print(f"Gazebo world and model files generated in: {gazebo_files_output_dir}")
-            else:
-                print("Gazebo world and model generation failed.")
-        except Exception as e_gazebo:
-            print(f"ERROR during Step 8 (Gazebo World Generation): {e_gazebo}")
-            import traceback; traceback.print_exc()
+    print("\n=== STEP 8: Generating Gazebo World Files ===")
+    gazebo_files_output_dir.mkdir(parents=True, exist_ok=True)
+    print(f"Gazebo files output directory: {gazebo_files_output_dir.resolve()}")
+    try:
+        from step8_generate_gazebo_world import create_gazebo_model_and_world
+        success_step8 = create_gazebo_model_and_world(
+            transformed_obj_file_path=str(transformed_obj_path_step6b),
+            mtl_file_path=str(intermediate_mtl_path_step6),
+            texture_file_path=str(final_texture_path),
+            original_obj_for_origin_calc_path=str(intermediate_obj_path_step6),
+            original_obj_crs_str=cfg.TARGET_CRS, # CRS of the original OBJ
+            output_dir_str=str(gazebo_files_output_dir),
+            gazebo_model_name=cfg.GAZEBO_MODEL_NAME,
+            gazebo_world_filename=cfg.GAZEBO_WORLD_FILENAME
+        )
+        if success_step8:
+            ctx['gazebo_world_path'] = str(gazebo_files_output_dir / cfg.GAZEBO_WORLD_FILENAME)
+            ctx['gazebo_model_dir'] = str(gazebo_files_output_dir / cfg.GAZEBO_MODEL_NAME)
+            print(f"Gazebo world and model files generated in: {gazebo_files_output_dir}")
+            return True
+        print("Gazebo world and model generation failed.")
+    except Exception as e_gazebo:
+        print(f"ERROR during Step 8 (Gazebo World Generation): {e_gazebo}")
+        traceback.print_exc()
+    return False
+
+def run_step_tiles(ctx):
+    cfg = ctx['cfg']
+    ctx['tiles_dir'] = None
+    ctx['tiles_index_path'] = None
+    ctx['obj_local_frame_origin_world_xy'] = None
+    ctx['obj_original_min_z_world'] = None
+    if not (ctx['fetched_wfs_gml_paths'].get(cfg.BASE_GML_KEY_FOR_CUT) and ctx['alpha_shape_gml_path']):
+        print("Skipping Tiled Steps 5-7: Base GML or alpha shape GML not available.")
+        return False
+
+    print("\n=== STEPS 5-7 (TILED): Texture, Cut Model and Nav2 Map per Tile ===")
+    try:
+        from tiling import run_tiled_steps
+        return run_tiled_steps(ctx)
+    except Exception as e_tiles:
+        print(f"ERROR during Tiled Steps 5-7: {e_tiles}")
+        traceback.print_exc()
+    return bool(ctx['tiles_index_path'])
+
+def _wfs_gdf(ctx, feature_type):
+    """
+    Returns the in-memory GeoDataFrame that Step 2a clipped for a feature type, or None.
+    It is not kept when Step 2a was restored from the artifact cache; the steps then read the GML file.
+    """
+    return (ctx.get('fetched_wfs_gdfs') or {}).get(feature_type)
+
+def _cache_params(cfg, *names, **extra):
+    """Collects the configuration constants (and extra values) that make up a step's artifact cache key."""
+    return dict({name: getattr(cfg, name) for name in names}, **extra)
+
+def _fetch_epoch(ttl_s):
+    """
+    Number of the ttl_s-long period we are in, for the cache key of steps that download data:
+    the key changes once per period, so their cached outputs are fetched again. None = never.
+    """
+    return int(time.time() // ttl_s) if ttl_s else 0
+
+def build_pipeline_steps(cfg):
+    """
+    Declares the pipeline as a DAG. Dependencies follow from the context keys:
+    e.g. Step 5 (WMS texture) only needs the 2a GML, so it runs alongside Steps 3/4,
+    and Steps 7, 7b and 8 only wait for the 6b outputs they consume.
+    With TILING_ENABLED, Steps 5-7 run as one tiled step 'T' (see tiling.py) and Step 8 is left out.
+    The cache parameters list every constant that changes a step's outputs; the steps that
+    download data also get a fetch epoch, so their cached outputs expire (see _fetch_epoch).
+    """
+    steps = [
+        PipelineStep('1', run_step1_hull, title="Convex Hull", fatal=True,
+                     requires=('csv_path',), provides=('hull_gpkg_path',),
+                     cache_files=('csv_path',),
+                     cache_params=_cache_params(cfg, 'SOURCE_CRS', 'TARGET_CRS', 'BUFFER_METERS_FOR_HULL', 'OUTPUT_HULL_GPKG',
+                                                'HULL_CLUSTER_DISTANCE_M')),
+        PipelineStep('2a', run_step2a_wfs, title="WFS Fetch",
+                     requires=('hull_gpkg_path',), provides=('fetched_wfs_gml_paths', 'fetched_wfs_gdfs'),
+                     transient=('fetched_wfs_gdfs',),
+                     cache_params=_cache_params(cfg, 'WFS_URL', 'WFS_FEATURE_TYPES', 'TARGET_CRS', 'WFS_PROPERTY_NAMES',
+                                                'WFS_SPATIAL_FILTER', 'WFS_GEOMETRY_PROPERTY', 'WFS_NAMESPACES',
+                                                'WFS_TILE_SIZE_M', 'WFS_PAGE_SIZE',
+                                                wfs_fetch_epoch=_fetch_epoch(cfg.WFS_CACHE_TTL_S))),
+        PipelineStep('3', run_step3_analyze_gml, title="GML Analysis",
+                     requires=('fetched_wfs_gml_paths', 'fetched_wfs_gdfs', 'hull_gpkg_path'),
+                     provides=('sampled_points_xy', 'sampled_points_npy_path', 'sampled_points_csv_path'),
+                     transient=('sampled_points_xy',),
+                     cache_params=_cache_params(cfg, 'WFS_FEATURE_TYPES', 'ANALYSIS_OFFSET_METERS', 'POINT_SAMPLE_INTERVAL_METERS',
+                                                   'ANALYSIS_MIN_COMPONENT_LINES', 'ANALYSIS_MIN_COMPONENT_LENGTH_M',
+                                                   'POINT_SAMPLING_MODE', 'POINT_SAMPLE_MAX_DEVIATION_M', 'POINT_SAMPLE_MAX_SPACING_M')),
+        PipelineStep('4', run_step4_alpha_shape, title="Alpha Shape",
+                     requires=('sampled_points_xy', 'sampled_points_npy_path', 'sampled_points_csv_path'), provides=('alpha_shape_gml_path', 'alpha_shape_gdf'),
+                     transient=('alpha_shape_gdf',),
+                     cache_params=_cache_params(cfg, 'TARGET_CRS', 'ALPHA_SHAPE_PARAMETER', 'ALPHA_DEFAULT_IF_OPTIMIZE_FAILS',
+                                                'ALPHA_SHAPE_OUTPUT_GML')),
+    ]
+    step5_cache_params = ('TEXTURE_SOURCE_GML_KEY', 'OUTPUT_TEXTURE_FILENAME', 'CUT_MODEL_OUTPUT_SUBDIR',
+                          'WMS_TEXTURE_URL', 'WMS_TEXTURE_LAYER', 'WMS_TEXTURE_VERSION', 'WMS_TEXTURE_FORMAT',
+                          'WMS_TEXTURE_WIDTH', 'WMS_TEXTURE_HEIGHT', 'WMS_TEXTURE_TARGET_CRS',
+                          'WMS_BBOX_PADDING_METERS', 'TARGET_CRS', 'TEXTURE_FILL_COLOR_RGB')
+    step6_cache_params = ('BASE_GML_KEY_FOR_CUT', 'TARGET_CRS', 'BASE_EXTRUSION_CUT_M', 'TOOL_EXTRUSION_CUT_M',
+                          'CUT_SIMPLIFY_TOLERANCE_M', 'CUT_OBJ_OUTPUT_FILENAME', 'CUT_MTL_OUTPUT_FILENAME',
+                          'CUT_MODEL_OUTPUT_SUBDIR', 'OUTPUT_TEXTURE_FILENAME', 'CONVERT_GENERATE_VT',
+                          'CONVERT_Z_TOLERANCE', 'CONVERT_MATERIAL_TOP', 'CONVERT_MATERIAL_BOTTOM',
+                          'CONVERT_MATERIAL_SIDES')
+    step7_cache_params = ('NAV2_MAP_BOUNDS_GML_KEY', 'NAV2_MAP_OUTPUT_BASENAME', 'NAV2_MAP_RESOLUTION',
+                          'NAV2_MAP_PADDING_M', 'NAV2_MAP_OUTPUT_SUBDIR', 'TRANSFORM_Z_ADDITIONAL_OFFSET')
+    step7b_cache_params = ('SOURCE_CRS', 'TARGET_CRS', 'NAV2_MAP_OUTPUT_SUBDIR', 'WAYPOINTS_OUTPUT_YAML_FILENAME',
+                           'WAYPOINTS_DEFAULT_ORIENTATION_EULER_DEG', 'WAYPOINTS_MAP_FRAME_ID',
+                           'TRANSFORM_Z_ADDITIONAL_OFFSET')
+    if cfg.TILING_ENABLED:
+        steps += [
+            PipelineStep('T', run_step_tiles, title="Tiled Steps 5-7",
+                         requires=('fetched_wfs_gml_paths', 'fetched_wfs_gdfs', 'alpha_shape_gml_path', 'alpha_shape_gdf', 'csv_path'),
+                         provides=('tiles_dir', 'tiles_index_path', 'obj_local_frame_origin_world_xy', 'obj_original_min_z_world'),
+                         cache_files=('csv_path',),
+                         cache_params=_cache_params(cfg, *step5_cache_params, *step6_cache_params, *step7_cache_params,
+                                                    'MARK_DEFECTS_ON_TEXTURE', 'TRANSFORM_Z_ADDITIONAL_OFFSET',
+                                                    'TRANSFORMED_OBJ_OUTPUT_FILENAME', 'TILE_SIZE_M', 'TILE_OVERLAP_M',
+                                                    'TILES_OUTPUT_SUBDIR', 'TILES_INDEX_FILENAME', 'WAYPOINTS_MAP_FRAME_ID',
+                                                    wms_fetch_epoch=_fetch_epoch(cfg.WMS_CACHE_TTL_S))),
+            PipelineStep('7b', run_step7b_waypoints, title="Waypoints YAML",
+                         requires=('tiles_index_path', 'obj_local_frame_origin_world_xy', 'obj_original_min_z_world', 'csv_path'),
+                         provides=('waypoints_yaml_path',),
+                         cache_files=('csv_path',),
+                         cache_params=_cache_params(cfg, *step7b_cache_params)),
+        ]
     else:
-        print("Skipping Step 8 (Gazebo World Generation): Missing necessary input files from previous steps.")
+        steps += _untiled_model_steps(cfg, step5_cache_params, step6_cache_params, step7_cache_params, step7b_cache_params)
+    if cfg.RUN_OSM_FETCH: # Listed right after 2a: both only need the hull, so the two downloads run concurrently
+        steps.insert(2, PipelineStep('2b', run_step2b_osm, title="OSM Fetch",
+                                     requires=('hull_gpkg_path',), provides=('osm_gpkg_path',),
+                                     cache_params=_cache_params(cfg, 'TARGET_CRS', 'OSM_OUTPUT_GPKG', 'OSM_PBF_PATH', # Overpass data ages like the WFS
+                                                                osm_fetch_epoch=0 if cfg.OSM_PBF_PATH else _fetch_epoch(cfg.WFS_CACHE_TTL_S))))
+    return steps
+
+def _untiled_model_steps(cfg, step5_cache_params, step6_cache_params, step7_cache_params, step7b_cache_params):
+    """Steps 5-8 for a single model of the whole AOI."""
+    return [
+        PipelineStep('5', run_step5_texture, title="Texture Generation",
+                     requires=('fetched_wfs_gml_paths', 'fetched_wfs_gdfs'),
+                     provides=('base_texture_path_str', 'cropped_texture_transform', 'cropped_texture_crs_obj'),
+                     cache_params=_cache_params(cfg, *step5_cache_params, wms_fetch_epoch=_fetch_epoch(cfg.WMS_CACHE_TTL_S))),
+        PipelineStep('5b', run_step5b_mark_defects, title="Defect Marking",
+                     requires=('base_texture_path_str', 'cropped_texture_transform', 'cropped_texture_crs_obj', 'csv_path'),
+                     provides=('final_texture_path',),
+                     cache_files=('csv_path',),
+                     cache_params=_cache_params(cfg, 'MARK_DEFECTS_ON_TEXTURE')),
+        PipelineStep('6', run_step6_cut_model, title="Cut OBJ Model",
+                     requires=('fetched_wfs_gml_paths', 'fetched_wfs_gdfs', 'alpha_shape_gml_path', 'alpha_shape_gdf', 'base_texture_path_str'),
+                     provides=('cut_obj_path', 'cut_mtl_path'),
+                     cache_exclude=('base_texture_path_str',), # Only the texture file name goes into the MTL
+                     cache_params=_cache_params(cfg, *step6_cache_params)),
+        PipelineStep('6b', run_step6b_transform_obj, title="OBJ Transformation",
+                     requires=('cut_obj_path',),
+                     provides=('transformed_obj_path', 'obj_local_frame_origin_world_xy', 'obj_original_min_z_world'),
+                     cache_params=_cache_params(cfg, 'TRANSFORM_Z_ADDITIONAL_OFFSET', 'TRANSFORMED_OBJ_OUTPUT_FILENAME')),
+        PipelineStep('7', run_step7_nav2_map, title="Nav2 Map",
+                     requires=('fetched_wfs_gml_paths', 'fetched_wfs_gdfs', 'alpha_shape_gml_path', 'alpha_shape_gdf',
+                               'transformed_obj_path', 'obj_local_frame_origin_world_xy'),
+                     provides=('nav2_map_yaml_path',),
+                     cache_params=_cache_params(cfg, *step7_cache_params)),
+        PipelineStep('7b', run_step7b_waypoints, title="Waypoints YAML",
+                     requires=('transformed_obj_path', 'obj_local_frame_origin_world_xy', 'obj_original_min_z_world', 'csv_path'),
+                     provides=('waypoints_yaml_path',),
+                     cache_files=('csv_path',),
+                     cache_params=_cache_params(cfg, *step7b_cache_params)),
+        PipelineStep('8', run_step8_gazebo_world, title="Gazebo World",
+                     requires=('transformed_obj_path', 'cut_obj_path', 'cut_mtl_path', 'final_texture_path'),
+                     provides=('gazebo_world_path', 'gazebo_model_dir'),
+                     cache_params=_cache_params(cfg, 'TARGET_CRS', 'GAZEBO_OUTPUT_SUBDIR', 'GAZEBO_MODEL_NAME', 'GAZEBO_WORLD_FILENAME')),
+    ]
+
+def run_pipeline(csv_file=None, output_dir_base=None, config_overrides=None, resume=False):
+    """
+    Runs the whole pipeline for one defect CSV.
+    With resume=True, steps that completed in the previous run into the same output directory
+    (see RUN_MANIFEST_FILENAME) are restored instead of run, unless their inputs changed.
+
+    Returns:
+        tuple: (status_by_step_id, run_context)
+    """
+    cfg = load_config(config_overrides)
+    csv_file = csv_file or cfg.CSV_FILE
+    print("--- Orchestrator Script Start ---")
+    start_time_script = time.time()
+
+    output_dir = Path(output_dir_base or cfg.OUTPUT_DIR_BASE)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    print(f"All outputs will be saved in: {output_dir.resolve()}")
+
+    # --- Setup for Step 5, 6, 6b, 8 ---
+    final_model_output_dir = output_dir / cfg.CUT_MODEL_OUTPUT_SUBDIR # e.g. output_project/cut_model_output/
+    final_model_output_dir.mkdir(parents=True, exist_ok=True)
+    print(f"\nModel outputs (OBJ/MTL/PNG) will be in: {final_model_output_dir.resolve()}")
+
+    ctx = {
+        'cfg': cfg,
+        'csv_path': str(csv_file),
+        'output_dir': output_dir,
+        'final_model_output_dir': final_model_output_dir,
+    }
+
+    max_workers = cfg.SCHEDULER_MAX_WORKERS
+    if max_workers > 1:
+        if cfg.SHOW_PLOTS_ALL_STEPS:
+            print("Interactive plots need the main thread. Running steps sequentially.")
+            max_workers = 1
+        else:
+            from helpers import use_headless_plotting
+            use_headless_plotting()
+    cache = ArtifactCache(cfg.ARTIFACT_CACHE_DIR) if cfg.ARTIFACT_CACHE_ENABLED else None
+    manifest = RunManifest(output_dir / cfg.RUN_MANIFEST_FILENAME, output_dir, resume=resume)
+    scheduler = StepScheduler(build_pipeline_steps(cfg), max_workers=max_workers, cache=cache, manifest=manifest)
+    scheduler.describe()
+    profiler = None
+    if cfg.RUN_REPORT_ENABLED:
+        profiler = RunProfiler(run_name="pipeline", sample_interval_s=cfg.RUN_REPORT_SAMPLE_INTERVAL_S,
+                               trace_malloc=cfg.RUN_REPORT_TRACEMALLOC)
+        profiler.start(csv_path=str(csv_file), output_dir=str(output_dir), max_workers=max_workers, resume=resume)
+    import http_session
+    import transformer_cache
+    http_session.configure(retries=cfg.HTTP_RETRIES, backoff_base_s=cfg.HTTP_BACKOFF_BASE_S, backoff_max_s=cfg.HTTP_BACKOFF_MAX_S,
+                           hedge_percentile=cfg.HTTP_HEDGE_PERCENTILE, hedge_min_samples=cfg.HTTP_HEDGE_MIN_SAMPLES,
+                           pool_maxsize=cfg.HTTP_POOL_MAXSIZE,
+                           hedge_workers=2 * (cfg.WFS_MAX_WORKERS + 1)) # Each WFS worker and the WMS request, with their duplicates
+    http_session.reset_metrics() # Latencies of earlier runs are dropped too; hedging restarts after HTTP_HEDGE_MIN_SAMPLES
+    transformer_stats_before = transformer_cache.cache_stats()
+    try:
+        status = scheduler.run(ctx)
+    finally:
+        if profiler is not None: profiler.stop()
+    transformer_stats = transformer_cache.stats_delta(transformer_stats_before, transformer_cache.cache_stats())
+    http_metrics = http_session.metrics()
 
     end_time_script = time.time()
     print(f"\n--- Orchestrator Script Complete ---")
     print(f"Total execution time: {end_time_script - start_time_script:.2f} seconds")
+    print("Step status: " + ", ".join(f"{step_id}={status[step_id]}" for step_id in scheduler.order))
+    print(f"CRS transformers: {transformer_stats['hits']} cache hits, {transformer_stats['misses']} built "
+          f"in {transformer_stats['build_s']:.3f}s")
+    for host, m in http_metrics.items():
+        print(f"HTTP {host}: {m['requests']} requests, {m['bytes'] / 1e6:.1f} MB, p50 {m['latency_p50_s']}s, p95 {m['latency_p95_s']}s, "
+              f"{m['retries']} retries, {m['failures']} failures, {m['hedged']} hedged ({m['hedge_wins']} won)")
+    if profiler is not None:
+        profiler.root.attrs['status'] = dict(status)
+        profiler.root.attrs['transformer_cache'] = transformer_stats
+        profiler.root.attrs['http'] = http_metrics
+        profiler.print_summary()
+        try:
+            ctx['run_report_path'] = profiler.write_report(output_dir / cfg.RUN_REPORT_FILENAME)
+            ctx['run_trace_path'] = profiler.write_chrome_trace(output_dir / cfg.RUN_TRACE_FILENAME)
+            print(f"Run report: {ctx['run_report_path']} (trace: {ctx['run_trace_path']})")
+        except Exception as e: print(f"  Warning: Could not write run report: {e}")
     print(f"Main output directory: {output_dir.resolve()}")
 
-    if transformed_obj_created:
+    final_texture_path = ctx.get('final_texture_path') or ctx.get('base_texture_path_str')
+    if ctx.get('transformed_obj_path'):
         print(f"Final transformed OBJ model output directory: {final_model_output_dir.resolve()}")
-        print(f"  Transformed OBJ: {transformed_obj_path_step6b.name}")
-        print(f"  Associated MTL: {intermediate_mtl_path_step6.name}") # Still points to the original MTL name
+        print(f"  Transformed OBJ: {Path(ctx['transformed_obj_path']).name}")
+        print(f"  Associated MTL: {Path(ctx['cut_mtl_path']).name}") # Still points to the original MTL name
         print(f"  Associated Texture: {Path(final_texture_path).name}")
-    elif cut_model_generated_step6:
+    elif ctx.get('cut_obj_path'):
         print(f"Intermediate (untransformed) OBJ model output directory: {final_model_output_dir.resolve()}")
-        print(f"  Untransformed OBJ: {intermediate_obj_path_step6.name}")
-        print(f"  Associated MTL: {intermediate_mtl_path_step6.name}")
+        print(f"  Untransformed OBJ: {Path(ctx['cut_obj_path']).name}")
+        print(f"  Associated MTL: {Path(ctx['cut_mtl_path']).name}")
         print(f"  Associated Texture: {Path(final_texture_path).name}")
 
-    if nav2_map_generated: print(f"Nav2 Map output directory: {nav2_map_output_dir.resolve()}")
-    if gazebo_world_generated: print(f"Gazebo files output directory: {gazebo_files_output_dir.resolve()}")
+    if ctx.get('tiles_index_path'): print(f"Tiled outputs (textures, OBJ chunks, Nav2 maps): {Path(ctx['tiles_index_path']).resolve()}")
+    if ctx.get('nav2_map_yaml_path'): print(f"Nav2 Map output directory: {Path(ctx['nav2_map_yaml_path']).parent.resolve()}")
+    if ctx.get('gazebo_world_path'): print(f"Gazebo files output directory: {Path(ctx['gazebo_world_path']).parent.resolve()}")
+    return status, ctx
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Run the pipeline for one defect CSV.")
+    parser.add_argument('--csv', default=None, help="Defect CSV (default: CSV_FILE).")
+    parser.add_argument('--output-dir', default=None, help="Output directory (default: OUTPUT_DIR_BASE).")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue the previous run in the output directory from its first incomplete step.")
+    parser.add_argument('--offline', action='store_true', help="No network: WFS data from the WFS cache only, OSM streets from OSM_PBF_PATH only (WFS_OFFLINE).")
+    args = parser.parse_args()
+    run_pipeline(csv_file=args.csv, output_dir_base=args.output_dir, resume=args.resume,
+                 config_overrides={'WFS_OFFLINE': True} if args.offline else None)
 
 if __name__ == '__main__':
     if not Path(CSV_FILE).exists():
@@ -517,4 +919,4 @@ if __name__ == '__main__':
         print(f"Creating dummy '{CSV_FILE}' for testing.")
         dummy_data = {'latitude': [51.87101360965492], 'longitude': [7.286309500176276]}
         pd.DataFrame(dummy_data).to_csv(CSV_FILE, index=False)
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+# osm_pbf_index.py
+"""
+Persistent spatial index of the drivable streets in a local OpenStreetMap extract (.osm.pbf),
+so Step 2b can run without the Overpass API.
+
+The extract is streamed once with pyosmium (node locations are resolved while reading) and the
+ways that osmnx's 'drive' network would keep are stored in SQLite: their tags and WGS84 geometry
+in a table, their bounding boxes in an R*Tree. A hull query then reads only the ways whose bbox
+intersects it, instead of the whole extract. The index lives next to the extract
+(<extract>.ways.sqlite) and is rebuilt when the extract changes (size or modification time).
+"""
+import os
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+
+# Bump when the layout of the tables or the way filter changes; older index files are rebuilt.
+INDEX_SCHEMA_VERSION = 1
+BUILD_BATCH_WAYS = 10000
+INDEX_SUFFIX = '.ways.sqlite'
+
+# Tag filter of osmnx's network_type='drive'
+_EXCLUDED_HIGHWAY = frozenset({'abandoned', 'bridleway', 'bus_guideway', 'construction', 'corridor', 'cycleway', 'elevator',
+                               'escalator', 'footway', 'no', 'path', 'pedestrian', 'planned', 'platform', 'proposed',
+                               'raceway', 'razed', 'service', 'steps', 'track'})
+_EXCLUDED_SERVICE = frozenset({'alley', 'driveway', 'emergency_access', 'parking', 'parking_aisle', 'private'})
+_ONEWAY_VALUES = frozenset({'yes', 'true', '1', '-1', 'reverse'})
+
+_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE ways (
+    osmid INTEGER PRIMARY KEY,
+    highway TEXT NOT NULL, name TEXT, oneway INTEGER NOT NULL, maxspeed TEXT, lanes TEXT,
+    geometry BLOB NOT NULL -- WKB LineString, EPSG:4326 (lon, lat)
+);
+CREATE VIRTUAL TABLE way_bounds USING rtree (osmid, minx, maxx, miny, maxy);
+"""
+
+
+def is_drivable(tags):
+    """True for the ways osmnx keeps in a 'drive' network (tags: mapping of OSM tags)."""
+    highway = tags.get('highway')
+    return (highway is not None and highway not in _EXCLUDED_HIGHWAY and tags.get('area') != 'yes'
+            and tags.get('motor_vehicle') != 'no' and tags.get('motorcar') != 'no'
+            and tags.get('access') != 'private' and tags.get('service') not in _EXCLUDED_SERVICE)
+
+def is_oneway(tags):
+    """oneway as osmnx reports it: a oneway tag meaning one direction, or a roundabout."""
+    return tags.get('oneway') in _ONEWAY_VALUES or tags.get('junction') == 'roundabout'
+
+
+def _source_signature(pbf_path):
+    stat = os.stat(pbf_path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class OSMWayIndex:
+    """Street index of one .osm.pbf extract. Queries may run from several threads and processes."""
+    def __init__(self, pbf_path, index_path=None):
+        """index_path: SQLite file of the index; None = <pbf_path>.ways.sqlite."""
+        self.pbf_path = Path(pbf_path)
+        self.index_path = Path(index_path) if index_path else self.pbf_path.with_name(self.pbf_path.name + INDEX_SUFFIX)
+
+    def is_current(self):
+        """True if the index file exists and was built from the extract as it is now."""
+        if not self.index_path.is_file(): return False
+        try:
+            with closing(sqlite3.connect(self.index_path)) as conn:
+                if conn.execute("PRAGMA user_version").fetchone()[0] != INDEX_SCHEMA_VERSION: return False
+                row = conn.execute("SELECT value FROM meta WHERE key='source'").fetchone()
+        except sqlite3.DatabaseError:
+            return False
+        return row is not None and row[0] == _source_signature(self.pbf_path)
+
+    def ensure_built(self):
+        """Builds the index unless it is current. Returns True if it was (re)built."""
+        if self.is_current(): return False
+        self.build()
+        return True
+
+    def build(self, node_index='flex_mem'):
+        """
+        Streams the extract and writes the index. It is written to a temporary file and moved into
+        place, so concurrent readers never see a partial index. node_index is pyosmium's node
+        location store ('flex_mem' suits regional extracts; 'dense_file_array,<file>' saves memory).
+
+        Returns:
+            int: number of indexed ways.
+        """
+        import osmium
+        from shapely import to_wkb
+        from shapely.geometry import LineString
+        if not self.pbf_path.is_file(): raise FileNotFoundError(f"OSM extract not found: {self.pbf_path}")
+        print(f"  Building OSM street index {self.index_path} from {self.pbf_path} (one pass over the extract)...")
+        signature = _source_signature(self.pbf_path)
+        tmp_path = self.index_path.with_name(f"{self.index_path.name}.tmp-{os.getpid()}")
+        tmp_path.unlink(missing_ok=True)
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+
+        class WayCollector(osmium.SimpleHandler):
+            def __init__(self, conn):
+                super().__init__()
+                self.conn, self.rows, self.n_ways = conn, [], 0
+
+            def way(self, w):
+                tags = w.tags
+                if not is_drivable(tags): return
+                try: coords = [(n.lon, n.lat) for n in w.nodes]
+                except osmium.InvalidLocationError: return # Node outside the extract
+                if len(coords) < 2: return
+                self.rows.append((w.id, tags.get('highway'), tags.get('name'), int(is_oneway(tags)), tags.get('maxspeed'),
+                                  tags.get('lanes'), to_wkb(LineString(coords))))
+                if len(self.rows) >= BUILD_BATCH_WAYS: self.flush()
+
+            def flush(self):
+                self.conn.executemany("INSERT OR REPLACE INTO ways VALUES (?,?,?,?,?,?,?)", self.rows)
+                self.n_ways += len(self.rows)
+                self.rows = []
+
+        try:
+            with closing(sqlite3.connect(tmp_path)) as conn:
+                conn.executescript(_SCHEMA)
+                collector = WayCollector(conn)
+                collector.apply_file(str(self.pbf_path), locations=True, idx=node_index)
+                collector.flush()
+                self._fill_bounds(conn)
+                conn.execute("INSERT INTO meta VALUES ('source', ?)", (signature,))
+                conn.execute(f"PRAGMA user_version = {INDEX_SCHEMA_VERSION}")
+                conn.commit()
+            os.replace(tmp_path, self.index_path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        print(f"  OSM street index built: {collector.n_ways} drivable ways.")
+        return collector.n_ways
+
+    @staticmethod
+    def _fill_bounds(conn):
+        """Fills the R*Tree from the stored geometries (SQLite rounds its float32 bounds outwards)."""
+        from shapely import bounds, from_wkb
+        cursor = conn.execute("SELECT osmid, geometry FROM ways")
+        while True:
+            rows = cursor.fetchmany(BUILD_BATCH_WAYS)
+            if not rows: break
+            way_bounds = bounds(from_wkb([geometry for _, geometry in rows]))
+            conn.executemany("INSERT INTO way_bounds VALUES (?,?,?,?,?)",
+                             [(osmid, b[0], b[2], b[1], b[3]) for (osmid, _), b in zip(rows, way_bounds.tolist())])
+
+    def query(self, polygon_4326):
+        """
+        Streets whose geometry intersects polygon_4326 (a shapely geometry in EPSG:4326).
+
+        Returns:
+            geopandas.GeoDataFrame: 'osmid', 'highway', 'name', 'oneway', 'maxspeed', 'lanes' and
+            the LineString geometry, in EPSG:4326 (one row per way).
+        """
+        import geopandas as gpd
+        import shapely
+        minx, miny, maxx, maxy = polygon_4326.bounds
+        with closing(sqlite3.connect(self.index_path)) as conn:
+            rows = conn.execute("SELECT w.osmid, w.highway, w.name, w.oneway, w.maxspeed, w.lanes, w.geometry"
+                                " FROM way_bounds b JOIN ways w ON w.osmid = b.osmid"
+                                " WHERE b.minx <= ? AND b.maxx >= ? AND b.miny <= ? AND b.maxy >= ?"
+                                " ORDER BY w.osmid", (maxx, minx, maxy, miny)).fetchall()
+        columns = ['osmid', 'highway', 'name', 'oneway', 'maxspeed', 'lanes']
+        geometries = shapely.from_wkb([row[6] for row in rows])
+        gdf = gpd.GeoDataFrame([dict(zip(columns, row[:6])) for row in rows], columns=columns,
+                               geometry=list(geometries), crs="EPSG:4326")
+        gdf['oneway'] = gdf['oneway'].astype(bool)
+        return gdf[gdf.geometry.intersects(polygon_4326)].reset_index(drop=True)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+# run_manifest.py
+"""
+Checkpoint file of a pipeline run, used to resume a run after a failed step.
+
+The scheduler records every step that completed together with the values it put into the
+run context (artifact paths, the texture affine/CRS from Step 5, the local frame origin
+from Step 6b, ...). Values are encoded with the artifact cache codec, but files are only
+referenced by their path inside the output directory, not copied.
+
+A step recorded in the manifest is resumed (its values are restored instead of running it)
+when its fingerprint still matches: the same step key the artifact cache uses, i.e. its
+configuration constants, input files and the fingerprints of the steps upstream. Changing a
+constant, the defect CSV, or re-running an upstream step therefore re-runs the step.
+"""
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from artifact_cache import encode_value, decode_value, NotCacheableError
+
+MANIFEST_FORMAT_VERSION = 1
+
+
+class RunManifest:
+    """
+    Step checkpoints of one output directory.
+
+    With resume=False an existing manifest is discarded and the run starts from scratch;
+    with resume=True its completed steps are available through restore().
+    """
+    def __init__(self, manifest_path, output_dir, resume=False):
+        self.path = Path(manifest_path)
+        self.output_dir = Path(output_dir)
+        self.steps = {}
+        if resume:
+            self._load()
+        elif self.path.is_file():
+            self.path.unlink() # Stale checkpoints of a previous run
+
+    def _load(self):
+        if not self.path.is_file():
+            print(f"  Note: No run manifest at {self.path}; running all steps.")
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('format') != MANIFEST_FORMAT_VERSION:
+                print(f"  Note: Run manifest {self.path} has an old format; running all steps.")
+                return
+            self.steps = data.get('steps') or {}
+            print(f"  Resuming from run manifest {self.path} ({len(self.steps)} completed step(s)).")
+        except Exception as e:
+            print(f"  Warning: Could not read run manifest {self.path}: {e}")
+
+    def restore(self, step_id, fingerprint):
+        """
+        Returns the recorded context values of a completed step, or None if the step has to run
+        (not recorded, different fingerprint, or one of its output files no longer exists).
+        """
+        entry = self.steps.get(step_id)
+        if fingerprint is None or entry is None or entry.get('fingerprint') != fingerprint:
+            return None
+        try:
+            return {name: decode_value(value, self.output_dir) for name, value in entry['values'].items()}
+        except Exception as e:
+            print(f"  Note: Step {step_id} cannot be resumed: {e}")
+            return None
+
+    def record(self, step_id, fingerprint, status, values):
+        """Records a completed step and rewrites the manifest. Returns False if it could not be recorded."""
+        if fingerprint is None:
+            self.discard(step_id)
+            return False
+        try:
+            encoded = {name: encode_value(value, self.output_dir) for name, value in values.items()}
+        except NotCacheableError as e:
+            print(f"  Note: Step {step_id} not checkpointed: {e}")
+            self.discard(step_id)
+            return False
+        self.steps[step_id] = {'fingerprint': fingerprint, 'status': status,
+                               'finished': time.strftime('%Y-%m-%dT%H:%M:%S'), 'values': encoded}
+        return self._write()
+
+    def discard(self, step_id):
+        """Forgets a step (e.g. because it failed in this run) so that a resumed run executes it."""
+        if self.steps.pop(step_id, None) is not None:
+            self._write()
+
+    def _write(self):
+        # Written to a temporary file and renamed, so a crash never leaves a truncated manifest
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix=f".{self.path.name}_", dir=self.path.parent)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'format': MANIFEST_FORMAT_VERSION, 'steps': self.steps}, f, indent=1)
+            os.replace(tmp_path, self.path)
+            return True
+        except Exception as e:
+            print(f"  Warning: Could not write run manifest {self.path}: {e}")
+            return False
@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*-
+# run_report.py
+"""
+Run instrumentation: spans with wall/CPU time, peak memory, disk I/O and network bytes.
+
+A RunProfiler is activated for the duration of a pipeline run. The scheduler wraps every step
+in a span and step modules mark their sub-phases with phase(); both are no-ops when no
+profiler is active, so the step modules still run standalone.
+
+At the end of a run the profiler writes a JSON report and a Chrome trace-event file
+(open in chrome://tracing or https://ui.perfetto.dev).
+
+Notes on the metrics:
+  - cpu_s is the CPU time of the thread that ran the span; process_cpu_s is the whole process
+    and includes concurrently running steps and native worker threads (GDAL, OCCT).
+  - peak_rss_mb / peak_traced_mb are sampled in the background while the span is open.
+    RSS is process-wide; traced memory is only collected when tracemalloc is enabled.
+  - io_read_bytes / io_write_bytes come from /proc/self/io (Linux only) and are process-wide,
+    so concurrent spans see each other's I/O.
+  - net_bytes_in / net_bytes_out are reported by the code doing the HTTP requests via
+    add_network_bytes() and are attributed to the current span of the calling thread and all
+    its ancestors. Pool threads working for a span attach() to it (captured with current_span()
+    when the work is submitted), otherwise their bytes only count for the run.
+"""
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import resource # Not available on Windows
+except ImportError:
+    resource = None
+
+_ACTIVE_PROFILER = None
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+_MB = 1024.0 * 1024.0
+
+
+def _read_rss_bytes():
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        if resource is None: return None
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 # Peak, in KB on Linux
+
+def _read_io_counters():
+    try:
+        counters = {}
+        with open('/proc/self/io', 'r') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                counters[key.strip()] = int(value)
+        return counters.get('read_bytes'), counters.get('write_bytes')
+    except (OSError, ValueError):
+        return None, None
+
+def _delta(end, start):
+    return end - start if end is not None and start is not None else None
+
+
+class Span:
+    """One timed region of the run. Created by RunProfiler.span() / phase()."""
+    def __init__(self, profiler, name, category, parent, attrs):
+        self.profiler = profiler
+        self.name = name
+        self.category = category
+        self.parent = parent
+        self.attrs = dict(attrs)
+        self.thread_name = threading.current_thread().name
+        self.thread_id = threading.get_ident()
+        self.is_phase = category == 'phase'
+        self.net_bytes_in = 0
+        self.net_bytes_out = 0
+        self.peak_rss = None
+        self.peak_traced = None
+        self.end_wall = None
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.thread_time()
+        self.start_process_cpu = time.process_time()
+        self.start_io = _read_io_counters()
+        self.sample_memory()
+
+    def sample_memory(self, rss=None, traced=None):
+        rss = _read_rss_bytes() if rss is None else rss
+        if rss is not None: self.peak_rss = max(self.peak_rss or 0, rss)
+        if traced is None and tracemalloc.is_tracing(): traced = tracemalloc.get_traced_memory()[0]
+        if traced is not None: self.peak_traced = max(self.peak_traced or 0, traced)
+
+    def finish(self):
+        if self.end_wall is not None: return
+        self.sample_memory()
+        self.end_wall = time.perf_counter()
+        self.cpu_s = time.thread_time() - self.start_cpu
+        self.process_cpu_s = time.process_time() - self.start_process_cpu
+        end_io = _read_io_counters()
+        self.io_read_bytes = _delta(end_io[0], self.start_io[0])
+        self.io_write_bytes = _delta(end_io[1], self.start_io[1])
+
+    @property
+    def wall_s(self):
+        return (self.end_wall if self.end_wall is not None else time.perf_counter()) - self.start_wall
+
+    def path(self):
+        names, span = [], self
+        while span is not None:
+            names.append(span.name)
+            span = span.parent
+        return " / ".join(reversed(names))
+
+    def to_dict(self, origin):
+        return {
+            'name': self.name,
+            'path': self.path(),
+            'category': self.category,
+            'thread': self.thread_name,
+            'start_s': round(self.start_wall - origin, 6),
+            'wall_s': round(self.wall_s, 6),
+            'cpu_s': round(getattr(self, 'cpu_s', 0.0), 6),
+            'process_cpu_s': round(getattr(self, 'process_cpu_s', 0.0), 6),
+            'peak_rss_mb': round(self.peak_rss / _MB, 2) if self.peak_rss is not None else None,
+            'peak_traced_mb': round(self.peak_traced / _MB, 2) if self.peak_traced is not None else None,
+            'io_read_bytes': getattr(self, 'io_read_bytes', None),
+            'io_write_bytes': getattr(self, 'io_write_bytes', None),
+            'net_bytes_in': self.net_bytes_in,
+            'net_bytes_out': self.net_bytes_out,
+            'attrs': self.attrs,
+        }
+
+
+class RunProfiler:
+    """
+    Collects spans for one pipeline run. Thread-safe: each thread keeps its own stack of open
+    spans, and spans opened in a thread without open spans become children of the run span.
+    """
+    def __init__(self, run_name="pipeline", sample_interval_s=0.05, trace_malloc=False):
+        self.run_name = run_name
+        self.sample_interval_s = sample_interval_s
+        self.trace_malloc = trace_malloc
+        self.spans = []
+        self.root = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._open_spans = set()
+        self._stop_event = threading.Event()
+        self._sampler = None
+        self._started_tracemalloc = False
+
+    # --- Lifecycle ---
+    def start(self, **attrs):
+        """Activates the profiler for this process and opens the run span."""
+        global _ACTIVE_PROFILER
+        if self.trace_malloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self.root = self._open(self.run_name, 'run', None, attrs)
+        self._stop_event.clear()
+        self._sampler = threading.Thread(target=self._sample_loop, name="run-report-sampler", daemon=True)
+        self._sampler.start()
+        _ACTIVE_PROFILER = self
+        return self
+
+    def stop(self):
+        """Closes every open span and deactivates the profiler."""
+        global _ACTIVE_PROFILER
+        if _ACTIVE_PROFILER is self:
+            _ACTIVE_PROFILER = None
+        self._stop_event.set()
+        if self._sampler is not None:
+            self._sampler.join(timeout=1.0)
+        with self._lock:
+            still_open = list(self._open_spans)
+        for span in still_open:
+            self._close(span)
+        if self.root is not None:
+            self._close(self.root)
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def _sample_loop(self):
+        while not self._stop_event.wait(self.sample_interval_s):
+            rss = _read_rss_bytes()
+            traced = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+            with self._lock:
+                open_spans = list(self._open_spans)
+            for span in open_spans:
+                span.sample_memory(rss, traced)
+
+    # --- Spans ---
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _open(self, name, category, parent, attrs):
+        span = Span(self, name, category, parent, attrs)
+        with self._lock:
+            self.spans.append(span)
+            self._open_spans.add(span)
+        return span
+
+    def _close(self, span):
+        span.finish()
+        with self._lock:
+            self._open_spans.discard(span)
+
+    def _end_phase(self, stack):
+        if stack and stack[-1].is_phase and stack[-1].thread_id == threading.get_ident(): # Not a phase attached from another thread
+            self._close(stack.pop())
+
+    @contextmanager
+    def span(self, name, category='step', **attrs):
+        stack = self._stack()
+        span = self._open(name, category, stack[-1] if stack else self.root, attrs)
+        stack.append(span)
+        try:
+            yield span
+        finally:
+            while stack and stack[-1] is not span: # Close phases still open inside this span
+                self._close(stack.pop())
+            if stack: stack.pop()
+            self._close(span)
+
+    def phase(self, name, **attrs):
+        """Ends the current phase (if any) in this thread and starts the next one."""
+        stack = self._stack()
+        self._end_phase(stack)
+        span = self._open(name, 'phase', stack[-1] if stack else self.root, attrs)
+        stack.append(span)
+        return span
+
+    def end_phase(self):
+        self._end_phase(self._stack())
+
+    def current_span(self):
+        """The innermost span open (or attached) in this thread, else the run span."""
+        stack = self._stack()
+        return stack[-1] if stack else self.root
+
+    @contextmanager
+    def attach(self, span):
+        """
+        Makes span, opened in another thread, the current span of this thread, so the bytes and
+        spans of work done here on its behalf (e.g. in a thread pool) are attributed to it.
+        """
+        stack = self._stack()
+        depth = len(stack)
+        stack.append(span)
+        try:
+            yield span
+        finally:
+            while len(stack) > depth + 1: # Close phases still open inside; the attached span stays open
+                self._close(stack.pop())
+            del stack[depth:]
+
+    def add_network_bytes(self, received=0, sent=0):
+        targets, span = [], self.current_span()
+        while span is not None: # The span and its ancestors, up to the run span
+            targets.append(span)
+            span = span.parent
+        with self._lock: # Ancestors are shared by all threads
+            for span in targets:
+                span.net_bytes_in += int(received or 0)
+                span.net_bytes_out += int(sent or 0)
+
+    # --- Output ---
+    def report(self):
+        """Returns the run report as a JSON-serializable dict."""
+        origin = self.root.start_wall if self.root is not None else 0.0
+        spans = [span.to_dict(origin) for span in self.spans]
+        return {
+            'run': self.run_name,
+            'attrs': self.root.attrs if self.root is not None else {},
+            'wall_s': round(self.root.wall_s, 6) if self.root is not None else None,
+            'tracemalloc': self.trace_malloc,
+            'spans': spans,
+        }
+
+    def write_report(self, path_str):
+        path = Path(path_str)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2, default=str)
+        return str(path)
+
+    def write_chrome_trace(self, path_str):
+        """Writes the spans as Chrome trace 'complete' events, one track per thread."""
+        origin = self.root.start_wall if self.root is not None else 0.0
+        pid = os.getpid()
+        events, thread_names = [], {}
+        for span in self.spans:
+            data = span.to_dict(origin)
+            thread_names.setdefault(span.thread_id, span.thread_name)
+            events.append({
+                'name': span.name, 'cat': span.category, 'ph': 'X', 'pid': pid, 'tid': span.thread_id,
+                'ts': round(data['start_s'] * 1e6, 3), 'dur': round(data['wall_s'] * 1e6, 3),
+                'args': {k: v for k, v in data.items() if k not in ('name', 'category', 'thread', 'start_s', 'wall_s')},
+            })
+        for tid, thread_name in thread_names.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': thread_name}})
+        path = Path(path_str)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, default=str)
+        return str(path)
+
+    def print_summary(self, categories=('step',)):
+        """Prints one line per span of the given categories."""
+        fmt_mb = lambda v: f"{v / _MB:.1f}" if v is not None else "-"
+        print(f"{'Span':<34} {'wall s':>8} {'cpu s':>8} {'peak RSS MB':>12} {'read MB':>9} {'write MB':>9} {'net MB':>8}")
+        for span in sorted(self.spans, key=lambda s: s.start_wall):
+            if span.category not in categories: continue
+            print(f"{span.name[:34]:<34} {span.wall_s:>8.2f} {getattr(span, 'cpu_s', 0.0):>8.2f} "
+                  f"{fmt_mb(span.peak_rss):>12} {fmt_mb(getattr(span, 'io_read_bytes', None)):>9} "
+                  f"{fmt_mb(getattr(span, 'io_write_bytes', None)):>9} {fmt_mb(span.net_bytes_in + span.net_bytes_out):>8}")
+
+
+# =============================================================================
+# Module-level helpers used by the steps (no-ops without an active profiler)
+# =============================================================================
+def active_profiler():
+    return _ACTIVE_PROFILER
+
+@contextmanager
+def span(name, category='step', **attrs):
+    profiler = _ACTIVE_PROFILER
+    if profiler is None:
+        yield None
+        return
+    with profiler.span(name, category, **attrs) as opened:
+        yield opened
+
+def phase(name, **attrs):
+    """Marks the start of a sub-phase; it lasts until the next phase() / end_phase() or the enclosing span ends."""
+    profiler = _ACTIVE_PROFILER
+    if profiler is not None:
+        profiler.phase(name, **attrs)
+
+def end_phase():
+    profiler = _ACTIVE_PROFILER
+    if profiler is not None:
+        profiler.end_phase()
+
+def current_span():
+    """The current span of this thread (to hand to attach() in pool threads), None without an active profiler."""
+    profiler = _ACTIVE_PROFILER
+    return profiler.current_span() if profiler is not None else None
+
+@contextmanager
+def attach(span):
+    """Attributes the work of this thread to span (from current_span()); a no-op for None or an inactive profiler."""
+    profiler = _ACTIVE_PROFILER
+    if span is None or profiler is None or span.profiler is not profiler:
+        yield span
+        return
+    with profiler.attach(span):
+        yield span
+
+def add_network_bytes(received=0, sent=0):
+    profiler = _ACTIVE_PROFILER
+    if profiler is not None:
+        profiler.add_network_bytes(received, sent)
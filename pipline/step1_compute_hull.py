@@ -1,75 +1,132 @@
 # -*- coding: utf-8 -*-
 import pandas as pd
 import geopandas as gpd
-from shapely.geometry import Point
-from shapely.ops import transform, unary_union
-import pyproj
+import numpy as np
+import shapely
 from pathlib import Path
+from defect_store import load_defects
 
-def compute_and_save_convex_hull(csv_path_str, source_crs_str, target_crs_str, buffer_m, output_hull_gpkg_str):
-    """Computes a convex hull around buffered points from a CSV and saves it as GeoPackage."""
+def buffered_convex_hull(coords, buffer_m):
+    """
+    Convex hull of the points buffered by buffer_m. This equals the convex hull of the union of
+    the individual point buffers (the buffer of a convex set is convex), at the cost of one buffer.
+    """
+    return shapely.convex_hull(shapely.multipoints(coords)).buffer(buffer_m)
+
+def cluster_points(coords, distance_m):
+    """
+    Grid-based clustering: the points are binned into distance_m cells, and occupied cells that
+    touch (including diagonally) form a cluster. Points closer than distance_m always share a
+    cluster; groups more than 2*sqrt(2)*distance_m apart are always separate.
+
+    Returns:
+        np.ndarray: cluster label (0..k-1) per point.
+    """
+    cells = np.floor((coords - coords.min(axis=0)) / distance_m).astype(np.int64) + 1 # >= 1, so neighbours are >= 0
+    n_rows = cells[:, 1].max() + 2
+    codes = cells[:, 0] * n_rows + cells[:, 1]
+    cell_codes, point_cells = np.unique(codes, return_inverse=True)
+    left, right = [], []
+    for dx, dy in ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1)): # Half of the 8-neighbourhood; pairs are made symmetric
+        neighbour_codes = cell_codes + dx * n_rows + dy
+        pos = np.minimum(np.searchsorted(cell_codes, neighbour_codes), len(cell_codes) - 1)
+        found = np.flatnonzero(cell_codes[pos] == neighbour_codes)
+        left += [found, pos[found]]
+        right += [pos[found], found]
+    cell_labels = _connected_labels(len(cell_codes), np.concatenate(left), np.concatenate(right))
+    return cell_labels[point_cells.ravel()]
+
+def _connected_labels(n, left, right):
+    """Connected components of n nodes joined by the (symmetric) pairs left[i]-right[i], labelled 0..k-1."""
+    labels = np.arange(n)
+    while True: # Propagate the smallest label over the pairs, with pointer jumping
+        new_labels = labels.copy()
+        np.minimum.at(new_labels, left, labels[right])
+        new_labels = new_labels[new_labels]
+        if np.array_equal(new_labels, labels): break
+        labels = new_labels
+    return np.unique(labels, return_inverse=True)[1]
+
+def clustered_convex_hulls(coords, buffer_m, distance_m):
+    """
+    One buffered convex hull per cluster of points (see cluster_points). Clusters whose hulls
+    overlap are merged, so no area is covered (and fetched) twice.
+
+    Returns:
+        list: (hull polygon, number of points) per cluster, largest first.
+    """
+    labels = cluster_points(coords, distance_m)
+    while True:
+        hulls = [buffered_convex_hull(coords[labels == label], buffer_m) for label in range(labels.max() + 1)]
+        left, right = shapely.STRtree(hulls).query(hulls, predicate='intersects')
+        if (left == right).all(): break
+        labels = _connected_labels(len(hulls), left, right)[labels]
+    counts = np.bincount(labels)
+    return sorted(zip(hulls, counts.tolist()), key=lambda item: -item[1])
+
+def compute_and_save_convex_hull(csv_path_str, source_crs_str, target_crs_str, buffer_m, output_hull_gpkg_str,
+                                 cluster_distance_m=None):
+    """
+    Computes a convex hull around buffered points from a defect file (CSV or Parquet, see
+    defect_store.py) and saves it as GeoPackage.
+    With cluster_distance_m, the points are clustered first and one hull per cluster is saved
+    (one feature each, with 'id' and 'n_defects'), so sparse campaigns don't cover the empty
+    territory between their clusters.
+    """
     print(f"--- Running: Convex Hull Computation ---")
     csv_path = Path(csv_path_str)
     output_hull_gpkg = Path(output_hull_gpkg_str)
 
-    print(f"Reading CSV: {csv_path}")
+    print(f"Reading defects: {csv_path}")
     try:
-        df = pd.read_csv(csv_path)
+        defects = load_defects(csv_path)
     except FileNotFoundError:
         print(f"ERROR: CSV file not found at {csv_path}")
         raise
     except Exception as e:
         print(f"ERROR: Failed to read CSV {csv_path}: {e}")
         raise
+    defects.require(points=True)
 
-    if not {'longitude', 'latitude'}.issubset(df.columns):
-        raise ValueError("CSV must contain 'longitude' and 'latitude' columns.")
-
-    print(f"Setting up projection transformation from {source_crs_str} to {target_crs_str}")
+    print(f"Projecting points from {source_crs_str} to {target_crs_str}")
     try:
-        project = pyproj.Transformer.from_crs(
-            pyproj.CRS.from_user_input(source_crs_str),
-            pyproj.CRS.from_user_input(target_crs_str),
-            always_xy=True
-        ).transform
+        coords, _ = defects.projected_points(source_crs_str, target_crs_str)
     except Exception as e:
         print(f"ERROR setting up CRS transformation: {e}")
         raise
+    skipped_count = len(defects) - len(coords)
+    if skipped_count > 0: print(f"  Skipped {skipped_count} rows due to invalid coordinates or projection errors.")
+    if len(coords) == 0:
+        raise RuntimeError("No valid points created from input rows. Check coordinates and CRS.")
 
-    buffers = []
-    print(f"Buffering points with {buffer_m} meters...")
-    skipped_count = 0
-    for index, row in df.iterrows():
-        try:
-            lon, lat = float(row['longitude']), float(row['latitude'])
-            p_t = transform(project, Point(lon, lat))
-            buf = p_t.buffer(buffer_m)
-            if buf.is_valid and not buf.is_empty: buffers.append(buf)
-            else: skipped_count += 1
-        except (ValueError, TypeError): skipped_count += 1
-        except Exception: skipped_count +=1
-    if skipped_count > 0: print(f"  Skipped {skipped_count} rows due to invalid coordinates or buffer errors.")
-
-    if not buffers:
-        raise RuntimeError("No valid buffers created from input points. Check coordinates and CRS.")
-
-    print(f"Created {len(buffers)} valid buffers.")
-    print("Merging buffers and computing convex hull...")
+    print(f"Projected {len(coords)} valid points.")
     try:
-        merged = unary_union(buffers) # More direct than GeoSeries for this
-        if not merged.is_valid: merged = merged.buffer(0)
-        if not merged.is_valid: raise ValueError("Failed to create valid merged buffer.")
-        hull = merged.convex_hull
-        if not hull.is_valid: hull = hull.buffer(0)
-        if not hull.is_valid: raise ValueError("Failed to create valid convex hull.")
+        if cluster_distance_m:
+            print(f"Clustering points (distance {cluster_distance_m} m) and buffering each cluster hull with {buffer_m} meters...")
+            hulls = clustered_convex_hulls(coords, buffer_m, cluster_distance_m)
+        else:
+            print(f"Computing convex hull and buffering it with {buffer_m} meters...")
+            hulls = [(buffered_convex_hull(coords, buffer_m), len(coords))]
+        features = []
+        for hull, n_defects in hulls:
+            if hull.is_empty:
+                raise RuntimeError("No valid buffers created from input points. Check coordinates and CRS.")
+            if not hull.is_valid: hull = hull.buffer(0)
+            if not hull.is_valid: raise ValueError("Failed to create valid convex hull.")
+            features.append({'id': len(features) + 1, 'n_defects': n_defects, 'geometry': hull})
     except Exception as e:
-        print(f"ERROR during buffer merge or hull computation: {e}")
+        print(f"ERROR during hull computation: {e}")
         raise
 
     print("Convex hull computation complete.")
-    
-    # Save the hull
-    hull_gdf = gpd.GeoDataFrame([{'id': 1, 'geometry': hull}], crs=target_crs_str)
+    if len(features) > 1:
+        total_area = sum(f['geometry'].area for f in features)
+        single_area = buffered_convex_hull(coords, buffer_m).area
+        print(f"  {len(features)} cluster hulls, {total_area / 1e6:.3f} km^2 in total "
+              f"(single hull: {single_area / 1e6:.3f} km^2).")
+
+    # Save the hull(s)
+    hull_gdf = gpd.GeoDataFrame(features, crs=target_crs_str)
     try:
         hull_gdf.to_file(output_hull_gpkg, driver="GPKG")
         print(f"Convex hull saved to: {output_hull_gpkg}")
@@ -94,4 +151,4 @@ if __name__ == '__main__':
         output_hull_gpkg_str=str(output_dir / 'convex_hull.gpkg')
     )
     if hull_file_path:
-        print(f"Test successful. Hull saved to {hull_file_path}")
\ No newline at end of file
+        print(f"Test successful. Hull saved to {hull_file_path}")
\ No newline at end of file
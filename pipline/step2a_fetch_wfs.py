@@ -1,97 +1,435 @@
 # -*- coding: utf-8 -*-
-import os
+import io
+import math
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import geopandas as gpd
-import pyproj
-from owslib.wfs import WebFeatureService
-from lxml import etree # For checking raw GML if GeoPandas fails
+import pandas as pd
+from shapely.geometry import box
+import run_report
+from tiling import make_tile_grid
+from transformer_cache import get_crs, reproject_gdf
+
+GML_OUTPUT_FORMAT = 'text/xml; subtype=gml/3.2.1'
+MAX_PAGES_PER_REQUEST_TILE = 1000 # Guards against servers that ignore startIndex
+GML_CHUNK_FEATURES = 2000 # Features parsed (and clipped) at a time while a response streams in
+FILTER_SIMPLIFY_TOLERANCE_M = 1.0 # Filter polygons are simplified outward to keep the request URL short
+FES_NAMESPACE = 'http://www.opengis.net/fes/2.0'
+GML_NAMESPACE = 'http://www.opengis.net/gml/3.2'
+_READ_BLOCK_BYTES = 64 * 1024 # Block size of the streamed response reads
+
+_GETFEATURE_URLS = {} # WFS URL -> GetFeature endpoint from its capabilities, kept for the process
+_CAPABILITIES_LOCK = threading.Lock()
+
+
+def get_getfeature_url(wfs_url, timeout_s=60):
+    """
+    GetFeature (KVP GET) endpoint of a WFS, read from its capabilities. GetCapabilities runs once
+    per WFS URL and process; concurrent callers wait for it. Raises if the WFS cannot be reached.
+    """
+    with _CAPABILITIES_LOCK:
+        if wfs_url not in _GETFEATURE_URLS:
+            from owslib.wfs import WebFeatureService
+            print(f"Connecting to WFS service: {wfs_url}")
+            with run_report.span("WFS GetCapabilities", category='phase'):
+                wfs = WebFeatureService(wfs_url, version="2.0.0", timeout=timeout_s)
+            get_methods = [m for m in wfs.getOperationByName('GetFeature').methods if str(m.get('type', '')).lower() == 'get']
+            _GETFEATURE_URLS[wfs_url] = get_methods[0]['url'] if get_methods else wfs_url
+        return _GETFEATURE_URLS[wfs_url]
+
+
+def wfs_request_tiles(hull_polygons, bbox_margin=0.0, tile_size_m=None):
+    """
+    Request bboxes for the hulls: the bbox of every hull (grown by bbox_margin) or, with tile_size_m,
+    the squares of a global tile_size_m grid that touch the hull. The grid is aligned to multiples of
+    tile_size_m, so nearby sites request the same tiles (see wfs_cache.py). Adjacent tiles share their
+    borders, so features crossing a border are returned for both tiles (de-duplicated by gml_id).
+
+    Returns:
+        list: (bbox, area) pairs; area is the part of the (margin-grown) hulls inside the bbox.
+    """
+    areas = {}
+    for hull_polygon in hull_polygons:
+        minx, miny, maxx, maxy = hull_polygon.bounds
+        bbox = (minx - bbox_margin, miny - bbox_margin, maxx + bbox_margin, maxy + bbox_margin)
+        query_area = hull_polygon.buffer(bbox_margin) if bbox_margin > 0 else hull_polygon
+        if not tile_size_m:
+            parts = [(bbox, query_area)]
+        else:
+            grid_bounds = (math.floor(bbox[0] / tile_size_m) * tile_size_m, math.floor(bbox[1] / tile_size_m) * tile_size_m,
+                           math.ceil(bbox[2] / tile_size_m) * tile_size_m, math.ceil(bbox[3] / tile_size_m) * tile_size_m)
+            parts = [(tile['bounds'], query_area.intersection(box(*tile['bounds'])))
+                     for tile in make_tile_grid(grid_bounds, tile_size_m, 0.0)]
+        for tile_bbox, part in parts:
+            if part.is_empty: continue
+            areas[tile_bbox] = areas[tile_bbox].union(part) if tile_bbox in areas else part # Hulls of neighbouring clusters can share tiles
+    return list(areas.items())
+
+
+def _gml_pos_list(ring):
+    return " ".join(f"{x:.2f} {y:.2f}" for x, y in ring.coords)
+
+def _gml_polygon(polygon, gml_id):
+    rings = [f"<gml:exterior><gml:LinearRing><gml:posList>{_gml_pos_list(polygon.exterior)}</gml:posList></gml:LinearRing></gml:exterior>"]
+    rings += [f"<gml:interior><gml:LinearRing><gml:posList>{_gml_pos_list(interior)}</gml:posList></gml:LinearRing></gml:interior>"
+              for interior in polygon.interiors]
+    return f'<gml:Polygon gml:id="{gml_id}">{"".join(rings)}</gml:Polygon>'
+
+def fes_intersects_filter(geometry_property, area, srs_name, namespaces=None, simplify_tolerance_m=FILTER_SIMPLIFY_TOLERANCE_M):
+    """
+    FES 2.0 filter (XML string) selecting the features whose geometry_property intersects area.
+    The area is grown and simplified by simplify_tolerance_m, so the filter polygon still covers it
+    with fewer vertices. namespaces maps prefixes (e.g. of geometry_property) to their URIs.
+    """
+    from shapely.geometry import MultiPolygon, Polygon
+    simplified = area.buffer(simplify_tolerance_m, join_style='mitre').simplify(simplify_tolerance_m) if simplify_tolerance_m else area
+    polygons = [g for g in getattr(simplified, 'geoms', [simplified]) if isinstance(g, Polygon) and not g.is_empty]
+    if isinstance(simplified, MultiPolygon) or len(polygons) > 1:
+        members = "".join(f"<gml:surfaceMember>{_gml_polygon(p, f'filter.{i}')}</gml:surfaceMember>" for i, p in enumerate(polygons))
+        geometry = f'<gml:MultiSurface gml:id="filter" srsName="{srs_name}">{members}</gml:MultiSurface>'
+    else:
+        geometry = _gml_polygon(polygons[0], 'filter').replace('<gml:Polygon ', f'<gml:Polygon srsName="{srs_name}" ', 1)
+    xmlns = "".join(f' xmlns:{prefix}="{uri}"' for prefix, uri in (namespaces or {}).items())
+    return (f'<fes:Filter xmlns:fes="{FES_NAMESPACE}" xmlns:gml="{GML_NAMESPACE}"{xmlns}>'
+            f'<fes:Intersects><fes:ValueReference>{geometry_property}</fes:ValueReference>{geometry}</fes:Intersects></fes:Filter>')
+
+
+class _ResponseReader:
+    """
+    File-like view of a response body for the GML parser. Counts the bytes and copies them,
+    as they pass, into a zlib compressor (page for the WFS cache) and/or a debug file.
+    """
+    def __init__(self, stream, compress=False, debug_path=None):
+        self.stream = stream
+        self.received = 0
+        self._compressor = zlib.compressobj(6) if compress else None
+        self._compressed = []
+        self._debug_file = open(debug_path, 'wb') if debug_path else None
+
+    def read(self, size=-1):
+        data = self.stream.read(size if size and size > 0 else _READ_BLOCK_BYTES)
+        self.received += len(data)
+        if self._compressor is not None: self._compressed.append(self._compressor.compress(data))
+        if self._debug_file is not None: self._debug_file.write(data)
+        return data
+
+    def close(self):
+        """Returns the compressed body (None without compress=True)."""
+        if self._debug_file is not None: self._debug_file.close()
+        if self._compressor is None: return None
+        self._compressed.append(self._compressor.flush())
+        return b''.join(self._compressed)
+
+
+class _InflatingReader:
+    """File-like view of a zlib-compressed body (a cached page), decompressed block by block."""
+    def __init__(self, compressed):
+        self._compressed = memoryview(compressed)
+        self._offset = 0
+        self._decompressor = zlib.decompressobj()
+
+    def read(self, size=-1):
+        size = size if size and size > 0 else _READ_BLOCK_BYTES
+        while True:
+            if self._decompressor.unconsumed_tail:
+                data = self._decompressor.decompress(self._decompressor.unconsumed_tail, size)
+            elif self._offset < len(self._compressed):
+                data = self._decompressor.decompress(self._compressed[self._offset:self._offset + _READ_BLOCK_BYTES], size)
+                self._offset += _READ_BLOCK_BYTES
+            else:
+                return self._decompressor.flush()
+            if data: return data
+
+
+def _count_attribute(value):
+    return int(value) if value is not None and value.isdigit() else None # Absent or 'unknown'
+
+
+def _members_gdf(collection, members):
+    """
+    Parses feature members (detached from their FeatureCollection) into a GeoDataFrame with OGR.
+    The chunk keeps the namespaces of the FeatureCollection but not its other attributes (with a
+    schemaLocation OGR would fetch the schemas for every chunk). Its srsName is used as the CRS if
+    OGR finds none on the member geometries.
+    """
+    from lxml import etree
+    chunk = etree.Element(collection.tag, nsmap=collection.nsmap)
+    chunk.extend(members)
+    gdf = gpd.read_file(io.BytesIO(etree.tostring(chunk)))
+    srs_name = collection.get('srsName')
+    if gdf.crs is None and srs_name and not gdf.empty:
+        try: gdf = gdf.set_crs(get_crs(srs_name))
+        except Exception as e: print(f"  Warning: Ignoring unknown srsName '{srs_name}' of the WFS response: {e}")
+    return gdf
+
+
+def iter_gml_chunks(stream, counts, chunk_features=GML_CHUNK_FEATURES):
+    """
+    Parses a WFS FeatureCollection incrementally from a file-like stream and yields GeoDataFrames
+    of up to chunk_features features, so only one chunk of the document is held in memory.
+    Fills counts with 'matched'/'returned' (numberMatched/numberReturned, None if not reported)
+    and 'members' (feature members seen). Raises RuntimeError for an OWS ExceptionReport and
+    lxml.etree.XMLSyntaxError for malformed XML.
+    """
+    from lxml import etree
+    collection, members = None, []
+    counts.update(matched=None, returned=None, members=0)
+    for event, elem in etree.iterparse(stream, events=('start', 'end'), huge_tree=True):
+        if collection is None: # Start of the root element: its attributes are complete
+            collection = elem
+            counts.update(matched=_count_attribute(elem.get('numberMatched')), returned=_count_attribute(elem.get('numberReturned')))
+            continue
+        if event != 'end' or elem.getparent() is not collection: continue
+        collection.remove(elem) # Detach the member so the parsed tree does not grow
+        if etree.QName(collection).localname == 'ExceptionReport':
+            raise RuntimeError(f"WFS exception: {' '.join(' '.join(elem.itertext()).split())}")
+        counts['members'] += len(elem) if etree.QName(elem).localname == 'featureMembers' else 1
+        members.append(elem)
+        if len(members) >= chunk_features:
+            yield _members_gdf(collection, members)
+            members = []
+    if members: yield _members_gdf(collection, members)
+
+
+def getfeature_params(typename, bbox, srsname, count=None, start_index=0, filter_xml=None,
+                      property_names=None, namespaces=None):
+    """
+    KVP parameters of a WFS 2.0 GetFeature request for one bbox (and page). A filter_xml (FES 2.0)
+    replaces the bbox, which KVP requests cannot combine with a filter; property_names limits the
+    returned properties (the gml:id is always returned).
+    """
+    params = {'SERVICE': 'WFS', 'VERSION': '2.0.0', 'REQUEST': 'GetFeature', 'TYPENAMES': typename,
+              'SRSNAME': srsname, 'OUTPUTFORMAT': GML_OUTPUT_FORMAT}
+    if filter_xml: params['FILTER'] = filter_xml
+    else: params['BBOX'] = ",".join(repr(float(v)) for v in bbox) + f",{srsname}"
+    if property_names: params['PROPERTYNAME'] = ",".join(property_names)
+    if namespaces: params['NAMESPACES'] = ",".join(f"xmlns({prefix},{uri})" for prefix, uri in namespaces.items())
+    if count: params['COUNT'] = int(count)
+    if start_index: params['STARTINDEX'] = int(start_index)
+    return params
+
+
+def _parse_page(reader, counts, prepare_chunk):
+    chunks = []
+    for gdf in iter_gml_chunks(reader, counts):
+        if prepare_chunk is not None: gdf = prepare_chunk(gdf)
+        if gdf is not None and not gdf.empty: chunks.append(gdf)
+    return chunks
+
+
+def fetch_wfs_tile(getfeature_url, typename, bbox, srsname, page_size=None, timeout_s=60,
+                   prepare_chunk=None, keep_pages=False, debug_raw_prefix=None, query=None):
+    """
+    Downloads all features of typename in one request bbox, page by page (WFS 2.0 startIndex/count).
+    Pages are requested while the server reports more matches than returned so far (numberMatched),
+    or, if it does not report them, while pages come back full. Every page is streamed into the
+    GML parser; prepare_chunk(gdf) is applied to each parsed chunk (e.g. clipping it to the hull)
+    and may return None to drop it. With debug_raw_prefix the raw pages are also saved to
+    <debug_raw_prefix>_p<page>.gml. query holds further getfeature_params (filter_xml,
+    property_names, namespaces).
+
+    Returns:
+        tuple: (list of prepared GeoDataFrame chunks, list of the zlib-compressed raw pages if
+                keep_pages else None, bytes received, False if the download stopped at
+                MAX_PAGES_PER_REQUEST_TILE).
+    """
+    import http_session
+    chunks, pages, start_index, received = [], [] if keep_pages else None, 0, 0
+    for page in range(MAX_PAGES_PER_REQUEST_TILE):
+        params = getfeature_params(typename, bbox, srsname, count=page_size, start_index=start_index, **(query or {}))
+        debug_path = f"{debug_raw_prefix}_p{page}.gml" if debug_raw_prefix else None
+        attempt = 0
+        while True: # http_session retries the request; a body that breaks off mid-stream is retried here
+            counts = {}
+            try:
+                with http_session.get(getfeature_url, params=params, timeout=timeout_s, stream=True) as resp:
+                    resp.raise_for_status()
+                    resp.raw.decode_content = True # gzip/deflate content encoding
+                    reader = _ResponseReader(resp.raw, compress=keep_pages, debug_path=debug_path)
+                    try:
+                        page_chunks = _parse_page(reader, counts, prepare_chunk)
+                    finally:
+                        compressed = reader.close()
+                        http_session.record_received(getfeature_url, resp.raw.tell()) # Bytes on the wire, before decoding
+                break
+            except http_session.TRANSIENT_ERRORS as e:
+                if not http_session.wait_before_retry(attempt, getfeature_url, e): raise
+                attempt += 1
+        chunks.extend(page_chunks)
+        received += reader.received
+        if keep_pages: pages.append(compressed)
+        n_features = counts['returned'] if counts['returned'] is not None else counts['members']
+        start_index += n_features
+        if n_features == 0: break
+        if counts['matched'] is not None:
+            if start_index >= counts['matched']: break
+        elif not (page_size and n_features >= page_size): break
+    else:
+        print(f"  Warning: {typename}: stopped after {MAX_PAGES_PER_REQUEST_TILE} pages in bbox {bbox}; features may be missing.")
+        return chunks, pages, received, False
+    return chunks, pages, received, True
+
+
+def read_cached_pages(compressed_pages, prepare_chunk=None):
+    """Parses pages from the WFS cache (zlib-compressed GML) the same way as downloaded ones."""
+    chunks = []
+    for compressed in compressed_pages:
+        chunks.extend(_parse_page(_InflatingReader(compressed), {}, prepare_chunk))
+    return chunks
+
+
+def merge_pages(gdfs):
+    """Merges the chunks/pages/tiles of one feature type into one layer, keeping each gml_id once."""
+    if not gdfs: return None
+    gdf = gdfs[0] if len(gdfs) == 1 else gpd.GeoDataFrame(pd.concat(gdfs, ignore_index=True), crs=gdfs[0].crs)
+    if len(gdfs) > 1 and 'gml_id' in gdf.columns: # Features crossing tile borders are returned once per tile
+        gdf = gdf.drop_duplicates(subset='gml_id', ignore_index=True)
+    return gdf
 
 def fetch_clip_and_save_wfs(hull_polygon_gpkg_path_str, wfs_url, feature_types,
-                            target_crs_str, out_dir_str, bbox_margin=0.0):
-    """Fetches features from WFS, clips them to the hull, and saves as GML."""
+                            target_crs_str, out_dir_str, bbox_margin=0.0, return_gdfs=False,
+                            tile_size_m=None, page_size=None, max_workers=1, timeout_s=60,
+                            cache=None, offline=False, debug_raw=False,
+                            geometry_property=None, property_names=None, namespaces=None):
+    """
+    Fetches features from WFS, clips them to the hull, and saves as GML.
+    A hull GeoPackage with several features (one hull per defect cluster, see Step 1) is
+    fetched hull by hull, so the territory between the clusters is not downloaded.
+    With tile_size_m the hull bboxes are split into tiles, and with page_size every request
+    is paged (see fetch_wfs_tile); the requests of all feature types run in a pool of
+    max_workers threads and are merged into one layer per feature type.
+    Responses are parsed while they stream in, and every chunk of features is clipped to the
+    hull right away; the raw GML is only written to disk with debug_raw=True.
+    With geometry_property every request carries an FES Intersects filter with the part of the
+    hull inside its bbox instead of the plain bbox, and property_names limits the returned
+    properties (prefixes resolved with namespaces); the client-side clip stays as a safety net.
+    With a cache (wfs_cache.WFSCache) request tiles it covers are read from it and downloaded
+    tiles are added to it; offline=True uses only the cache and never connects to the WFS.
+
+    Returns {typename: clipped GML path}. With return_gdfs=True a tuple (paths, gdfs) is
+    returned, where gdfs maps each typename to its clipped GeoDataFrame (target CRS), so
+    later steps can use the features without parsing the GML files again.
+    """
     print(f"\n--- Running: Fetching and Clipping WFS Features ---")
     output_dir = Path(out_dir_str)
     output_dir.mkdir(parents=True, exist_ok=True)
     output_paths = {}
-    target_crs_obj = pyproj.CRS.from_user_input(target_crs_str)
+    clipped_gdfs = {}
+    target_crs_obj = get_crs(target_crs_str)
 
     try:
         hull_gdf = gpd.read_file(hull_polygon_gpkg_path_str)
         if hull_gdf.empty:
             raise ValueError("Hull GeoPackage is empty.")
-        hull_polygon = hull_gdf.geometry.iloc[0]
-        if not hull_polygon.is_valid: hull_polygon = hull_polygon.buffer(0)
-        if not hull_polygon.is_valid: raise ValueError("Hull polygon is invalid.")
         if hull_gdf.crs and not hull_gdf.crs.equals(target_crs_obj):
             print(f"  Reprojecting hull from {hull_gdf.crs} to {target_crs_str} for WFS query.")
-            hull_gdf = hull_gdf.to_crs(target_crs_obj)
-            hull_polygon = hull_gdf.geometry.iloc[0]
+            hull_gdf = reproject_gdf(hull_gdf, target_crs_obj)
+        hull_polygons = [p if p.is_valid else p.buffer(0) for p in hull_gdf.geometry if p is not None and not p.is_empty]
+        if not hull_polygons or not all(p.is_valid for p in hull_polygons): raise ValueError("Hull polygon is invalid.")
     except Exception as e:
         print(f"ERROR: Could not read or prepare hull polygon from {hull_polygon_gpkg_path_str}: {e}")
-        return output_paths
+        return (output_paths, clipped_gdfs) if return_gdfs else output_paths
 
 
-    try:
-        print(f"Connecting to WFS service: {wfs_url}")
-        wfs = WebFeatureService(wfs_url, version="2.0.0", timeout=60)
-    except Exception as e:
-        print(f"ERROR: Could not connect to WFS service: {e}")
-        return output_paths
+    if offline and cache is None:
+        print("ERROR: Offline mode needs the WFS cache (WFS_CACHE_ENABLED).")
+        return (output_paths, clipped_gdfs) if return_gdfs else output_paths
+    connection_errors = []
+    def getfeature_url(): # Connects on the first request the cache cannot answer; a failed connection is not retried in this run
+        if connection_errors: raise ConnectionError(f"No connection to {wfs_url}")
+        try:
+            return get_getfeature_url(wfs_url, timeout_s)
+        except Exception as e:
+            with _CAPABILITIES_LOCK:
+                if not connection_errors: print(f"ERROR: Could not connect to WFS service: {e}")
+                connection_errors.append(e)
+            raise ConnectionError(f"No connection to {wfs_url}") from e
 
-    mask_gdf = gpd.GeoDataFrame([1], geometry=[hull_polygon], crs=target_crs_obj)
-    minx, miny, maxx, maxy = hull_polygon.bounds
-    bbox = (minx - bbox_margin, miny - bbox_margin, maxx + bbox_margin, maxy + bbox_margin)
-    print(f"Using bounding box (with {bbox_margin}m margin): {bbox}")
+    mask_gdf = gpd.GeoDataFrame({'id': range(len(hull_polygons))}, geometry=hull_polygons, crs=target_crs_obj)
+    request_tiles = wfs_request_tiles(hull_polygons, bbox_margin, tile_size_m)
+    print(f"Using {len(request_tiles)} request bbox(es) with {bbox_margin}m margin" + (f", tiles of {tile_size_m}m" if tile_size_m else "")
+          + (f", pages of {page_size} features" if page_size else "") + (", hull filter" if geometry_property else "") + ".")
+
+    def clip_chunk(gdf): # Runs in the download threads, once per parsed chunk
+        if gdf.crs is None: gdf = gdf.set_crs(target_crs_obj)
+        else: gdf = reproject_gdf(gdf, target_crs_obj)
+        gdf = gdf[gdf.geometry.is_valid] # Keep only valid
+        if gdf.empty: return None
+        clipped = gpd.clip(gdf, mask_gdf, keep_geom_type=False)
+        return clipped[~clipped.geometry.is_empty & clipped.geometry.is_valid]
+
+    # --- Download: one task per (feature type, request bbox), each paged and clipped as it streams in ---
+    run_report.phase("WFS download and clip")
+    srsname = target_crs_obj.to_string()
+    epsg_code = target_crs_obj.to_epsg()
+    filter_srs_name = f"urn:ogc:def:crs:EPSG::{epsg_code}" if epsg_code else srsname
+    # Feature types interleaved, so all of them progress together when there are more tasks than workers
+    tasks = [(typename, tile_index, bbox, area) for tile_index, (bbox, area) in enumerate(request_tiles) for typename in feature_types]
+    def download(task):
+        typename, tile_index, bbox, area = task
+        if geometry_property is None or area.equals(box(*bbox)): # No filter needed for a tile inside the hull
+            area, query = None, {'property_names': property_names, 'namespaces': namespaces}
+        else:
+            query = {'filter_xml': fes_intersects_filter(geometry_property, area, filter_srs_name, namespaces),
+                     'property_names': property_names, 'namespaces': namespaces}
+        if cache is not None:
+            cached_pages = cache.lookup(wfs_url, typename, srsname, bbox, area=area, property_names=property_names, offline=offline)
+            if cached_pages is not None:
+                return read_cached_pages(cached_pages, clip_chunk), 0, 0, True
+        if offline: raise LookupError("not in the WFS cache (offline mode)")
+        debug_raw_prefix = output_dir / f"{typename.replace(':', '_').replace('/', '_')}_raw_t{tile_index}" if debug_raw else None
+        chunks, pages, received, complete = fetch_wfs_tile(getfeature_url(), typename, bbox, srsname, page_size=page_size,
+                                                           timeout_s=timeout_s, prepare_chunk=clip_chunk, query=query,
+                                                           keep_pages=cache is not None, debug_raw_prefix=debug_raw_prefix)
+        if not complete: # Counted as a failed request, so the layer is not saved without the missing features
+            raise RuntimeError(f"incomplete, stopped after {MAX_PAGES_PER_REQUEST_TILE} pages")
+        if cache is not None:
+            try: cache.store(wfs_url, typename, srsname, bbox, pages, area=area, property_names=property_names, compressed=True)
+            except Exception as e: print(f"  Warning: Could not store {typename} tile in the WFS cache: {e}")
+        return chunks, len(pages or ()), received, False
+    download_span = run_report.current_span() # The pool threads report their network bytes to this phase (and Step 2a)
+    def download_attached(task):
+        with run_report.attach(download_span):
+            return download(task)
+    downloaded = {typename: [] for typename in feature_types}
+    failed = {typename: 0 for typename in feature_types}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tasks))), thread_name_prefix="wfs") as pool:
+        futures = [(task, pool.submit(download_attached, task)) for task in tasks]
+        n_pages = n_bytes = n_cached = 0
+        for (typename, tile_index, bbox, area), future in futures:
+            try:
+                chunks, pages, received, from_cache = future.result()
+                downloaded[typename].extend(chunks); n_pages += pages; n_bytes += received; n_cached += from_cache
+            except Exception as e:
+                failed[typename] += 1
+                print(f"  ERROR downloading {typename} in bbox {bbox}: {e}")
+    print(f"  {n_cached} of {len(tasks)} request(s) served from the WFS cache; downloaded {n_bytes / 1e6:.1f} MB "
+          + (f"in {n_pages} page(s) " if cache is not None else "") + f"({max_workers} worker(s)).")
 
     for typename in feature_types:
         print(f"\nProcessing WFS feature type: {typename}")
         feature_name_safe = typename.replace(':', '_').replace('/', '_')
-        raw_path = output_dir / f"{feature_name_safe}_raw.gml"
         out_path = output_dir / f"{feature_name_safe}_clipped.gml"
+        if failed[typename]: # A partial layer would silently lack features
+            print(f"  {failed[typename]} of {len(request_tiles)} request(s) failed; skipping {typename}.")
+            continue
 
         try:
-            print(f"  Requesting features from WFS...")
-            resp = wfs.getfeature(typename=typename, bbox=bbox, srsname=target_crs_obj.to_string(), outputFormat='text/xml; subtype=gml/3.2.1')
-            with open(raw_path, 'wb') as f: f.write(resp.read())
-
-            if not raw_path.exists() or raw_path.stat().st_size < 100: # Basic check
-                print(f"  Downloaded file {raw_path} is empty or too small. Skipping clipping.")
-                raw_path.unlink(missing_ok=True); continue
-            print(f"  Reading GML file {raw_path} into GeoDataFrame...")
-            try:
-                gdf = gpd.read_file(str(raw_path))
-            except Exception as read_err:
-                print(f"  ERROR reading GML {raw_path}: {read_err}.")
-                try: # Check if XML is well-formed at least
-                    with open(raw_path, 'rb') as f_xml: etree.parse(f_xml)
-                    print("    (XML parsing seems okay, GeoPandas read failed. File might be complex GML.)")
-                except Exception as xml_err: print(f"    (XML parsing also failed: {xml_err})")
-                continue
-
-            if gdf.empty: print(f"  No features found for {typename} within the bounding box."); raw_path.unlink(missing_ok=True); continue
-            print(f"  Found {len(gdf)} features in raw GML.")
-
-            if gdf.crs is None: gdf.crs = target_crs_obj
-            elif not pyproj.CRS(gdf.crs).equals(target_crs_obj): gdf = gdf.to_crs(target_crs_obj)
-
-            gdf = gdf[gdf.geometry.is_valid].copy() # Keep only valid
-            if gdf.empty: print("  No valid geometries remaining after validity check."); raw_path.unlink(missing_ok=True); continue
-
-            clipped = gpd.clip(gdf, mask_gdf, keep_geom_type=False)
-            if clipped.empty: print(f"  No features found within the precise hull for {typename}."); raw_path.unlink(missing_ok=True); continue
-            
-            clipped = clipped[~clipped.geometry.is_empty & clipped.geometry.is_valid].copy()
-            if clipped.empty: print(f"  No valid features left to save for {typename}."); raw_path.unlink(missing_ok=True); continue
-            
+            run_report.phase(f"{typename}: merge and save", typename=typename)
+            clipped = merge_pages(downloaded[typename])
+            if clipped is None or clipped.empty: print(f"  No features found within the precise hull for {typename}."); continue
+
             clipped.to_file(out_path, driver='GML', GML_FEATURE_COLLECTION=True, GML_ID='auto')
             output_paths[typename] = str(out_path)
+            clipped_gdfs[typename] = clipped
             print(f"  Successfully saved {len(clipped)} features to {out_path}")
-            raw_path.unlink(missing_ok=True) # Clean up raw file
 
         except Exception as e:
             print(f"  Unhandled ERROR processing {typename}: {e}")
-            out_path.unlink(missing_ok=True); raw_path.unlink(missing_ok=True)
-    return output_paths
+            out_path.unlink(missing_ok=True)
+    return (output_paths, clipped_gdfs) if return_gdfs else output_paths
 
 if __name__ == '__main__':
     # Example Usage
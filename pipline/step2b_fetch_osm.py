@@ -1,31 +1,36 @@
 # -*- coding: utf-8 -*-
 from pathlib import Path
 import geopandas as gpd
-import pyproj
-import osmnx as ox
+from shapely.ops import unary_union
 import traceback
+from transformer_cache import get_crs, reproject_gdf
 
-def fetch_clip_and_save_osm_streets(hull_polygon_gpkg_path_str, target_crs_str, out_dir_str):
+def fetch_clip_and_save_osm_streets(hull_polygon_gpkg_path_str, target_crs_str, out_dir_str,
+                                    pbf_path=None, pbf_index_path=None, offline=False):
     """
     Fetches street data from OpenStreetMap within the hull, clips it, and saves as GPKG.
+    With pbf_path the streets are read from that local .osm.pbf extract through its way index
+    (see osm_pbf_index.py; built on first use, at pbf_index_path if given) instead of being
+    downloaded from the Overpass API; the extract yields one street per way rather than per
+    graph edge. offline=True fails instead of using the Overpass API.
     """
     print("\n--- Running: Fetching and Clipping OpenStreetMap Streets ---")
     output_dir = Path(out_dir_str)
     output_dir.mkdir(parents=True, exist_ok=True)
     out_path = output_dir / "osm_streets_clipped.gpkg"
-    target_crs_obj = pyproj.CRS.from_user_input(target_crs_str)
+    target_crs_obj = get_crs(target_crs_str)
 
     try:
         hull_gdf = gpd.read_file(hull_polygon_gpkg_path_str)
         if hull_gdf.empty: raise ValueError("Hull GeoPackage is empty.")
-        hull_polygon = hull_gdf.geometry.iloc[0]
+        hull_polygon = unary_union(list(hull_gdf.geometry)) # Several features if Step 1 clustered the defects
         if not hull_polygon.is_valid: hull_polygon = hull_polygon.buffer(0)
         if not hull_polygon.is_valid: raise ValueError("Hull polygon is invalid.")
         
         # Ensure hull is in target_crs_obj before converting to 4326 for OSM
         if hull_gdf.crs and not hull_gdf.crs.equals(target_crs_obj):
-            hull_gdf = hull_gdf.to_crs(target_crs_obj)
-            hull_polygon = hull_gdf.geometry.iloc[0]
+            hull_gdf = reproject_gdf(hull_gdf, target_crs_obj)
+            hull_polygon = unary_union(list(hull_gdf.geometry))
         elif not hull_gdf.crs: # If hull GPKG had no CRS, assume it's already target_crs
              hull_gdf.crs = target_crs_obj
 
@@ -35,26 +40,35 @@ def fetch_clip_and_save_osm_streets(hull_polygon_gpkg_path_str, target_crs_str,
         return None
 
     try:
-        ox.settings.log_console = False # Quieter OSMnx
-        ox.settings.use_cache = True
-        ox.settings.requests_timeout = 180
-
-        hull_gdf_4326 = hull_gdf.to_crs("EPSG:4326")
-        polygon_4326 = hull_gdf_4326.geometry.iloc[0]
+        hull_gdf_4326 = reproject_gdf(hull_gdf, "EPSG:4326")
+        polygon_4326 = unary_union(list(hull_gdf_4326.geometry))
         
         # Buffer slightly for OSM query to ensure edges are captured
         buffered_poly_4326 = polygon_4326.buffer(0.0005) # Approx 50m in degrees
 
-        graph = ox.graph_from_polygon(buffered_poly_4326, network_type='drive', simplify=True, truncate_by_edge=True)
-        print(f"  Downloaded OSM graph with {len(graph.nodes)} nodes and {len(graph.edges)} edges.")
-        
-        edges_gdf = ox.graph_to_gdfs(graph, nodes=False, edges=True)
+        if pbf_path:
+            from osm_pbf_index import OSMWayIndex
+            way_index = OSMWayIndex(pbf_path, pbf_index_path)
+            way_index.ensure_built()
+            edges_gdf = way_index.query(buffered_poly_4326)
+            print(f"  Read {len(edges_gdf)} drivable OSM ways near the hull from {pbf_path}.")
+        elif offline:
+            print("ERROR: Offline mode needs a local OSM extract (pbf_path); the Overpass API is not used."); return None
+        else:
+            import osmnx as ox
+            ox.settings.log_console = False # Quieter OSMnx
+            ox.settings.use_cache = True
+            ox.settings.requests_timeout = 180
+
+            graph = ox.graph_from_polygon(buffered_poly_4326, network_type='drive', simplify=True, truncate_by_edge=True)
+            print(f"  Downloaded OSM graph with {len(graph.nodes)} nodes and {len(graph.edges)} edges.")
+            edges_gdf = ox.graph_to_gdfs(graph, nodes=False, edges=True)
         if edges_gdf.empty: print("  No street edges found from OSM."); return None
         
         edges_gdf = edges_gdf[edges_gdf.geometry.type == 'LineString'].copy()
         if edges_gdf.empty: print("  No LineString street geometries found."); return None
 
-        edges_gdf_proj = edges_gdf.to_crs(target_crs_obj)
+        edges_gdf_proj = reproject_gdf(edges_gdf, target_crs_obj)
         
         # Clip to the original, non-buffered hull in target_crs
         precise_hull_gdf = gpd.GeoDataFrame(geometry=[hull_polygon], crs=target_crs_obj)
@@ -75,7 +89,7 @@ def fetch_clip_and_save_osm_streets(hull_polygon_gpkg_path_str, target_crs_str,
         print(f"  OSM streets saved successfully to {out_path}")
         return str(out_path)
 
-    except ImportError: print("ERROR: 'osmnx' library is required."); return None
+    except ImportError as e: print(f"ERROR: 'osmnx' (Overpass API) or 'osmium' (local extract) library is required: {e}"); return None
     except Exception as e:
         print(f"ERROR during OSM street processing: {e}"); traceback.print_exc()
         return None
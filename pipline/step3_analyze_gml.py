@@ -3,18 +3,152 @@ import time
 from pathlib import Path
 import pandas as pd # For saving points if needed
 import geopandas as gpd
-from shapely.geometry import Point, LineString, Polygon
+import shapely
 from shapely.ops import unary_union
 import numpy as np
 from helpers import plot_analysis_step # Assuming helpers.py is in the same directory or PYTHONPATH
+import run_report
+
+SAMPLE_DEDUP_GRID_M = 1e-3 # Sampled points that fall into the same cell of this grid are kept once
+
+def ring_buffers(closed_lines, offset):
+    """
+    Buffers (by offset) of the polygons enclosed by closed lines, built with array operations.
+    Rings that are invalid or do not enclose a valid polygon are skipped.
+
+    Returns:
+        numpy.ndarray: the valid, non-empty buffer polygons.
+    """
+    rings = np.asarray(closed_lines, dtype=object)
+    rings = rings[shapely.is_valid(rings)]
+    if len(rings) == 0: return rings
+    coords, ring_index = shapely.get_coordinates(rings, return_index=True)
+    polygons = shapely.polygons(shapely.linearrings(coords, indices=ring_index))
+    buffers = shapely.buffer(polygons[shapely.is_valid(polygons)], offset)
+    return buffers[shapely.is_valid(buffers) & ~shapely.is_empty(buffers)]
+
+def lines_clear_of(lines, polygons):
+    """
+    Boolean mask of the valid lines that intersect none of the polygons. One bulk STRtree
+    query replaces testing every line against the union of all polygons.
+    """
+    lines = np.asarray(lines, dtype=object)
+    keep = shapely.is_valid(lines)
+    if len(polygons) and len(lines):
+        line_index, _ = shapely.STRtree(polygons).query(lines, predicate='intersects')
+        keep[line_index] = False
+    return keep
+
+def connected_components(n_nodes, edges_a, edges_b):
+    """
+    Component label of every node of an undirected graph given as edge index arrays: the
+    smallest node index in its component. Union-find in array operations: every round hooks
+    each root onto the smallest root it shares an edge with, then compresses the trees, so the
+    number of rounds grows with log(n_nodes), not with the length of street chains.
+    """
+    parent = np.arange(n_nodes)
+    while True:
+        root_a, root_b = parent[edges_a], parent[edges_b]
+        crossing = root_a != root_b
+        if not crossing.any(): return parent
+        np.minimum.at(parent, np.maximum(root_a, root_b)[crossing], np.minimum(root_a, root_b)[crossing]) # Hook
+        while True: # Compress: point every node at its root
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent): break
+            parent = grandparent
+
+def connected_line_mask(lines, min_component_lines=2, min_component_length=0.0):
+    """
+    Boolean mask of the valid lines in connected groups: lines are connected if they intersect
+    (found with one bulk STRtree query), and a group is kept if it has at least min_component_lines
+    lines and a total length of at least min_component_length. The default keeps every line
+    that touches another one.
+    """
+    lines = np.asarray(lines, dtype=object)
+    valid = shapely.is_valid(lines)
+    lines = np.where(valid, lines, None) # Invalid lines connect nothing
+    pair_a, pair_b = shapely.STRtree(lines).query(lines, predicate='intersects')
+    not_self = pair_a != pair_b
+    labels = connected_components(len(lines), pair_a[not_self], pair_b[not_self])
+    component_lines = np.bincount(labels, minlength=len(lines))
+    component_length = np.bincount(labels, weights=shapely.length(lines), minlength=len(lines))
+    return valid & (component_lines[labels] >= min_component_lines) & (component_length[labels] >= min_component_length)
+
+def _sampleable_lines(lines):
+    """The valid, non-empty lines of positive length, and their lengths."""
+    lines = np.asarray(lines, dtype=object)
+    lines = lines[shapely.is_valid(lines) & ~shapely.is_empty(lines)]
+    lengths = shapely.length(lines)
+    return lines[lengths > 0], lengths[lengths > 0]
+
+def _unique_points(points_xy, dedup_grid):
+    """Finite points, each dedup_grid cell kept once (first occurrence, order preserved)."""
+    points_xy = points_xy[np.isfinite(points_xy).all(axis=1)]
+    _, first_index = np.unique(np.round(points_xy / dedup_grid).astype(np.int64), axis=0, return_index=True)
+    return points_xy[np.sort(first_index)]
+
+def sample_points_along_lines(lines, sample_interval, dedup_grid=SAMPLE_DEDUP_GRID_M):
+    """
+    Points every sample_interval along each line (from its start) plus its end point, interpolated
+    for all lines in one array call. Invalid, empty and zero-length lines are skipped. Points that
+    snap to the same dedup_grid cell (shared line ends, mostly) are kept once, in sampling order.
+
+    Returns:
+        numpy.ndarray: (N, 2) float array of x, y.
+    """
+    lines, lengths = _sampleable_lines(lines)
+    if len(lines) == 0: return np.empty((0, 2))
+    counts = np.ceil(lengths / sample_interval).astype(np.int64) # len(np.arange(0, length, sample_interval))
+    line_index = np.repeat(np.arange(len(lines)), counts)
+    first_sample = np.repeat(np.cumsum(counts) - counts, counts)
+    distances = (np.arange(counts.sum()) - first_sample) * sample_interval
+    samples = shapely.get_coordinates(shapely.line_interpolate_point(lines[line_index], distances))
+    ends = shapely.get_coordinates(shapely.get_point(lines, -1))
+    return _unique_points(np.concatenate([samples, ends]), dedup_grid)
+
+def sample_points_adaptive(lines, max_chord_deviation, max_spacing=None, dedup_grid=SAMPLE_DEDUP_GRID_M):
+    """
+    Curvature-adaptive samples: the vertices of each line simplified (Douglas-Peucker) so that the
+    polyline through the samples deviates at most max_chord_deviation from the line. Samples are
+    therefore dense in tight curves and sparse on straight stretches, where max_spacing caps the
+    distance between neighbouring samples. Line ends and corners are always kept. Same filtering
+    and de-duplication as sample_points_along_lines().
+
+    Returns:
+        numpy.ndarray: (N, 2) float array of x, y.
+    """
+    lines, _ = _sampleable_lines(lines)
+    if len(lines) == 0: return np.empty((0, 2))
+    simplified = shapely.simplify(lines, max_chord_deviation, preserve_topology=False)
+    if max_spacing: simplified = shapely.segmentize(simplified, max_spacing)
+    return _unique_points(shapely.get_coordinates(simplified), dedup_grid)
+
+def save_sampled_points(points_xy, output_dir, stem):
+    """
+    Writes the sampled points as <stem>_sampled_points.npy (read by Step 4) and, for inspection,
+    as <stem>_sampled_points.csv with 'x' and 'y' columns. Returns the path of the .npy file.
+    """
+    npy_path = Path(output_dir) / f"{stem}_sampled_points.npy"
+    np.save(npy_path, np.asarray(points_xy, dtype=np.float64))
+    pd.DataFrame(points_xy, columns=['x', 'y']).to_csv(Path(output_dir) / f"{stem}_sampled_points.csv", index=False)
+    return str(npy_path)
 
 def analyze_gml_and_sample_points(gml_file_path_str, hull_polygon_gpkg_path_str,
                                   output_dir_str, gml_filename_stem_for_plots,
                                   analysis_offset=0.1, sample_interval=10.0,
-                                  show_plots=True, save_plots=True, plot_dpi=150):
+                                  show_plots=True, save_plots=True, plot_dpi=150,
+                                  lines_gdf=None, min_component_lines=2, min_component_length=0.0,
+                                  sampling_mode='fixed', max_chord_deviation=0.05, max_sample_spacing=None):
     """
     Parses GML, applies filters, samples points along connected lines,
-    plots each step, and returns the sampled points as a list of Shapely Points.
+    plots each step, and returns the sampled points as an (N, 2) array of x, y
+    (also saved as .npy and CSV, see save_sampled_points).
+    If lines_gdf (the features of the GML, already in memory) is given, the GML file is not parsed.
+    Filter 2 keeps the groups of connected lines with at least min_component_lines lines and
+    min_component_length meters in total (the defaults keep every line that touches another).
+    sampling_mode 'fixed' samples every sample_interval meters; 'adaptive' places samples by
+    curvature (see sample_points_adaptive), within max_chord_deviation of the lines and at most
+    max_sample_spacing apart (sample_interval if None).
     """
     TOTAL_PLOTTING_STEPS = 4
     gml_file_path = Path(gml_file_path_str)
@@ -23,13 +157,13 @@ def analyze_gml_and_sample_points(gml_file_path_str, hull_polygon_gpkg_path_str,
 
     print(f"\n--- Running: GML Analysis for {gml_file_path.name} ---")
 
-    if not gml_file_path.exists():
+    if lines_gdf is None and not gml_file_path.exists():
         print(f"ERROR: GML file not found: {gml_file_path}")
         return None
     try:
         hull_gdf = gpd.read_file(hull_polygon_gpkg_path_str)
         if hull_gdf.empty: raise ValueError("Hull GeoPackage is empty.")
-        hull_polygon = hull_gdf.geometry.iloc[0]
+        hull_polygon = unary_union(list(hull_gdf.geometry)) # Several features if Step 1 clustered the defects
         if not hull_polygon.is_valid: hull_polygon = hull_polygon.buffer(0)
         if not hull_polygon.is_valid: raise ValueError("Hull polygon is invalid.")
         # Assuming hull is already in the correct target CRS for analysis
@@ -40,13 +174,15 @@ def analyze_gml_and_sample_points(gml_file_path_str, hull_polygon_gpkg_path_str,
     hull_centroid = hull_polygon.centroid
 
     # --- Step 1: Parsing GML ---
+    run_report.phase("parse GML")
     print(f"\nStep 1/{TOTAL_PLOTTING_STEPS}: Parsing GML file...")
     try:
-        gdf = gpd.read_file(gml_file_path)
+        gdf = lines_gdf if lines_gdf is not None else gpd.read_file(gml_file_path)
         if gdf.empty: print("GML parsed but contains no features."); return None
-        initial_lines_gdf = gdf[gdf.geometry.apply(lambda g: isinstance(g, LineString))].copy()
+        initial_lines_gdf = gdf[shapely.get_type_id(gdf.geometry.values) == shapely.GeometryType.LINESTRING].copy()
         if initial_lines_gdf.empty: print("No LineString features found in GML."); return None
-        initial_lines_gdf['is_ring'] = initial_lines_gdf.geometry.apply(lambda g: g.is_ring if g and g.is_valid else False)
+        line_geoms = initial_lines_gdf.geometry.values
+        initial_lines_gdf['is_ring'] = shapely.is_ring(line_geoms) & shapely.is_valid(line_geoms)
         closed_lines = initial_lines_gdf[initial_lines_gdf['is_ring']].geometry.tolist()
         open_lines = initial_lines_gdf[~initial_lines_gdf['is_ring']].geometry.tolist()
     except Exception as e:
@@ -58,19 +194,16 @@ def analyze_gml_and_sample_points(gml_file_path_str, hull_polygon_gpkg_path_str,
         output_dir, gml_filename_stem_for_plots, hull_polygon, hull_centroid, show_plots, save_plots, plot_dpi)
 
     # --- Step 2: Filter 1 ---
+    run_report.phase("filter 1 (rings)")
     print(f"\nStep 2/{TOTAL_PLOTTING_STEPS}: Filter 1 (Intersection with Buffered Rings)...")
     filtered_open_lines_step1 = []
     buffered_polygons_for_plot = []
     if closed_lines:
-        valid_buffers_for_check = [Polygon(r.coords).buffer(analysis_offset) for r in closed_lines if r.is_valid and Polygon(r.coords).is_valid]
-        valid_buffers_for_check = [b for b in valid_buffers_for_check if b and b.is_valid and not b.is_empty]
+        valid_buffers_for_check = ring_buffers(closed_lines, analysis_offset)
         buffered_polygons_for_plot.extend(valid_buffers_for_check)
-        if valid_buffers_for_check and open_lines:
-            combined_buffers = unary_union(valid_buffers_for_check)
-            if not combined_buffers.is_valid: combined_buffers = combined_buffers.buffer(0)
-            for line in open_lines:
-                if line.is_valid and not line.intersects(combined_buffers):
-                    filtered_open_lines_step1.append(line)
+        if len(valid_buffers_for_check) and open_lines:
+            keep = lines_clear_of(open_lines, valid_buffers_for_check)
+            filtered_open_lines_step1 = [line for line, kept in zip(open_lines, keep) if kept]
         else: filtered_open_lines_step1 = list(open_lines) # Keep all if no buffers or no open lines
     else: filtered_open_lines_step1 = list(open_lines) # Keep all if no closed lines
     print(f"  After Filter 1: {len(filtered_open_lines_step1)} open lines remain.")
@@ -81,21 +214,12 @@ def analyze_gml_and_sample_points(gml_file_path_str, hull_polygon_gpkg_path_str,
         output_dir, gml_filename_stem_for_plots, hull_polygon, hull_centroid, show_plots, save_plots, plot_dpi)
 
     # --- Step 3: Filter 2 ---
+    run_report.phase("filter 2 (connectivity)")
     print(f"\nStep 3/{TOTAL_PLOTTING_STEPS}: Filter 2 (Keep Connected Open Lines)...")
     connected_open_lines = []
     if len(filtered_open_lines_step1) > 1:
-        lines_gdf = gpd.GeoDataFrame(geometry=filtered_open_lines_step1)
-        lines_gdf['touches_other'] = False
-        tree = lines_gdf.sindex
-        for i, line_a in lines_gdf.geometry.items():
-            if not line_a or not line_a.is_valid: continue
-            possible_matches_idx = list(tree.intersection(line_a.bounds))
-            for j in [idx for idx in possible_matches_idx if i != idx]:
-                line_b = lines_gdf.geometry[j]
-                if line_b and line_b.is_valid and line_a.intersects(line_b):
-                    lines_gdf.loc[i, 'touches_other'] = True
-                    lines_gdf.loc[j, 'touches_other'] = True; break # Found one connection for line_a
-        connected_open_lines = lines_gdf[lines_gdf['touches_other']].geometry.tolist()
+        keep = connected_line_mask(filtered_open_lines_step1, min_component_lines, min_component_length)
+        connected_open_lines = [line for line, kept in zip(filtered_open_lines_step1, keep) if kept]
     # If only one line, it's not "connected" by this filter's definition. If zero, empty list.
     print(f"  After Filter 2: {len(connected_open_lines)} connected open lines remain.")
     plot_analysis_step("Lines After Filter 2", 3, TOTAL_PLOTTING_STEPS,
@@ -104,32 +228,36 @@ def analyze_gml_and_sample_points(gml_file_path_str, hull_polygon_gpkg_path_str,
         output_dir, gml_filename_stem_for_plots, hull_polygon, hull_centroid, show_plots, save_plots, plot_dpi)
 
     # --- Step 4: Sample Points ---
+    run_report.phase("sample points")
     print(f"\nStep 4/{TOTAL_PLOTTING_STEPS}: Sampling points...")
-    sampled_points = []
-    if connected_open_lines and sample_interval > 0:
-        point_coords_set = set()
-        for line in connected_open_lines:
-            if not line or not line.is_valid or line.is_empty or line.length == 0: continue
-            distances = np.arange(0, line.length, sample_interval)
-            for p in [line.interpolate(d) for d in distances] + [Point(line.coords[-1])]: # Add end point
-                if p.is_valid: point_coords_set.add((p.x, p.y))
-        sampled_points = [Point(coord) for coord in point_coords_set]
+    sampled_points = np.empty((0, 2))
+    if sampling_mode == 'adaptive':
+        max_sample_spacing = max_sample_spacing or sample_interval
+        sampling_label = f"Adaptive: {max_chord_deviation}m deviation, <= {max_sample_spacing}m"
+        if connected_open_lines:
+            sampled_points = sample_points_adaptive(connected_open_lines, max_chord_deviation, max_sample_spacing)
+    elif sampling_mode == 'fixed':
+        sampling_label = f"Interval: {sample_interval}m"
+        if connected_open_lines and sample_interval > 0:
+            sampled_points = sample_points_along_lines(connected_open_lines, sample_interval)
+    else:
+        print(f"ERROR: Unknown sampling mode '{sampling_mode}' (expected 'fixed' or 'adaptive')."); return None
     print(f"  Generated {len(sampled_points)} unique valid points.")
-    plot_analysis_step(f"Sampled Points (Interval: {sample_interval}m)", 4, TOTAL_PLOTTING_STEPS,
-        [{'geoms': connected_open_lines, 'color': 'lightgrey', 'label': 'Connected Lines (Context)', 'alpha':0.7},
-         {'geoms': sampled_points, 'color': 'blue', 'label': 'Sampled Points', 'marker':'o', 'ms':4}],
-        output_dir, gml_filename_stem_for_plots, hull_polygon, hull_centroid, show_plots, save_plots, plot_dpi)
+    if show_plots or save_plots: # Point objects only for the plot
+        plot_analysis_step(f"Sampled Points ({sampling_label})", 4, TOTAL_PLOTTING_STEPS,
+            [{'geoms': connected_open_lines, 'color': 'lightgrey', 'label': 'Connected Lines (Context)', 'alpha':0.7},
+             {'geoms': list(shapely.points(sampled_points)), 'color': 'blue', 'label': 'Sampled Points', 'marker':'o', 'ms':4}],
+            output_dir, gml_filename_stem_for_plots, hull_polygon, hull_centroid, show_plots, save_plots, plot_dpi)
     
     print(f"\n--- GML Analysis of {gml_file_path.name} complete ---")
     
-    # Optionally save sampled points to a CSV for inspection or direct use by next step
-    if sampled_points:
-        points_df = pd.DataFrame([(p.x, p.y) for p in sampled_points], columns=['x', 'y'])
-        csv_out_path = output_dir / f"{gml_filename_stem_for_plots}_sampled_points.csv"
-        points_df.to_csv(csv_out_path, index=False)
-        print(f"Sampled points saved to: {csv_out_path}")
+    # Save the sampled points for the next step (binary) and for inspection (CSV)
+    run_report.phase("save points")
+    if len(sampled_points):
+        npy_out_path = save_sampled_points(sampled_points, output_dir, gml_filename_stem_for_plots)
+        print(f"Sampled points saved to: {npy_out_path} (and .csv)")
 
-    return sampled_points # Return list of Shapely Points
+    return sampled_points # (N, 2) array of x, y
 
 if __name__ == '__main__':
     # Example Usage - Requires a GML file and a hull GPKG
@@ -171,7 +299,7 @@ if __name__ == '__main__':
     gdf_hull.to_file(dummy_hull_path, driver="GPKG")
 
 
-    sampled_points_list = analyze_gml_and_sample_points(
+    sampled_points_xy = analyze_gml_and_sample_points(
         gml_file_path_str=str(dummy_gml_path),
         hull_polygon_gpkg_path_str=str(dummy_hull_path),
         output_dir_str=str(test_output_dir),
@@ -180,7 +308,7 @@ if __name__ == '__main__':
         sample_interval=50, # meters
         show_plots=False, save_plots=True # Adjust for testing
     )
-    if sampled_points_list:
-        print(f"GML Analysis Test: Generated {len(sampled_points_list)} points.")
+    if sampled_points_xy is not None and len(sampled_points_xy):
+        print(f"GML Analysis Test: Generated {len(sampled_points_xy)} points.")
     else:
         print("GML Analysis Test: No points generated or an error occurred.")
\ No newline at end of file
@@ -8,56 +8,66 @@ from helpers import plot_alpha_shape_result
 import pandas as pd
 import numpy as np
 
+def load_sampled_points_xy(sampled_points_input):
+    """
+    Sampled points as an (N, 2) float array from an array, a .npy file, a points CSV with 'x' and
+    'y' columns or a list of Shapely Points. Non-finite and duplicate points are dropped (first
+    occurrence kept). Raises ValueError for other inputs.
+    """
+    if isinstance(sampled_points_input, (str, Path)):
+        if Path(sampled_points_input).suffix.lower() == '.npy':
+            points_xy = np.load(sampled_points_input)
+        else:
+            points_df = pd.read_csv(sampled_points_input)
+            if not {'x', 'y'}.issubset(points_df.columns):
+                raise ValueError("Points CSV must contain 'x' and 'y' columns.")
+            points_xy = points_df[['x', 'y']].to_numpy(dtype=float)
+    elif isinstance(sampled_points_input, np.ndarray):
+        points_xy = sampled_points_input
+    elif isinstance(sampled_points_input, list) and all(isinstance(p, Point) for p in sampled_points_input):
+        points_xy = np.array([(p.x, p.y) for p in sampled_points_input if p.is_valid and not p.is_empty], dtype=float).reshape(-1, 2)
+    else:
+        raise ValueError("sampled_points_input must be an (N, 2) array, a .npy/CSV path or a list of Shapely Points.")
+    points_xy = np.asarray(points_xy, dtype=float).reshape(-1, 2)
+    points_xy = points_xy[np.isfinite(points_xy).all(axis=1)]
+    _, first_index = np.unique(points_xy, axis=0, return_index=True)
+    return points_xy[np.sort(first_index)]
+
 def calculate_and_save_alpha_shape(sampled_points_input,
                                    target_crs_str,
                                    output_dir_str,
                                    output_filename_stem,
                                    alpha_parameter=None, # Manual alpha (float)
                                    default_alpha_if_optimize_fails=1000.0,
-                                   show_plots=True, save_plots=True, plot_dpi=150):
+                                   show_plots=True, save_plots=True, plot_dpi=150,
+                                   return_gdf=False):
+    """
+    Calculates the alpha shape of the sampled points and saves it as GML.
+
+    sampled_points_input is the (N, 2) array of Step 3 (preferred, no file parsing), its .npy
+    file, a points CSV with 'x' and 'y' columns or a list of Shapely Points.
+
+    Returns:
+        str or None: path of the saved GML. With return_gdf=True a tuple (path, alpha_gdf)
+        is returned instead, so callers can use the shape without reading the GML back.
+    """
     print("\n--- Running: Alpha Shape Calculation ---")
+    failed_result = (None, None) if return_gdf else None
     output_dir = Path(output_dir_str)
     output_dir.mkdir(parents=True, exist_ok=True)
     output_gml_path = output_dir / f"{output_filename_stem}.gml"
 
-    points_for_alphashape_tuples = []
-    original_points_for_plotting = []
-
-    if isinstance(sampled_points_input, str) or isinstance(sampled_points_input, Path):
-        try:
-            points_df = pd.read_csv(sampled_points_input)
-            if not {'x', 'y'}.issubset(points_df.columns):
-                raise ValueError("Points CSV must contain 'x' and 'y' columns.")
-            seen_coords_for_alpha_tuples = set()
-            for _, row in points_df.iterrows():
-                p = Point(row['x'], row['y'])
-                original_points_for_plotting.append(p)
-                coord_tuple = (p.x, p.y)
-                if coord_tuple not in seen_coords_for_alpha_tuples:
-                    points_for_alphashape_tuples.append(coord_tuple)
-                    seen_coords_for_alpha_tuples.add(coord_tuple)
-            print(f"Loaded {len(original_points_for_plotting)} points from {sampled_points_input}, "
-                  f"{len(points_for_alphashape_tuples)} unique coordinate tuples for alpha shape.")
-        except Exception as e:
-            print(f"Error loading points from CSV {sampled_points_input}: {e}")
-            return None
-    elif isinstance(sampled_points_input, list) and all(isinstance(p, Point) for p in sampled_points_input):
-        original_points_for_plotting = sampled_points_input
-        seen_coords_for_alpha_tuples = set()
-        for p_obj in original_points_for_plotting:
-            if p_obj.is_valid and not p_obj.is_empty:
-                coord_tuple = (p_obj.x, p_obj.y)
-                if coord_tuple not in seen_coords_for_alpha_tuples:
-                    points_for_alphashape_tuples.append(coord_tuple)
-                    seen_coords_for_alpha_tuples.add(coord_tuple)
-        print(f"Using {len(points_for_alphashape_tuples)} unique coordinate tuples from provided list for alpha shape.")
-    else:
-        print("Error: sampled_points_input must be a list of Shapely Points or a path to a CSV file.")
-        return None
-
-    if not points_for_alphashape_tuples or len(points_for_alphashape_tuples) < 3:
+    try:
+        points_for_alphashape = load_sampled_points_xy(sampled_points_input)
+        source = sampled_points_input if isinstance(sampled_points_input, (str, Path)) else "the provided points"
+        print(f"Using {len(points_for_alphashape)} unique points from {source} for alpha shape.")
+    except Exception as e:
+        print(f"Error loading sampled points: {e}")
+        return failed_result
+
+    if len(points_for_alphashape) < 3:
         print("Not enough valid unique points/tuples for alphashape. Need at least 3.")
-        return None
+        return failed_result
 
     alpha_shape_polygon = None
     actual_alpha_used_display = "N/A" # For display in plot title
@@ -66,12 +76,12 @@ def calculate_and_save_alpha_shape(sampled_points_input,
         if alpha_parameter is not None: # Manual alpha provided
             print(f"  Using manually set alpha: {alpha_parameter}")
             actual_alpha_used_display = f"{alpha_parameter:.4g}"
-            alpha_shape_polygon = alphashape.alphashape(points_for_alphashape_tuples, alpha_parameter)
+            alpha_shape_polygon = alphashape.alphashape(points_for_alphashape, alpha_parameter)
         else: # Attempt to optimize
             print("Attempting to optimize alpha (directly getting shape)...")
             try:
                 # Try to get the shape directly from optimizealpha
-                alpha_shape_polygon = alphashape.optimizealpha(points_for_alphashape_tuples)
+                alpha_shape_polygon = alphashape.optimizealpha(points_for_alphashape)
                 
                 if alpha_shape_polygon and not alpha_shape_polygon.is_empty and isinstance(alpha_shape_polygon, (Polygon, MultiPolygon)):
                     print("  optimizealpha successfully returned a shape.")
@@ -87,7 +97,7 @@ def calculate_and_save_alpha_shape(sampled_points_input,
                 print(f"  Falling back to default alpha: {default_alpha_if_optimize_fails}") # Uses the passed-in default
                 actual_alpha_used_display = f"{default_alpha_if_optimize_fails:.4g}"
                 # Calculate with the (hopefully better) default alpha
-                alpha_shape_polygon = alphashape.alphashape(points_for_alphashape_tuples, default_alpha_if_optimize_fails)
+                alpha_shape_polygon = alphashape.alphashape(points_for_alphashape, default_alpha_if_optimize_fails)
 
         # Validate the obtained polygon
         if alpha_shape_polygon is not None:
@@ -112,7 +122,7 @@ def calculate_and_save_alpha_shape(sampled_points_input,
 
 
     # Use actual_alpha_used_display for plotting
-    plot_alpha_shape_result(original_points_for_plotting, alpha_shape_polygon, actual_alpha_used_display,
+    plot_alpha_shape_result(points_for_alphashape, alpha_shape_polygon, actual_alpha_used_display,
                             target_crs_str, output_dir, f"{output_filename_stem}_plot",
                             show_plots, save_plots, plot_dpi)
 
@@ -129,16 +139,16 @@ def calculate_and_save_alpha_shape(sampled_points_input,
             if not alpha_gdf.empty:
                 alpha_gdf.to_file(output_gml_path, driver="GML", GML_FEATURE_COLLECTION=True, GML_ID='auto')
                 print(f"Successfully saved alpha shape to {output_gml_path}")
-                return str(output_gml_path)
+                return (str(output_gml_path), alpha_gdf) if return_gdf else str(output_gml_path)
             else:
                 print("  Skipping save: No valid geometry after checks/fixes for alpha shape.")
-                return None
+                return failed_result
         except Exception as e:
             print(f"ERROR saving alpha shape to GML: {e}"); traceback.print_exc()
-            return None
+            return failed_result
     else:
         print("No valid alpha shape polygon was calculated or it was empty. Skipping GML save.")
-        return None
+        return failed_result
 
 if __name__ == '__main__':
     # Example Usage
@@ -9,10 +9,10 @@ from shapely.geometry import shape, mapping # mapping might be used if fiona was
 from shapely.ops import transform as shapely_transform, unary_union
 import numpy as np
 from PIL import Image
-import pyproj
 import traceback
-import requests
 from io import BytesIO
+import run_report
+from transformer_cache import get_crs, reproject_gdf
 import geopandas as gpd
 
 # Use the shared plotting helper if available
@@ -26,15 +26,19 @@ def generate_texture_from_polygon(
     wms_width, wms_height, target_wms_crs_str,
     wms_bbox_padding, polygon_crs_fallback_str,
     fill_color_rgb,
-    show_plots=True, save_plots=True, plot_dpi=150):
+    show_plots=True, save_plots=True, plot_dpi=150,
+    polygon_gdf=None):
     """
     Reads polygons from GML, downloads WMS, crops, and saves texture PNG
     directly into the specified output_dir_str.
+    If polygon_gdf (the polygons of the GML, already in memory) is given, the GML file is not read.
 
     Returns:
         tuple: (path_to_texture_str, texture_affine_transform, texture_crs_pyproj_obj)
                Returns (None, None, None) on failure.
     """
+    import requests
+    import http_session
     print("\n--- Running: Step 5 - Texture Generation ---")
     polygon_path = Path(polygon_gml_path_str)
     output_dir = Path(output_dir_str)
@@ -43,7 +47,7 @@ def generate_texture_from_polygon(
     
     target_crs_obj = None # Initialize to be accessible in return on early failure
     try:
-        target_crs_obj = pyproj.CRS.from_user_input(target_wms_crs_str)
+        target_crs_obj = get_crs(target_wms_crs_str)
     except Exception as e_crs_init:
         print(f"  Error: Invalid target_wms_crs_str '{target_wms_crs_str}': {e_crs_init}")
         return None, None, None
@@ -52,15 +56,16 @@ def generate_texture_from_polygon(
     texture_plot_dir = output_dir / "texture_plots"
     if save_plots: texture_plot_dir.mkdir(parents=True, exist_ok=True)
 
-    if not polygon_path.is_file():
+    if polygon_gdf is None and not polygon_path.is_file():
         print(f"  Error: Polygon GML file not found: {polygon_path}"); return None, None, None
 
     # --- Step 1: Read Polygons & Reproject ---
+    run_report.phase("read polygons")
     print(f"  Step 1: Reading Polygons from {polygon_path.name}...")
     geoms_for_processing = [] # Will store Shapely geometries in target_crs_obj
     input_crs_for_plot = None # Store original CRS for initial plot if desired
     try:
-        gdf = gpd.read_file(polygon_path)
+        gdf = polygon_gdf if polygon_gdf is not None else gpd.read_file(polygon_path)
         if gdf.empty:
             print("  Warning: Polygon GML is empty."); return None, None, None
 
@@ -69,18 +74,18 @@ def generate_texture_from_polygon(
         if gdf.crs:
             if not gdf.crs.equals(target_crs_obj):
                 print(f"    Reprojecting source polygons from {gdf.crs.srs} to {target_crs_obj.srs}...")
-                gdf = gdf.to_crs(target_crs_obj)
+                gdf = reproject_gdf(gdf, target_crs_obj)
             else:
                 print(f"    Source polygons already in target CRS {target_crs_obj.srs}.")
         else:
             print(f"    Warning: Polygon GML has no CRS. Assuming fallback: {polygon_crs_fallback_str}")
             try:
-                fallback_crs_obj = pyproj.CRS.from_user_input(polygon_crs_fallback_str)
+                fallback_crs_obj = get_crs(polygon_crs_fallback_str)
                 input_crs_for_plot = fallback_crs_obj # Update for plotting
-                gdf.crs = fallback_crs_obj
+                gdf = gdf.set_crs(fallback_crs_obj, allow_override=True) # Copy: the input GeoDataFrame may be shared
                 if not fallback_crs_obj.equals(target_crs_obj):
                     print(f"    Reprojecting source polygons from fallback {fallback_crs_obj.srs} to {target_crs_obj.srs}...")
-                    gdf = gdf.to_crs(target_crs_obj)
+                    gdf = reproject_gdf(gdf, target_crs_obj)
                 else:
                     print(f"    Fallback CRS matches target CRS {target_crs_obj.srs}.")
             except Exception as fallback_err:
@@ -121,6 +126,7 @@ def generate_texture_from_polygon(
         print(f"  Error in Step 2 (Merge for Texture BBOX): {e}"); traceback.print_exc(); return None, None, None
 
     # --- Step 3: Download WMS ---
+    run_report.phase("WMS download")
     print(f"  Step 3: Downloading WMS Layer '{wms_layer}'...")
     wms_image_array, wms_transform, wms_meta, wms_bounds_tuple = None, None, None, None
     try:
@@ -141,8 +147,9 @@ def generate_texture_from_polygon(
         }
         print(f"    WMS Request URL (approx): {requests.Request('GET', wms_url, params=wms_params).prepare().url}")
 
-        response = requests.get(wms_url, params=wms_params, timeout=180)
+        response = http_session.get(wms_url, params=wms_params, timeout=180) # Retried/hedged, see http_session.py
         response.raise_for_status() # Will raise HTTPError for bad responses (4xx or 5xx)
+        run_report.phase("decode WMS image")
         print(f"    WMS Response Status: {response.status_code}, Content-Type: {response.headers.get('Content-Type')}")
 
         with Image.open(BytesIO(response.content)) as img:
@@ -185,6 +192,7 @@ def generate_texture_from_polygon(
         print(f"  Error in Step 3 (WMS Processing): {e}"); traceback.print_exc(); return None, None, None
 
     # --- Step 4: Crop WMS Image & Fill ---
+    run_report.phase("crop and save texture")
     print("  Step 4: Cropping WMS image...")
     out_transform_cropped = None # Initialize to be accessible for return
     try:
@@ -248,4 +256,4 @@ def generate_texture_from_polygon(
 
     except Exception as e:
         print(f"  Error in Step 4 (Crop/Save Texture): {e}"); traceback.print_exc()
-        return None, None, None
\ No newline at end of file
+        return None, None, None
\ No newline at end of file
@@ -1,12 +1,10 @@
 # pipline/step5b_mark_defects_on_texture.py
-import pandas as pd
 import pyproj
-from shapely import wkt # For loading WKT polygons
-from shapely.ops import transform as shapely_transform # For transforming Shapely geometries
+import shapely
 import cv2 # OpenCV for image manipulation
 import numpy as np
 from pathlib import Path
-import rasterio.transform # For Affine transform methods
+from defect_store import load_defects
 
 def mark_defects_on_texture(
     base_texture_path_str: str,
@@ -18,7 +16,7 @@ def mark_defects_on_texture(
     defect_color_bgr: tuple = (0, 0, 0) # Black in BGR for OpenCV
 ) -> bool:
     """
-    Loads a texture image, reads defect polygons (WKT) from a CSV,
+    Loads a texture image, reads defect polygons (WKT) from a CSV (or Parquet, see defect_store.py),
     projects them onto the texture, draws them as black polygons,
     and overwrites the original texture file.
 
@@ -55,97 +53,61 @@ def mark_defects_on_texture(
         print(f"  Error loading texture image: {e}")
         return False
 
-    # 2. Read defect CSV
+    # 2. Read defects (parsed once per run, see defect_store.py)
     try:
-        df_defects = pd.read_csv(csv_path)
-        required_cols = {'geometry_wkt', 'optimal_epsg_code'}
-        if not required_cols.issubset(df_defects.columns):
-            missing = required_cols - set(df_defects.columns)
-            raise ValueError(f"Defect CSV must contain columns: {missing}")
+        defects = load_defects(csv_path)
+        defects.require(polygons=True)
     except Exception as e:
         print(f"  Error reading or validating defect CSV {csv_path}: {e}")
         return False
 
-    # 3. Process and draw each defect polygon
+    # 3. Reproject all defect polygons to the texture's CRS (one array transform per EPSG code)
+    try:
+        polygons_texture_crs = defects.geometries_in(texture_crs_pyproj_obj)
+    except Exception as e:
+        print(f"  Error transforming defect polygons: {e}")
+        return False
+    exteriors = np.full(len(polygons_texture_crs), None, dtype=object)
+    missing = shapely.is_missing(polygons_texture_crs)
+    if missing.any():
+        print(f"  Warning: {int(missing.sum())} defect(s) without a readable polygon or EPSG code. Skipping them.")
+    for index in np.flatnonzero(~missing):
+        polygon = polygons_texture_crs[index]
+        if polygon.is_empty or not polygon.is_valid:
+            print(f"  Warning: Invalid or empty WKT polygon at row {index}. Skipping.")
+        elif polygon.geom_type == 'Polygon':
+            exteriors[index] = polygon.exterior
+        elif polygon.geom_type == 'MultiPolygon':
+            # Draw the largest part only (a defect is expected to be a single polygon)
+            print(f"  Note: Defect at row {index} is a MultiPolygon. Processing largest part.")
+            exteriors[index] = max(polygon.geoms, key=lambda p: p.area).exterior
+        else:
+            print(f"  Warning: Defect at row {index} is not a Polygon or MultiPolygon after transform ({polygon.geom_type}). Skipping.")
+
+    # 4. Convert all exterior vertices to pixel coordinates at once and draw each defect polygon
+    rows_to_draw = np.flatnonzero(~shapely.is_missing(exteriors))
+    coords_world, ring_index = shapely.get_coordinates(exteriors[rows_to_draw].tolist(), return_index=True)
+    inverse = ~texture_affine_transform
+    cols_px = np.rint(inverse.a * coords_world[:, 0] + inverse.b * coords_world[:, 1] + inverse.c).astype(np.int32)
+    rows_px = np.rint(inverse.d * coords_world[:, 0] + inverse.e * coords_world[:, 1] + inverse.f).astype(np.int32)
+    pixel_coords = np.column_stack([cols_px, rows_px])
+    ring_starts = np.searchsorted(ring_index, np.arange(len(rows_to_draw) + 1))
     defects_drawn = 0
-    # Cache transformers to avoid re-creating them for the same EPSG code
-    transformer_cache = {}
-
-    for index, row in df_defects.iterrows():
+    for i, index in enumerate(rows_to_draw):
+        polygon_pixels = pixel_coords[ring_starts[i]:ring_starts[i + 1]]
+        if len(polygon_pixels) < 3:
+            print(f"  Warning: Not enough pixel coordinates for polygon at row {index}. Skipping.")
+            continue
         try:
-            wkt_string = row['geometry_wkt']
-            defect_poly_original_crs_str = f"EPSG:{row['optimal_epsg_code']}"
-
-            # Load WKT polygon
-            defect_polygon_orig_crs = wkt.loads(wkt_string)
-            if not defect_polygon_orig_crs.is_valid or defect_polygon_orig_crs.is_empty:
-                print(f"  Warning: Invalid or empty WKT polygon at row {index}. Skipping.")
-                continue
-
-            # Get or create transformer
-            if defect_poly_original_crs_str not in transformer_cache:
-                try:
-                    transformer_cache[defect_poly_original_crs_str] = pyproj.Transformer.from_crs(
-                        pyproj.CRS.from_user_input(defect_poly_original_crs_str),
-                        texture_crs_pyproj_obj,
-                        always_xy=True
-                    )
-                except Exception as e_crs:
-                    print(f"  Warning: Could not create transformer for {defect_poly_original_crs_str} at row {index}: {e_crs}. Skipping.")
-                    continue
-            
-            transformer = transformer_cache[defect_poly_original_crs_str]
-
-            # Transform defect polygon to texture's CRS
-            defect_polygon_texture_crs = shapely_transform(transformer.transform, defect_polygon_orig_crs)
-            
-            if not defect_polygon_texture_crs.is_valid or defect_polygon_texture_crs.is_empty:
-                print(f"  Warning: Defect polygon became invalid/empty after transformation at row {index}. Skipping.")
-                continue
-            
-            # Extract exterior coordinates (and interior if it's a Polygon with holes, though less likely for defects)
-            # For simplicity, we'll just draw the exterior of the transformed polygon.
-            # If you have MultiPolygons in WKT, this would need to iterate through `geom.geoms`
-            if defect_polygon_texture_crs.geom_type == 'Polygon':
-                exterior_coords_world = list(defect_polygon_texture_crs.exterior.coords)
-            elif defect_polygon_texture_crs.geom_type == 'MultiPolygon':
-                # Handle MultiPolygon: draw each part. For simplicity, let's take the largest.
-                # A more robust solution would iterate and draw all.
-                print(f"  Note: Defect at row {index} is a MultiPolygon. Processing largest part.")
-                largest_part = max(defect_polygon_texture_crs.geoms, key=lambda p: p.area, default=None)
-                if largest_part:
-                    exterior_coords_world = list(largest_part.exterior.coords)
-                else:
-                    print(f"  Warning: Empty MultiPolygon at row {index}. Skipping.")
-                    continue
-            else:
-                print(f"  Warning: Defect at row {index} is not a Polygon or MultiPolygon after transform ({defect_polygon_texture_crs.geom_type}). Skipping.")
-                continue
-
-            # Convert world polygon vertices to pixel coordinates
-            pixel_coords_list = []
-            for xw, yw in exterior_coords_world:
-                col, row = ~texture_affine_transform * (xw, yw)
-                pixel_coords_list.append([int(round(col)), int(round(row))])
-            
-            if len(pixel_coords_list) < 3:
-                 print(f"  Warning: Not enough pixel coordinates for polygon at row {index}. Skipping.")
-                 continue
-
-            defect_poly_pixel_np = np.array([pixel_coords_list], dtype=np.int32)
-            cv2.fillPoly(image_cv2, [defect_poly_pixel_np], defect_color_bgr)
+            cv2.fillPoly(image_cv2, [polygon_pixels.reshape(1, -1, 2)], defect_color_bgr)
             defects_drawn += 1
-
         except Exception as e:
-            label = row.get('label_name', f'row {index}')
-            print(f"  Warning: Could not process or draw defect '{label}': {e}")
-            import traceback
-            traceback.print_exc() # More detailed error for debugging
-            continue
-    
+            label = defects.df.at[index, 'label_name'] if 'label_name' in defects.df.columns else f'row {index}'
+            print(f"  Warning: Could not draw defect '{label}': {e}")
+
     print(f"  Drew {defects_drawn} defect polygons onto the texture.")
 
-    # 4. Save the modified texture (overwriting the original)
+    # 5. Save the modified texture (overwriting the original)
     try:
         cv2.imwrite(str(base_texture_path), image_cv2)
         print(f"  Successfully saved modified (defect-marked) texture to: {base_texture_path}")
@@ -7,9 +7,9 @@ import geopandas as gpd
 from shapely.geometry import Polygon, MultiPolygon
 from shapely.ops import unary_union
 import numpy as np
-import pyproj
 import traceback
 import copy
+from transformer_cache import get_crs, reproject_gdf
 
 # CadQuery and STL/OBJ related libraries
 import cadquery as cq
@@ -19,6 +19,7 @@ import numpy as np
 
 # Use the shared plotting helper if available
 from helpers import plot_geometries
+import run_report
 
 # --- Reused Helper: Create CQ Solid ---
 # (Keep create_cq_solid_from_shapely_poly as before)
@@ -64,17 +65,17 @@ def create_cq_solid_from_shapely_poly(shapely_polygon, extrusion_height):
 
 # --- Helper Function to Load, Merge, and Simplify GML ---
 # (Keep load_and_prepare_geometry as before)
-def load_and_prepare_geometry(gml_path_str, target_crs, simplify_tolerance, plot_flag, plot_dir, plot_prefix):
-    """Loads GML, merges, simplifies, and returns a single Shapely geometry."""
+def load_and_prepare_geometry(gml_path_str, target_crs, simplify_tolerance, plot_flag, plot_dir, plot_prefix, gdf=None):
+    """Loads GML (or uses the given GeoDataFrame), merges, simplifies, and returns a single Shapely geometry."""
     gml_path = Path(gml_path_str)
-    if not gml_path.is_file(): print(f"  Error: GML file not found: {gml_path}"); return None
+    if gdf is None and not gml_path.is_file(): print(f"  Error: GML file not found: {gml_path}"); return None
     print(f"  Processing GML: {gml_path.name}"); all_polygons=[]; target_crs_obj=None
     try:
-        gdf=gpd.read_file(gml_path)
+        if gdf is None: gdf=gpd.read_file(gml_path)
         if gdf.empty: print("  Warning: GML is empty."); return None
-        target_crs_obj_gml=gdf.crs; target_crs_obj_target=pyproj.CRS.from_user_input(target_crs)
-        if target_crs_obj_gml and not target_crs_obj_gml.equals(target_crs_obj_target): print(f"    Reprojecting GML from {target_crs_obj_gml.srs} to {target_crs}..."); gdf=gdf.to_crs(target_crs_obj_target)
-        elif not target_crs_obj_gml: gdf.crs=target_crs_obj_target
+        target_crs_obj_gml=gdf.crs; target_crs_obj_target=get_crs(target_crs)
+        if target_crs_obj_gml and not target_crs_obj_gml.equals(target_crs_obj_target): print(f"    Reprojecting GML from {target_crs_obj_gml.srs} to {target_crs}..."); gdf=reproject_gdf(gdf, target_crs_obj_target)
+        elif not target_crs_obj_gml: gdf=gdf.set_crs(target_crs_obj_target) # Copy: the input GeoDataFrame may be shared
         target_crs_obj=gdf.crs
         for geom in gdf.geometry:
             if geom is None or geom.is_empty: continue
@@ -326,7 +327,9 @@ def generate_cut_obj_model(
     material_sides,        # <<< NEW
     generate_vt,           # <<< NEW
     z_tolerance,           # <<< NEW
-    show_plots, save_plots, plot_dpi):
+    show_plots, save_plots, plot_dpi,
+    base_gdf=None,         # Optional in-memory GeoDataFrames of the base / tool GML
+    tool_gdf=None):
     """
     Generates a textured OBJ model by cutting one extruded shape from another.
     """
@@ -344,16 +347,18 @@ def generate_cut_obj_model(
     PLOT_DPI_LOCAL = plot_dpi
 
     # --- 1. Load Base Geometry ---
+    run_report.phase("load geometries")
     print("\n--- Loading Base Geometry ---")
-    base_geom = load_and_prepare_geometry(base_gml_path_str, target_crs, simplify_tolerance, save_plots, output_dir, "base_shape_cut")
+    base_geom = load_and_prepare_geometry(base_gml_path_str, target_crs, simplify_tolerance, save_plots, output_dir, "base_shape_cut", gdf=base_gdf)
     if base_geom is None: return False
 
     # --- 2. Load Tool Geometry ---
     print("\n--- Loading Tool Geometry ---")
-    tool_geom = load_and_prepare_geometry(tool_gml_path_str, target_crs, simplify_tolerance, save_plots, output_dir, "tool_shape_cut")
+    tool_geom = load_and_prepare_geometry(tool_gml_path_str, target_crs, simplify_tolerance, save_plots, output_dir, "tool_shape_cut", gdf=tool_gdf)
     if tool_geom is None: return False
 
     # --- 3. Create CQ Solids ---
+    run_report.phase("extrude solids")
     print("\n--- Creating CadQuery Solids ---")
     base_solid_cq = create_cq_solid(base_geom, base_extrusion_height)
     if base_solid_cq is None: return False
@@ -361,6 +366,7 @@ def generate_cut_obj_model(
     if tool_solid_cq is None: return False
 
     # --- 4. Perform Boolean Cut ---
+    run_report.phase("boolean cut")
     print("\n--- Performing Boolean Cut (Base - Tool) ---")
     cut_result_solid = None
     try:
@@ -375,6 +381,7 @@ def generate_cut_obj_model(
     except Exception as e_cut: print(f"  ERROR during boolean cut: {e_cut}"); traceback.print_exc(); return False
 
     # --- 5. Export Intermediate STL ---
+    run_report.phase("export STL")
     print("\n--- Exporting Intermediate STL ---")
     stl_export_success = False
     if cut_result_solid and cut_result_solid.isValid():
@@ -386,6 +393,7 @@ def generate_cut_obj_model(
     else: print("  Error: No valid cut result solid.")
 
     # --- 6. Convert Cut STL to Final Textured OBJ ---
+    run_report.phase("convert STL to OBJ")
     obj_conversion_success = False
     if stl_export_success:
         print("\n--- Converting Cut STL to Final Textured OBJ ---")
@@ -402,6 +410,7 @@ def generate_cut_obj_model(
     else: print("  Skipping OBJ conversion.")
 
     # --- 7. Write MTL File ---
+    run_report.phase("write MTL and cleanup")
     mtl_creation_success = False
     if obj_conversion_success: # Only write MTL if OBJ was created
         print("\n--- Writing MTL File ---")
@@ -8,10 +8,37 @@ from pathlib import Path
 # Z_ADDITIONAL_OFFSET is passed as a function argument
 # FLOAT_PRECISION is implicitly handled by f-string formatting to .6f
 
-def _transform_obj_content(obj_content: str, z_additional_offset_val: float) -> tuple[str | None, float | None, float | None, float | None]:
+def local_frame_origin_from_bounds(min_x: float, min_y: float, max_x: float, max_y: float) -> tuple[float, float]:
+    """
+    World (x, y) of the local frame origin for a bounding box: the middle of the short side
+    at the minimum of the long axis.
+    """
+    if (max_x - min_x) <= (max_y - min_y):
+        return (min_x + max_x) / 2.0, min_y
+    return min_x, (min_y + max_y) / 2.0
+
+
+def read_obj_bounds(obj_path_str: str) -> tuple[float, float, float, float, float] | None:
+    """Returns (min_x, min_y, max_x, max_y, min_z) of the 'v' lines of an OBJ file, or None if it has none."""
+    min_x = min_y = min_z = float('inf')
+    max_x = max_y = float('-inf')
+    with open(obj_path_str, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.startswith('v '): continue
+            parts = line.split()
+            try: x, y, z = float(parts[1]), float(parts[2]), float(parts[3])
+            except (IndexError, ValueError): continue
+            min_x, max_x, min_y, max_y, min_z = min(min_x, x), max(max_x, x), min(min_y, y), max(max_y, y), min(min_z, z)
+    return None if min_z == float('inf') else (min_x, min_y, max_x, max_y, min_z)
+
+
+def _transform_obj_content(obj_content: str, z_additional_offset_val: float,
+                           local_frame_origin_override: tuple[float, float, float] | None = None) -> tuple[str | None, float | None, float | None, float | None]:
     """
     Transforms vertex coordinates in an OBJ string and returns transformation parameters.
     ... (rest of docstring as before) ...
+    local_frame_origin_override: (x_world, y_world, min_z_world) to use instead of the values derived
+    from this OBJ's own vertices, so that several OBJ files (e.g. tiles) share one local frame.
 
     Returns:
         tuple: (transformed_obj_str, offset_x_world, offset_y_world, original_min_z_world)
@@ -75,17 +102,15 @@ def _transform_obj_content(obj_content: str, z_additional_offset_val: float) ->
     bb_height = max_y_orig - min_y_orig
 
     # These are the world coordinates of the origin of the new local frame
-    local_frame_origin_x_world = 0.0
-    local_frame_origin_y_world = 0.0
-
-    if bb_width <= bb_height:
-        local_frame_origin_x_world = (min_x_orig + max_x_orig) / 2.0
-        local_frame_origin_y_world = min_y_orig
-        print(f"  Info: Bbox X-dim ({bb_width:.6f}) <= Y-dim ({bb_height:.6f}). Local Frame Origin (World): X at X-mid, Y at Y-min.")
+    if local_frame_origin_override is not None:
+        local_frame_origin_x_world, local_frame_origin_y_world, min_z_orig = local_frame_origin_override
+        print("  Info: Using the given (shared) Local Frame Origin instead of this OBJ's bounding box.")
     else:
-        local_frame_origin_x_world = min_x_orig
-        local_frame_origin_y_world = (min_y_orig + max_y_orig) / 2.0
-        print(f"  Info: Bbox Y-dim ({bb_height:.6f}) < X-dim ({bb_width:.6f}). Local Frame Origin (World): X at X-min, Y at Y-mid.")
+        local_frame_origin_x_world, local_frame_origin_y_world = local_frame_origin_from_bounds(min_x_orig, min_y_orig, max_x_orig, max_y_orig)
+        if bb_width <= bb_height:
+            print(f"  Info: Bbox X-dim ({bb_width:.6f}) <= Y-dim ({bb_height:.6f}). Local Frame Origin (World): X at X-mid, Y at Y-min.")
+        else:
+            print(f"  Info: Bbox Y-dim ({bb_height:.6f}) < X-dim ({bb_width:.6f}). Local Frame Origin (World): X at X-min, Y at Y-mid.")
 
     z_shift_to_make_min_z_zero = -min_z_orig # This shift makes the object's min_z touch 0 in world coords
     
@@ -130,7 +155,8 @@ def _transform_obj_content(obj_content: str, z_additional_offset_val: float) ->
     return output_buffer.getvalue(), local_frame_origin_x_world, local_frame_origin_y_world, min_z_orig
 
 
-def transform_obj_file(input_obj_path_str: str, output_obj_path_str: str, z_additional_offset_val: float) -> tuple[bool, float | None, float | None, float | None]:
+def transform_obj_file(input_obj_path_str: str, output_obj_path_str: str, z_additional_offset_val: float,
+                       local_frame_origin_override: tuple[float, float, float] | None = None) -> tuple[bool, float | None, float | None, float | None]:
     """
     Reads an OBJ file, transforms its vertex coordinates, and writes a new OBJ file.
     Uses the _transform_obj_content function for the core logic.
@@ -139,6 +165,7 @@ def transform_obj_file(input_obj_path_str: str, output_obj_path_str: str, z_addi
         input_obj_path_str: Path to the input OBJ file.
         output_obj_path_str: Path to save the transformed OBJ file.
         z_additional_offset_val: Additional Z offset to apply after grounding the object's original min_z to 0.
+        local_frame_origin_override: Optional (x_world, y_world, min_z_world) of a shared local frame.
 
     Returns:
         tuple: (success_flag, local_frame_origin_x_world, local_frame_origin_y_world, original_min_z_world)
@@ -154,7 +181,8 @@ def transform_obj_file(input_obj_path_str: str, output_obj_path_str: str, z_addi
     # ... (rest of error handling for read as before)
 
     print("\n  --- Performing OBJ Transformation ---")
-    transformed_obj_data, offset_x, offset_y, orig_min_z = _transform_obj_content(original_obj_data, z_additional_offset_val)
+    transformed_obj_data, offset_x, offset_y, orig_min_z = _transform_obj_content(original_obj_data, z_additional_offset_val,
+                                                                                      local_frame_origin_override)
 
     if transformed_obj_data is None:
         print("  OBJ content transformation failed. No output file generated.")
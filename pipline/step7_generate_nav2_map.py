@@ -9,6 +9,7 @@ import math
 from shapely.geometry import Polygon, MultiPolygon
 from pathlib import Path
 import traceback
+import run_report
 
 # Define standard PGM color values for Nav2 maps (when negate=0 and standard thresholds are used)
 COLOR_OCCUPIED = 0    # Black, for boundaries (high occupancy probability)
@@ -17,16 +18,16 @@ COLOR_FREE = 254      # Almost White, for traversable areas (low occupancy proba
 # Note: Using 254 instead of 255 to avoid potential edge cases with full white if any lib treats it specially.
 
 # extract_polygons_from_gml function remains the same as in your provided code
-def extract_polygons_from_gml(gml_path):
+def extract_polygons_from_gml(gml_path, gdf=None):
     """
-    Extracts polygon vertices from a GML file.
+    Extracts polygon vertices from a GML file (or from gdf, if its features are already in memory).
     Returns a list, where each element is a list of (x, y) vertex tuples for a polygon.
     Handles both Polygon and MultiPolygon geometries.
     Returns None on read error, empty list if no polygons found or no valid ones.
     """
     all_polygons_vertices_world = []
     try:
-        gdf = gpd.read_file(gml_path)
+        if gdf is None: gdf = gpd.read_file(gml_path)
     except Exception as e:
         print(f"  Error reading GML file {gml_path}: {e}")
         traceback.print_exc()
@@ -193,7 +194,9 @@ def generate_nav2_map(bounds_gml_input_path_str,
                       output_map_basename,
                       map_resolution,
                       map_padding_m,
-                      boundary_thickness_px=1): # Pass through boundary thickness
+                      boundary_thickness_px=1, # Pass through boundary thickness
+                      bounds_gdf=None,         # Optional in-memory GeoDataFrames of the two GML files
+                      free_space_gdf=None):
     """
     Main function for Step 7: Creates Nav2 map files.
     - Bounds GML defines map physical size.
@@ -222,7 +225,8 @@ def generate_nav2_map(bounds_gml_input_path_str,
     print(f"  Boundary Thickness: {boundary_thickness_px} px")
 
 
-    list_of_bounds_polygons = extract_polygons_from_gml(bounds_gml_path)
+    run_report.phase("read GML polygons")
+    list_of_bounds_polygons = extract_polygons_from_gml(bounds_gml_path, gdf=bounds_gdf)
     if list_of_bounds_polygons is None:
         print("  Failed to extract polygons for PGM bounds due to GML read error.")
         return False
@@ -254,13 +258,14 @@ def generate_nav2_map(bounds_gml_input_path_str,
     else:
         print("    OBJ local frame origin not provided. YAML origin will be PGM's physical world origin.")
 
-    list_of_free_space_polygons = extract_polygons_from_gml(free_space_gml_path)
+    list_of_free_space_polygons = extract_polygons_from_gml(free_space_gml_path, gdf=free_space_gdf)
     if list_of_free_space_polygons is None:
         print("  Failed to extract polygons for free space due to GML read error.")
         return False
     if not list_of_free_space_polygons:
         print("  Warning: No polygons extracted from Free Space GML. Map will be entirely unknown.")
 
+    run_report.phase("rasterize and write map")
     success = create_map_from_polygons_list(
         list_of_bounding_box_polygons_world=list_of_bounds_polygons,
         list_of_free_space_polygons_world=list_of_free_space_polygons,
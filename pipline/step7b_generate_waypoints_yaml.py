@@ -1,9 +1,11 @@
 # pipline/step7b_generate_waypoints_yaml.py
-import pandas as pd
+import numpy as np
 import yaml
-import pyproj
 from pathlib import Path
 import math # For math.cos, math.sin, math.radians
+from defect_store import load_defects
+
+WAYPOINTS_LOGGED = 10 # Waypoints printed in detail; large campaigns have hundreds of thousands
 
 # Pure Python Euler to Quaternion conversion (common robotics sequence: ZYX intrinsic or XYZ extrinsic)
 # Returns [qx, qy, qz, qw]
@@ -33,7 +35,7 @@ def generate_waypoints_yaml(
     map_frame_id: str = "map"
 ):
     """
-    Generates a YAML file with waypoints for Nav2 from a CSV of defect coordinates.
+    Generates a YAML file with waypoints for Nav2 from a CSV (or Parquet, see defect_store.py) of defect coordinates.
     The defect coordinates are transformed into the OBJ's local coordinate system.
     The YAML structure mirrors a list of PoseStamped messages.
     """
@@ -42,22 +44,17 @@ def generate_waypoints_yaml(
     output_yaml_path = Path(output_yaml_path_str)
     output_yaml_path.parent.mkdir(parents=True, exist_ok=True)
 
-    # 1. Read CSV
+    # 1. Read defects (parsed once per run, see defect_store.py)
     try:
-        df = pd.read_csv(csv_path)
-        if not {'longitude', 'latitude'}.issubset(df.columns):
-            raise ValueError("CSV must contain 'longitude' and 'latitude' columns.")
+        defects = load_defects(csv_path)
+        defects.require(points=True)
     except Exception as e:
         print(f"ERROR: Failed to read or validate CSV {csv_path}: {e}")
         return False
 
-    # 2. Setup CRS transformation
+    # 2. Project all defect coordinates with one array call
     try:
-        transformer_to_intermediate = pyproj.Transformer.from_crs(
-            pyproj.CRS.from_user_input(source_crs_str),
-            pyproj.CRS.from_user_input(intermediate_crs_str),
-            always_xy=True  # Input (lon, lat), output (x, y) based on intermediate_crs_str
-        )
+        coords_intermediate, rows = defects.projected_points(source_crs_str, intermediate_crs_str)
     except Exception as e:
         print(f"ERROR setting up CRS transformation from {source_crs_str} to {intermediate_crs_str}: {e}")
         return False
@@ -76,37 +73,31 @@ def generate_waypoints_yaml(
         print(f"Warning: Could not convert Euler to Quaternion: {e}. Using default identity quaternion.")
         default_orientation_q_dict = {'x': 0.0, 'y': 0.0, 'z': 0.0, 'w': 1.0}
 
-    print(f"  Transforming {len(df)} defect coordinates to local frame...")
-    for index, row in df.iterrows():
-        try:
-            lon, lat = float(row['longitude']), float(row['latitude'])
-
-            # Project to intermediate CRS (these are "world" coordinates relative to the untransformed OBJ)
-            x_intermediate, y_intermediate = transformer_to_intermediate.transform(lon, lat)
-
-            # Transform to local OBJ frame (the frame Nav2 map and Gazebo model use)
-            x_local = x_intermediate - lx_world_origin
-            y_local = y_intermediate - ly_world_origin
-            # All waypoints will be at the specified Z height in the local frame
-            z_local = waypoint_z_in_local_frame
-
-            # Create a dictionary matching PoseStamped structure
-            pose_stamped_dict = {
-                'header': {
-                    'frame_id': map_frame_id,
-                    'stamp': {'sec': 0, 'nanosec': 0} # Stamp can be zero for waypoints definition
-                },
-                'pose': {
-                    'position': {'x': round(x_local, 4), 'y': round(y_local, 4), 'z': round(z_local, 4)},
-                    'orientation': default_orientation_q_dict
-                }
+    print(f"  Transforming {len(defects)} defect coordinates to local frame...")
+    if len(coords_intermediate) < len(defects):
+        print(f"  Skipping {len(defects) - len(coords_intermediate)} row(s) due to invalid coordinates/transformation error.")
+    # Transform to local OBJ frame (the frame Nav2 map and Gazebo model use)
+    coords_local = np.round(coords_intermediate - (lx_world_origin, ly_world_origin), 4)
+    # All waypoints will be at the specified Z height in the local frame
+    z_local = round(waypoint_z_in_local_frame, 4)
+    lon, lat, _ = defects.lonlat()
+    for i, (x_local, y_local) in enumerate(coords_local.tolist()):
+        # Create a dictionary matching PoseStamped structure
+        poses_data.append({
+            'header': {
+                'frame_id': map_frame_id,
+                'stamp': {'sec': 0, 'nanosec': 0} # Stamp can be zero for waypoints definition
+            },
+            'pose': {
+                'position': {'x': x_local, 'y': y_local, 'z': z_local},
+                'orientation': default_orientation_q_dict
             }
-            poses_data.append(pose_stamped_dict)
-            print(f"    Input (lon,lat): ({lon:.4f}, {lat:.4f}) -> Intermediate (x,y): ({x_intermediate:.2f}, {y_intermediate:.2f}) -> Local (x,y,z): ({x_local:.2f}, {y_local:.2f}, {z_local:.2f})")
-
-        except (ValueError, TypeError) as e:
-            print(f"  Skipping row {index} due to invalid coordinates/transformation error: {e}")
-            continue
+        })
+        if i < WAYPOINTS_LOGGED:
+            x_intermediate, y_intermediate = coords_intermediate[i]
+            print(f"    Input (lon,lat): ({lon[rows[i]]:.4f}, {lat[rows[i]]:.4f}) -> Intermediate (x,y): ({x_intermediate:.2f}, {y_intermediate:.2f}) -> Local (x,y,z): ({x_local:.2f}, {y_local:.2f}, {z_local:.2f})")
+    if len(poses_data) > WAYPOINTS_LOGGED:
+        print(f"    ... and {len(poses_data) - WAYPOINTS_LOGGED} more.")
 
     if not poses_data:
         print("  No valid waypoints generated.")
@@ -3,7 +3,7 @@ import os
 import shutil
 from pathlib import Path
 import numpy as np
-import pyproj
+from transformer_cache import get_transformer
 import traceback # For detailed error printing
 
 def get_obj_vertices(obj_file_path):
@@ -62,11 +62,7 @@ def calculate_and_transform_origin_for_gazebo(
         print(f"    Y-dim is shorter. Calculated origin in {obj_crs_str}: (X={origin_x_obj_crs:.2f}, Y={origin_y_obj_crs:.2f}).")
 
     try:
-        transformer = pyproj.Transformer.from_crs(
-            pyproj.CRS.from_user_input(obj_crs_str),
-            pyproj.CRS.from_user_input(target_latlon_crs_str),
-            always_xy=True
-        )
+        transformer = get_transformer(obj_crs_str, target_latlon_crs_str, always_xy=True)
         transformed_lon, transformed_lat = transformer.transform(origin_x_obj_crs, origin_y_obj_crs)
         print(f"    Transformed origin to {target_latlon_crs_str}: (Lon={transformed_lon:.6f}, Lat={transformed_lat:.6f})")
         return transformed_lat, transformed_lon
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+# step_scheduler.py
+import traceback
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import run_report
+from artifact_cache import compute_step_key
+
+# Step outcome values reported by StepScheduler.run()
+STATUS_DONE = "done"              # Step ran and produced its outputs
+STATUS_CACHED = "cached"          # Step outputs were restored from the artifact cache
+STATUS_RESUMED = "resumed"        # Step outputs were restored from the run manifest of a previous run
+STATUS_INCOMPLETE = "incomplete"  # Step ran but skipped or failed gracefully (returned False)
+STATUS_ERROR = "error"            # Step raised an exception
+STATUS_CANCELLED = "cancelled"    # Step never ran because a fatal step before it did not complete
+COMPLETED_STATUSES = (STATUS_DONE, STATUS_CACHED, STATUS_RESUMED)
+
+
+class PipelineStep:
+    """
+    One node of the pipeline DAG.
+
+    A step is declared by the context keys it reads (`requires`) and writes (`provides`).
+    Dependencies between steps are derived from these keys: a step depends on every step
+    that provides one of its required keys. Keys that no step provides are run inputs
+    (e.g. 'csv_path') and must be put into the context before the run starts.
+
+    A step is cacheable when `cache_params` is given (a dict of the configuration constants
+    it depends on). `cache_files` names context keys holding external input files whose
+    content enters the cache key, `cache_exclude` names required keys the step only uses
+    by name (their producers then do not invalidate it), and `transient` names provided
+    in-memory values that are not stored; consumers must fall back to the files for those.
+
+    `func(ctx)` reads its inputs from the shared context dict, writes its outputs back into it
+    and returns True if it produced its outputs. Returning False means the step was skipped
+    or failed; downstream steps still run and apply their own input checks.
+    """
+    def __init__(self, step_id, func, requires=(), provides=(), title=None, fatal=False,
+                 cache_params=None, cache_files=(), cache_exclude=(), transient=()):
+        self.step_id = step_id
+        self.func = func
+        self.requires = tuple(requires)
+        self.provides = tuple(provides)
+        self.title = title or func.__name__
+        self.fatal = fatal  # If True, the whole run is aborted when this step does not complete
+        self.cache_params = cache_params
+        self.cache_files = tuple(cache_files)
+        self.cache_exclude = tuple(cache_exclude)
+        self.transient = tuple(transient)
+
+    def __repr__(self):
+        return f"PipelineStep({self.step_id!r}, requires={self.requires}, provides={self.provides})"
+
+
+class StepScheduler:
+    """
+    Runs PipelineSteps in dependency order, executing independent steps concurrently.
+    With an ArtifactCache, cacheable steps whose key is already stored are restored instead of run.
+    With a RunManifest, every completed step is checkpointed and steps recorded by a previous
+    (resumed) run are restored from it instead of run.
+    """
+    def __init__(self, steps, max_workers=4, cache=None, manifest=None):
+        self.steps = {}
+        for step in steps:
+            if step.step_id in self.steps:
+                raise ValueError(f"Duplicate pipeline step id: {step.step_id}")
+            self.steps[step.step_id] = step
+        self.max_workers = max(1, int(max_workers))
+        self.cache = cache
+        self.manifest = manifest
+        self.producers = {}
+        self.dependencies = self._resolve_dependencies()
+        self.order = self._topological_order()
+
+    def _resolve_dependencies(self):
+        producers = self.producers
+        for step in self.steps.values():
+            for key in step.provides:
+                if key in producers:
+                    raise ValueError(f"Context key '{key}' is provided by both step {producers[key]} and step {step.step_id}.")
+                producers[key] = step.step_id
+        dependencies = {}
+        for step in self.steps.values():
+            deps = []
+            for key in step.requires:
+                producer = producers.get(key)
+                if producer is not None and producer != step.step_id and producer not in deps:
+                    deps.append(producer)
+            dependencies[step.step_id] = deps
+        return dependencies
+
+    def _topological_order(self):
+        order, visiting, visited = [], set(), set()
+
+        def visit(step_id):
+            if step_id in visited: return
+            if step_id in visiting:
+                raise ValueError(f"Pipeline steps contain a dependency cycle through step {step_id}.")
+            visiting.add(step_id)
+            for dep in self.dependencies[step_id]: visit(dep)
+            visiting.discard(step_id)
+            visited.add(step_id)
+            order.append(step_id)
+
+        for step_id in self.steps: visit(step_id)
+        return order
+
+    def describe(self):
+        """Prints the DAG, one line per step in topological order."""
+        print("Pipeline step graph:")
+        for step_id in self.order:
+            deps = ", ".join(self.dependencies[step_id]) or "-"
+            print(f"  Step {step_id:<3} <- [{deps}]  ({self.steps[step_id].title})")
+
+    def run(self, ctx):
+        """
+        Executes all steps. A step is started as soon as every step it depends on has finished,
+        whatever their outcome, so the per-step input validation decides whether it can do work.
+
+        Returns:
+            dict: step_id -> one of the STATUS_* values.
+        """
+        status = {}
+        step_keys = {}     # step_id -> artifact cache key of the outputs it produced
+        fingerprints = {}  # step_id -> run manifest fingerprint of a completed step
+        pending = [step_id for step_id in self.order]
+        running = {}
+        aborted = False
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pipeline-step") as executor:
+            while pending or running:
+                if not aborted:
+                    ready = [sid for sid in pending if all(dep in status for dep in self.dependencies[sid])]
+                    for step_id in ready:
+                        pending.remove(step_id)
+                        future = executor.submit(self._run_step, self.steps[step_id], ctx, dict(step_keys), dict(fingerprints))
+                        running[future] = step_id
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    step_id = running.pop(future)
+                    status[step_id], step_keys[step_id], fingerprints[step_id] = future.result()
+                    self._checkpoint(self.steps[step_id], status[step_id], fingerprints[step_id], ctx)
+                    if self.steps[step_id].fatal and status[step_id] not in COMPLETED_STATUSES:
+                        print(f"FATAL: Step {step_id} did not complete. Remaining steps are cancelled.")
+                        aborted = True
+
+        for step_id in pending:
+            status[step_id] = STATUS_CANCELLED
+        return status
+
+    def _upstream_steps(self, step):
+        """Producers of the keys a step requires, except those it only uses by name (cache_exclude)."""
+        upstream = []
+        for key in step.requires:
+            producer = self.producers.get(key)
+            if producer is None or key in step.cache_exclude or producer in upstream:
+                continue
+            upstream.append(producer)
+        return upstream
+
+    def _step_key(self, step, ctx, upstream_keys, purpose):
+        if step.cache_params is None:
+            return None
+        try:
+            return compute_step_key(step.step_id, step.cache_params, [ctx.get(k) for k in step.cache_files],
+                                    [upstream_keys.get(p) for p in self._upstream_steps(step)])
+        except Exception as e:
+            print(f"  Warning: Could not compute {purpose} for Step {step.step_id}: {e}")
+            return None
+
+    def cache_key(self, step, ctx, step_keys):
+        """Returns the artifact cache key for a step, or None if it cannot be cached in this run."""
+        if self.cache is None:
+            return None
+        return self._step_key(step, ctx, step_keys, "cache key")
+
+    def fingerprint(self, step, ctx, fingerprints):
+        """Returns the run manifest fingerprint of a step, or None if it cannot be checkpointed."""
+        if self.manifest is None:
+            return None
+        return self._step_key(step, ctx, fingerprints, "run manifest fingerprint")
+
+    def _checkpoint(self, step, status, fingerprint, ctx):
+        """Records a completed step in the run manifest, or forgets it if it did not complete."""
+        if self.manifest is None or status == STATUS_RESUMED:
+            return
+        if status in (STATUS_DONE, STATUS_CACHED):
+            values = {name: ctx.get(name) for name in step.provides if name not in step.transient}
+            self.manifest.record(step.step_id, fingerprint, status, values)
+        else:
+            self.manifest.discard(step.step_id)
+
+    def _run_step(self, step, ctx, step_keys, fingerprints):
+        """Runs (or restores) one step inside a run_report span. Returns (status, cache_key, fingerprint)."""
+        with run_report.span(f"Step {step.step_id}: {step.title}", category='step', step_id=step.step_id) as span:
+            fingerprint = self.fingerprint(step, ctx, fingerprints)
+            status, key = self._execute_step(step, ctx, step_keys, fingerprint)
+            if span is not None: span.attrs['status'] = status
+        return status, key, (fingerprint if status in COMPLETED_STATUSES else None)
+
+    def _execute_step(self, step, ctx, step_keys, fingerprint=None):
+        if fingerprint is not None:
+            restored = self.manifest.restore(step.step_id, fingerprint)
+            if restored is not None:
+                for name in step.provides:
+                    ctx[name] = restored.get(name)
+                print(f"\n=== STEP {step.step_id}: {step.title} resumed from run manifest ===")
+                return STATUS_RESUMED, self.cache_key(step, ctx, step_keys)
+        if self.cache is not None and step.cache_params is not None:
+            run_report.phase("artifact cache lookup")
+        key = self.cache_key(step, ctx, step_keys)
+        if key is not None:
+            restored = self.cache.load(key, ctx['output_dir'])
+            if restored is not None:
+                for name in step.provides:
+                    ctx[name] = restored.get(name)
+                print(f"\n=== STEP {step.step_id}: {step.title} restored from artifact cache ({key[:12]}) ===")
+                return STATUS_CACHED, key
+        run_report.end_phase()
+        try:
+            produced = step.func(ctx)
+        except Exception as e:
+            print(f"ERROR in Step {step.step_id} ({step.title}): {e}")
+            traceback.print_exc()
+            return STATUS_ERROR, None
+        if not produced:
+            return STATUS_INCOMPLETE, None
+        if key is not None:
+            run_report.phase("artifact cache store")
+            values = {name: ctx.get(name) for name in step.provides if name not in step.transient}
+            if not self.cache.store(key, values, ctx['output_dir']):
+                key = None
+        return STATUS_DONE, key
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+# tests/conftest.py
+"""Makes the pipeline modules (flat in pipline/) importable for the tests. Run from pipline/: python -m pytest tests"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
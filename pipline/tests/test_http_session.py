@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# tests/test_http_session.py
+"""Tests of the shared HTTP layer (http_session.py) against the local stand-in server."""
+import time
+from urllib.parse import urlsplit
+
+import pytest
+import requests
+
+import http_session
+from benchmarks.standin_server import StandinServer
+from shapely.geometry import box
+
+POLYGONS = [box(i * 10, 0, i * 10 + 5, 5) for i in range(50)]
+GETFEATURE = {'SERVICE': 'WFS', 'REQUEST': 'GetFeature', 'TYPENAMES': 'adv:AX_Strassenverkehr'}
+
+
+@pytest.fixture(autouse=True)
+def http_policy():
+    """Fast backoff and no hedging unless a test configures it; restores the process policy afterwards."""
+    saved = dict(http_session._SETTINGS)
+    http_session.configure(retries=3, backoff_base_s=0.001, backoff_max_s=0.01, hedge_percentile=None)
+    http_session.reset_metrics()
+    yield
+    http_session._SETTINGS.clear()
+    http_session._SETTINGS.update(saved)
+    http_session.reset_metrics()
+
+def host_metrics(server):
+    return http_session.metrics()[urlsplit(server.url('wfs')).netloc]
+
+
+@pytest.mark.parametrize('status', [503, 429])
+def test_retryable_status_is_retried(status):
+    with StandinServer(POLYGONS, image_png=b'PNG', fail_every=2, fail_status=status) as server:
+        responses = [http_session.get(server.url('wms'), params={'REQUEST': 'GetMap'}, timeout=5) for _ in range(3)]
+        assert [r.status_code for r in responses] == [200, 200, 200]
+        assert server.stats['failed'] == 2 # Requests 2 and 4, each retried once
+        m = host_metrics(server)
+        assert m['retries'] == 2
+        assert m['requests'] == server.stats['requests'] == 5
+
+def test_retry_after_is_respected():
+    http_session.configure(backoff_max_s=1.0) # Retry-After is capped by backoff_max_s
+    with StandinServer(POLYGONS, image_png=b'PNG', fail_every=1, retry_after='0.3') as server:
+        start = time.perf_counter()
+        response = http_session.get(server.url('wms'), params={'REQUEST': 'GetMap'}, timeout=5, retries=1)
+        elapsed = time.perf_counter() - start
+    assert response.status_code == 503 # Retries used up: the last response is returned
+    assert elapsed >= 0.3
+
+def test_backoff_delay_bounds():
+    http_session.configure(backoff_base_s=0.5, backoff_max_s=3.0)
+    for attempt in range(6):
+        cap = min(3.0, 0.5 * 2 ** attempt)
+        delays = [http_session.backoff_delay(attempt) for _ in range(200)]
+        assert all(0.0 <= d <= cap for d in delays)
+    assert all(http_session.backoff_delay(0, retry_after_s=2.0) >= 2.0 for _ in range(50))
+    assert http_session.backoff_delay(0, retry_after_s=100.0) == 3.0 # Retry-After is capped by backoff_max_s
+
+def test_last_error_is_raised_when_retries_run_out():
+    with StandinServer(POLYGONS) as server:
+        url = server.url('wfs')
+    host = urlsplit(url).netloc # The server is closed: connections are refused
+    with pytest.raises(requests.ConnectionError):
+        http_session.get(url, timeout=1, retries=2)
+    m = http_session.metrics()[host]
+    assert (m['failures'], m['retries'], m['requests']) == (3, 2, 0)
+
+def test_slow_request_is_hedged_and_the_duplicate_wins():
+    http_session.configure(hedge_percentile=50, hedge_min_samples=5)
+    with StandinServer(POLYGONS, image_png=b'PNG', slow_every=8, slow_s=2.0) as server:
+        for _ in range(7):
+            http_session.get(server.url('wms'), params={'REQUEST': 'GetMap'}, timeout=5)
+        start = time.perf_counter()
+        response = http_session.get(server.url('wms'), params={'REQUEST': 'GetMap'}, timeout=5) # Request 8 is slow
+        elapsed = time.perf_counter() - start
+        assert response.status_code == 200 and response.content == b'PNG'
+        assert elapsed < 1.5
+        m = host_metrics(server)
+        assert (m['hedged'], m['hedge_wins']) == (1, 1)
+
+def test_gzip_negotiation_and_byte_counts():
+    with StandinServer(POLYGONS) as server:
+        response = http_session.get(server.url('wfs'), params=GETFEATURE, timeout=5)
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert response.content == server.getfeature_body({})
+        streamed = http_session.get(server.url('wfs'), params=GETFEATURE, timeout=5, stream=True)
+        with streamed:
+            streamed.raw.decode_content = True
+            assert streamed.raw.read() == server.getfeature_body({})
+            http_session.record_received(streamed.url, streamed.raw.tell())
+        m = host_metrics(server)
+        assert m['bytes'] == server.stats['bytes'] # Bytes on the wire, compressed
+        assert m['bytes'] < 2 * len(server.getfeature_body({}))
+        assert m['requests'] == 2
+        assert 0.0 < m['latency_p50_s'] <= m['latency_p95_s']
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+# tiling.py
+"""
+Tiled processing of large areas of interest (TILING_ENABLED).
+
+Steps 1-4 still run once for the whole AOI. The AOI (bounds of the clipped WFS layers) is then
+split into a grid of TILE_SIZE_M squares that overlap by TILE_OVERLAP_M, and every tile gets
+its own copy of the Step 5-7 inputs (WFS layers and alpha shape clipped to the tile). The tiles
+are processed in worker processes in two phases:
+  1. Steps 5, 5b and 6: texture, defect marking and cut OBJ of the tile (in world coordinates),
+  2. Steps 6b and 7: transformed OBJ and Nav2 map of the tile in the shared local frame.
+Between the phases the shared local frame is derived from the bounds of all tile meshes, the
+same way Step 6b derives it for a single mesh, so the tiles line up without stitching.
+
+Outputs, under <output_dir>/TILES_OUTPUT_SUBDIR:
+    tile_r<row>_c<col>/<CUT_MODEL_OUTPUT_SUBDIR>/  texture, cut OBJ/MTL and transformed OBJ
+    tile_r<row>_c<col>/<NAV2_MAP_OUTPUT_SUBDIR>/   Nav2 map (PGM + YAML) of the tile
+    tile_r<row>_c<col>/tile.log                     output of the steps for the tile
+    TILES_INDEX_FILENAME                            shared frame and per-tile assets (multi-map YAML)
+"""
+import contextlib
+import math
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+TILE_LOG_FILENAME = "tile.log"
+TILE_ALPHA_SHAPE_FILENAME = "alpha_shape_tile.gml"
+
+
+def make_tile_grid(bounds, tile_size_m, overlap_m):
+    """
+    Splits bounds (minx, miny, maxx, maxy) into a grid of tile_size_m squares, each grown by overlap_m
+    on every side (the outer tiles are cut back to the bounds).
+
+    Returns:
+        list: dicts with 'id', 'row', 'col', 'core_bounds' and 'bounds' (with overlap).
+    """
+    minx, miny, maxx, maxy = bounds
+    n_cols = max(1, math.ceil((maxx - minx) / tile_size_m))
+    n_rows = max(1, math.ceil((maxy - miny) / tile_size_m))
+    tiles = []
+    for row in range(n_rows):
+        for col in range(n_cols):
+            core = (minx + col * tile_size_m, miny + row * tile_size_m,
+                    min(maxx, minx + (col + 1) * tile_size_m), min(maxy, miny + (row + 1) * tile_size_m))
+            grown = (max(minx, core[0] - overlap_m), max(miny, core[1] - overlap_m),
+                     min(maxx, core[2] + overlap_m), min(maxy, core[3] + overlap_m))
+            tiles.append({'id': f"r{row}_c{col}", 'row': row, 'col': col, 'core_bounds': core, 'bounds': grown})
+    return tiles
+
+
+def _clip_to_tile(gdf, tile_bounds):
+    import geopandas as gpd
+    from shapely.geometry import box
+    clipped = gpd.clip(gdf, box(*tile_bounds))
+    clipped = clipped[~clipped.geometry.is_empty & clipped.geometry.notna()]
+    # Clipping polygons along the tile edges can leave stray lines/points; only areas are useful here
+    return clipped[clipped.geometry.geom_type.isin(['Polygon', 'MultiPolygon'])]
+
+
+def prepare_tiles(ctx, tiles_dir):
+    """
+    Clips the Step 5-7 inputs of the pipeline context to every tile and writes them into the tile
+    directories. Tiles without any base (cut) polygon are dropped.
+
+    Returns:
+        list: tile dicts (see make_tile_grid) with 'dir', 'gml_paths' and 'alpha_shape_gml_path'.
+    """
+    import geopandas as gpd
+    cfg = ctx['cfg']
+    gml_keys = list(dict.fromkeys([cfg.BASE_GML_KEY_FOR_CUT, cfg.TEXTURE_SOURCE_GML_KEY, cfg.NAV2_MAP_BOUNDS_GML_KEY]))
+    layers = {}
+    for key in gml_keys:
+        gdf = (ctx.get('fetched_wfs_gdfs') or {}).get(key)
+        if gdf is None:
+            gml_path = ctx['fetched_wfs_gml_paths'].get(key)
+            if not (gml_path and Path(gml_path).exists()):
+                print(f"  Error: GML for '{key}' not available; cannot tile.")
+                return []
+            gdf = gpd.read_file(gml_path)
+        layers[key] = gdf if gdf.crs is not None else gdf.set_crs(cfg.TARGET_CRS)
+    alpha_gdf = ctx.get('alpha_shape_gdf')
+    if alpha_gdf is None: alpha_gdf = gpd.read_file(ctx['alpha_shape_gml_path'])
+    if alpha_gdf.crs is None: alpha_gdf = alpha_gdf.set_crs(cfg.TARGET_CRS)
+
+    aoi_bounds = layers[cfg.BASE_GML_KEY_FOR_CUT].total_bounds
+    tiles = make_tile_grid(tuple(aoi_bounds), cfg.TILE_SIZE_M, cfg.TILE_OVERLAP_M)
+    print(f"  AOI {aoi_bounds[2] - aoi_bounds[0]:.0f} m x {aoi_bounds[3] - aoi_bounds[1]:.0f} m -> "
+          f"{len(tiles)} tile(s) of {cfg.TILE_SIZE_M:.0f} m (+{cfg.TILE_OVERLAP_M:.0f} m overlap)")
+
+    prepared = []
+    for tile in tiles:
+        clipped = {key: _clip_to_tile(gdf, tile['bounds']) for key, gdf in layers.items()}
+        if clipped[cfg.BASE_GML_KEY_FOR_CUT].empty:
+            print(f"  Tile {tile['id']}: no road surface, skipped.")
+            continue
+        tile_dir = tiles_dir / f"tile_{tile['id']}"
+        tile_dir.mkdir(parents=True, exist_ok=True)
+        tile['dir'] = str(tile_dir)
+        tile['gml_paths'] = {}
+        for key, gdf in clipped.items():
+            out_path = tile_dir / f"{key.replace(':', '_')}_tile.gml" # Same naming scheme as Step 2a
+            gdf.to_file(out_path, driver='GML', GML_FEATURE_COLLECTION=True, GML_ID='auto')
+            tile['gml_paths'][key] = str(out_path)
+        tile_alpha = _clip_to_tile(alpha_gdf, tile['bounds'])
+        tile['alpha_shape_gml_path'] = None
+        if not tile_alpha.empty:
+            tile['alpha_shape_gml_path'] = str(tile_dir / TILE_ALPHA_SHAPE_FILENAME)
+            tile_alpha.to_file(tile['alpha_shape_gml_path'], driver='GML', GML_FEATURE_COLLECTION=True, GML_ID='auto')
+        prepared.append(tile)
+    return prepared
+
+
+def _tile_context(tile, cfg, csv_path):
+    """Run context for the Step 5-7 functions of main_orchestrator, pointed at the tile's inputs and directory."""
+    tile_dir = Path(tile['dir'])
+    final_model_output_dir = tile_dir / cfg.CUT_MODEL_OUTPUT_SUBDIR
+    final_model_output_dir.mkdir(parents=True, exist_ok=True)
+    return {'cfg': cfg, 'csv_path': csv_path, 'output_dir': tile_dir, 'final_model_output_dir': final_model_output_dir,
+            'fetched_wfs_gml_paths': dict(tile['gml_paths']), 'alpha_shape_gml_path': tile['alpha_shape_gml_path']}
+
+def _run_in_tile_log(tile, func):
+    """Runs func() with the console output redirected to the tile's log file. Returns its result or None if it raised."""
+    with open(Path(tile['dir']) / TILE_LOG_FILENAME, 'a', encoding='utf-8') as log_file, \
+         contextlib.redirect_stdout(log_file), contextlib.redirect_stderr(log_file):
+        try:
+            return func()
+        except Exception:
+            traceback.print_exc()
+            return None
+
+def run_tile_model(tile, cfg, csv_path):
+    """
+    Phase 1 for one tile (worker process): Steps 5, 5b and 6.
+
+    Returns:
+        dict: the tile with 'texture_path', 'cut_obj_path', 'cut_mtl_path' and 'obj_bounds'
+              ((min_x, min_y, max_x, max_y, min_z) of the cut OBJ), None where a step failed.
+    """
+    import main_orchestrator
+    from step6b_transform_obj import read_obj_bounds
+    def phase():
+        ctx = _tile_context(tile, cfg, csv_path)
+        print(f"--- Tile {tile['id']}: bounds {tuple(round(v, 2) for v in tile['bounds'])} (pid {os.getpid()}) ---")
+        if main_orchestrator.run_step5_texture(ctx):
+            main_orchestrator.run_step5b_mark_defects(ctx)
+            main_orchestrator.run_step6_cut_model(ctx)
+        result = {'texture_path': ctx.get('final_texture_path'), 'cut_obj_path': ctx.get('cut_obj_path'),
+                  'cut_mtl_path': ctx.get('cut_mtl_path'), 'obj_bounds': None}
+        if result['cut_obj_path']: result['obj_bounds'] = read_obj_bounds(result['cut_obj_path'])
+        return result
+    tile = dict(tile)
+    tile.update(_run_in_tile_log(tile, phase) or {'texture_path': None, 'cut_obj_path': None,
+                                                   'cut_mtl_path': None, 'obj_bounds': None})
+    return tile
+
+def run_tile_local_frame(tile, cfg, csv_path, local_frame_origin):
+    """
+    Phase 2 for one tile (worker process): Steps 6b and 7 in the shared local frame
+    local_frame_origin = (x_world, y_world, min_z_world).
+
+    Returns:
+        dict: the tile with 'transformed_obj_path' and 'nav2_map_yaml_path' (None where a step failed).
+    """
+    import main_orchestrator
+    def phase():
+        ctx = _tile_context(tile, cfg, csv_path)
+        ctx['cut_obj_path'] = tile['cut_obj_path']
+        ctx['local_frame_origin_override'] = local_frame_origin
+        main_orchestrator.run_step6b_transform_obj(ctx)
+        main_orchestrator.run_step7_nav2_map(ctx)
+        return {'transformed_obj_path': ctx.get('transformed_obj_path'), 'nav2_map_yaml_path': ctx.get('nav2_map_yaml_path')}
+    tile = dict(tile)
+    tile.update(_run_in_tile_log(tile, phase) or {'transformed_obj_path': None, 'nav2_map_yaml_path': None})
+    return tile
+
+
+def _map_tiles(func, tiles, max_workers, *args):
+    """Applies func(tile, *args) to every tile, in a process pool if max_workers > 1. Keeps the tile order."""
+    if max_workers <= 1 or len(tiles) <= 1:
+        return [func(tile, *args) for tile in tiles]
+    results = {}
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(tiles)), initializer=_init_tile_worker) as executor:
+        futures = {executor.submit(func, tile, *args): tile['id'] for tile in tiles}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+    return [results[tile['id']] for tile in tiles]
+
+def _init_tile_worker():
+    from helpers import use_headless_plotting
+    from http_session import get_session
+    use_headless_plotting()
+    get_session()
+
+
+def shared_local_frame(tiles):
+    """
+    Local frame shared by all tiles: origin from the union of the tile mesh bounds (see
+    step6b_transform_obj.local_frame_origin_from_bounds) and the lowest vertex of all tiles.
+
+    Returns:
+        tuple: (x_world, y_world, min_z_world), or None if no tile has a mesh.
+    """
+    from step6b_transform_obj import local_frame_origin_from_bounds
+    all_bounds = [tile['obj_bounds'] for tile in tiles if tile.get('obj_bounds')]
+    if not all_bounds: return None
+    min_x, min_y = min(b[0] for b in all_bounds), min(b[1] for b in all_bounds)
+    max_x, max_y = max(b[2] for b in all_bounds), max(b[3] for b in all_bounds)
+    origin_x, origin_y = local_frame_origin_from_bounds(min_x, min_y, max_x, max_y)
+    return origin_x, origin_y, min(b[4] for b in all_bounds)
+
+
+def write_tiles_index(tiles, local_frame_origin, cfg, output_path):
+    """
+    Writes the tile index: the shared local frame and, per tile, its world bounds and assets
+    (paths relative to the index). The Nav2 maps of all tiles are in the shared frame, so the
+    list doubles as a multi-map description.
+    """
+    import yaml
+    output_path = Path(output_path)
+    def rel(path):
+        return Path(os.path.relpath(path, output_path.parent)).as_posix() if path else None
+    x_world, y_world, min_z_world = local_frame_origin
+    index = {
+        'crs': cfg.TARGET_CRS,
+        'local_frame_origin_world': {'x': float(x_world), 'y': float(y_world), 'min_z': float(min_z_world)},
+        'tile_size_m': float(cfg.TILE_SIZE_M),
+        'tile_overlap_m': float(cfg.TILE_OVERLAP_M),
+        'map_frame_id': cfg.WAYPOINTS_MAP_FRAME_ID,
+        'tiles': [],
+    }
+    for tile in tiles:
+        index['tiles'].append({
+            'id': tile['id'], 'row': tile['row'], 'col': tile['col'],
+            'core_bounds_world': [float(v) for v in tile['core_bounds']],
+            'bounds_world': [float(v) for v in tile['bounds']],
+            'texture': rel(tile.get('texture_path')),
+            'obj': rel(tile.get('transformed_obj_path')),
+            'mtl': rel(tile.get('cut_mtl_path')),
+            'nav2_map_yaml': rel(tile.get('nav2_map_yaml_path')),
+            'complete': bool(tile.get('transformed_obj_path') and tile.get('nav2_map_yaml_path')),
+        })
+    with open(output_path, 'w', encoding='utf-8') as f:
+        yaml.safe_dump(index, f, sort_keys=False)
+    return str(output_path)
+
+
+def run_tiled_steps(ctx):
+    """
+    Runs Steps 5-7 tile by tile (see the module docstring) and stores 'tiles_dir', 'tiles_index_path',
+    'obj_local_frame_origin_world_xy' and 'obj_original_min_z_world' in the context.
+    Returns True if every tile produced its mesh and map.
+    """
+    cfg = ctx['cfg']
+    tiles_dir = ctx['output_dir'] / cfg.TILES_OUTPUT_SUBDIR
+    tiles_dir.mkdir(parents=True, exist_ok=True)
+    start = time.time()
+    tiles = prepare_tiles(ctx, tiles_dir)
+    if not tiles:
+        print("  Error: No tile with inputs for Steps 5-7.")
+        return False
+    max_workers = cfg.TILE_MAX_WORKERS
+    print(f"  Phase 1 (Steps 5, 5b, 6) on {len(tiles)} tile(s), {max_workers} worker(s)...")
+    tiles = _map_tiles(run_tile_model, tiles, max_workers, cfg, ctx['csv_path'])
+    local_frame_origin = shared_local_frame(tiles)
+    if local_frame_origin is None:
+        print(f"  Error: No tile produced a cut OBJ. See the {TILE_LOG_FILENAME} files in {tiles_dir}")
+        return False
+    print(f"  Shared Local Frame Origin (World): X={local_frame_origin[0]:.3f}, Y={local_frame_origin[1]:.3f}, "
+          f"Min_Z={local_frame_origin[2]:.3f}")
+    modelled = [tile for tile in tiles if tile.get('cut_obj_path')]
+    print(f"  Phase 2 (Steps 6b, 7) on {len(modelled)} tile(s)...")
+    done = {tile['id']: tile for tile in _map_tiles(run_tile_local_frame, modelled, max_workers, cfg, ctx['csv_path'],
+                                                     local_frame_origin)}
+    tiles = [done.get(tile['id'], tile) for tile in tiles]
+
+    ctx['tiles_dir'] = tiles_dir
+    ctx['tiles_index_path'] = write_tiles_index(tiles, local_frame_origin, cfg, tiles_dir / cfg.TILES_INDEX_FILENAME)
+    ctx['obj_local_frame_origin_world_xy'] = local_frame_origin[:2]
+    ctx['obj_original_min_z_world'] = local_frame_origin[2]
+    incomplete = [tile['id'] for tile in tiles if not (tile.get('transformed_obj_path') and tile.get('nav2_map_yaml_path'))]
+    print(f"  {len(tiles) - len(incomplete)}/{len(tiles)} tile(s) complete in {time.time() - start:.1f}s. "
+          f"Tile index: {ctx['tiles_index_path']}")
+    if incomplete:
+        print(f"  Incomplete tiles (see their {TILE_LOG_FILENAME}): {', '.join(incomplete)}")
+    return not incomplete
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+# transformer_cache.py
+"""
+Process-wide cache of pyproj Transformers and CRS objects, shared by all steps.
+
+Building a Transformer queries the PROJ database and takes milliseconds to tens of
+milliseconds; batch workers and the defect daemon would otherwise do it thousands of times.
+Transformers are cached by (source CRS, target CRS, always_xy). Concurrent requests for the
+same new key wait for a single construction. pyproj (>= 3.1) Transformers may be shared
+between threads.
+
+Besides get_transformer() the module offers array and geometry helpers built on the cache,
+and reproject_gdf() as the cached replacement for GeoDataFrame.to_crs(). cache_stats()
+reports hits, misses and the time spent building transformers; run_pipeline() adds it to
+the run report.
+"""
+import threading
+import time
+
+import numpy as np
+
+_LOCK = threading.Lock()
+_TRANSFORMERS = {}   # key -> Transformer
+_BUILDING = {}       # key -> threading.Event, set once the key's Transformer is built (or failed)
+_CRS_OBJECTS = {}    # user input -> pyproj.CRS
+_STATS = {'hits': 0, 'misses': 0, 'build_s': 0.0, 'crs_hits': 0, 'crs_misses': 0}
+_BUILD_TIMES = {}    # key -> seconds
+
+
+def _crs_key(crs):
+    """Hashable, stable key for a CRS given as string, EPSG code or pyproj.CRS."""
+    if isinstance(crs, str):
+        return crs.strip().upper()
+    if isinstance(crs, int):
+        return f"EPSG:{crs}"
+    return crs.to_wkt() # pyproj.CRS; WKT is what identifies it
+
+
+def get_crs(crs):
+    """Returns the pyproj.CRS for a CRS given as string, EPSG code or pyproj.CRS (cached)."""
+    import pyproj
+    if isinstance(crs, pyproj.CRS):
+        return crs
+    key = _crs_key(crs)
+    with _LOCK:
+        crs_obj = _CRS_OBJECTS.get(key)
+        _STATS['crs_hits' if crs_obj is not None else 'crs_misses'] += 1
+    if crs_obj is None:
+        crs_obj = pyproj.CRS.from_user_input(crs)
+        with _LOCK:
+            crs_obj = _CRS_OBJECTS.setdefault(key, crs_obj)
+    return crs_obj
+
+
+def get_transformer(source_crs, target_crs, always_xy=True):
+    """Returns the shared pyproj Transformer from source_crs to target_crs (strings, EPSG codes or pyproj.CRS)."""
+    key = (_crs_key(source_crs), _crs_key(target_crs), bool(always_xy))
+    while True:
+        with _LOCK:
+            transformer = _TRANSFORMERS.get(key)
+            if transformer is not None:
+                _STATS['hits'] += 1
+                return transformer
+            building = _BUILDING.get(key)
+            if building is None: # This thread builds it
+                building = _BUILDING[key] = threading.Event()
+                break
+        building.wait() # Another thread is building it; then look again (it may have failed)
+    try:
+        import pyproj
+        start = time.perf_counter()
+        transformer = pyproj.Transformer.from_crs(get_crs(source_crs), get_crs(target_crs), always_xy=always_xy)
+        elapsed = time.perf_counter() - start
+        with _LOCK:
+            _TRANSFORMERS[key] = transformer
+            _STATS['misses'] += 1
+            _STATS['build_s'] += elapsed
+            _BUILD_TIMES[key] = elapsed
+        return transformer
+    finally:
+        with _LOCK:
+            _BUILDING.pop(key, None)
+        building.set()
+
+
+def transform_xy(x, y, source_crs, target_crs):
+    """
+    Transforms coordinate arrays (x/lon, y/lat order) with one call.
+
+    Returns:
+        tuple: (x, y) as float numpy arrays; points that cannot be transformed are inf.
+    """
+    x_out, y_out = get_transformer(source_crs, target_crs, always_xy=True).transform(
+        np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+    return np.asarray(x_out, dtype=float), np.asarray(y_out, dtype=float)
+
+
+def transform_geometries(geometries, source_crs, target_crs):
+    """
+    Reprojects an array of shapely geometries (None entries stay None) with one array transform.
+    Z coordinates are transformed too and kept, as with to_crs().
+    """
+    import shapely
+    transformer = get_transformer(source_crs, target_crs, always_xy=True)
+    # With include_z=None shapely calls this once for the 2D and once for the 3D geometries
+    return shapely.transform(np.asarray(geometries, dtype=object),
+                             lambda coords: np.column_stack(transformer.transform(*coords.T)), include_z=None)
+
+
+def reproject_gdf(gdf, target_crs):
+    """
+    Cached replacement for gdf.to_crs(target_crs). Returns gdf itself if it is already in target_crs
+    (like to_crs, a new GeoDataFrame otherwise). Raises ValueError if gdf has no CRS.
+    """
+    import geopandas as gpd
+    if gdf.crs is None:
+        raise ValueError("Cannot reproject a GeoDataFrame without CRS.")
+    target_crs_obj = get_crs(target_crs)
+    if gdf.crs.equals(target_crs_obj):
+        return gdf
+    geometry_name = gdf.geometry.name
+    reprojected = gdf.copy()
+    reprojected[geometry_name] = gpd.GeoSeries(transform_geometries(gdf.geometry.values, gdf.crs, target_crs_obj),
+                                               index=gdf.index, crs=target_crs_obj)
+    return reprojected.set_crs(target_crs_obj, allow_override=True)
+
+
+def cache_stats():
+    """
+    Returns:
+        dict: 'hits', 'misses', 'build_s' (total Transformer construction time), 'crs_hits',
+              'crs_misses', 'entries' and 'slowest' (the five slowest builds as [source, target, s]).
+    """
+    with _LOCK:
+        stats = dict(_STATS, entries=len(_TRANSFORMERS))
+        slowest = sorted(_BUILD_TIMES.items(), key=lambda item: -item[1])[:5]
+    stats['build_s'] = round(stats['build_s'], 6)
+    stats['slowest'] = [[source[:40], target[:40], round(seconds, 6)] for (source, target, _), seconds in slowest]
+    return stats
+
+def stats_delta(before, after):
+    """Counters of after minus before (both from cache_stats()), for the share of one run."""
+    return {key: round(after[key] - before[key], 6) for key in ('hits', 'misses', 'build_s', 'crs_hits', 'crs_misses')}
+
+def clear_cache():
+    """Drops all cached Transformers/CRS objects and resets the statistics."""
+    with _LOCK:
+        _TRANSFORMERS.clear()
+        _CRS_OBJECTS.clear()
+        _BUILD_TIMES.clear()
+        _STATS.update(hits=0, misses=0, build_s=0.0, crs_hits=0, crs_misses=0)
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+# wfs_cache.py
+"""
+Persistent cache of WFS GetFeature responses (SQLite), shared by all runs on a machine.
+
+An entry is one completely downloaded request: the raw GML pages returned for a (WFS URL,
+typename, CRS, requested properties) in a bbox, and the area the request was limited to (the
+part of the hull inside the bbox when Step 2a sends a spatial filter; the whole bbox otherwise).
+A request is answered from the cache if its area is covered by the union of entries that are
+younger than the TTL, so a site inside a district fetched before does not touch the network.
+Entries with all properties also answer requests for a subset of them. In offline mode entries
+are used regardless of their age. Pages are stored zlib-compressed; cadastral GML shrinks to
+about a tenth.
+"""
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import closing
+from pathlib import Path
+
+# Bump when the layout of the tables changes; older cache files are emptied on open.
+CACHE_SCHEMA_VERSION = 2
+ALL_PROPERTIES = '*'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tiles (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL, typename TEXT NOT NULL, crs TEXT NOT NULL, properties TEXT NOT NULL,
+    minx REAL NOT NULL, miny REAL NOT NULL, maxx REAL NOT NULL, maxy REAL NOT NULL,
+    area BLOB, -- WKB of the requested area inside the bbox; NULL = the whole bbox
+    fetched_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tiles_layer ON tiles (url, typename, crs, minx, maxx);
+CREATE TABLE IF NOT EXISTS pages (
+    tile_id INTEGER NOT NULL REFERENCES tiles (id) ON DELETE CASCADE,
+    page INTEGER NOT NULL,
+    gml BLOB NOT NULL,
+    PRIMARY KEY (tile_id, page)
+);
+"""
+
+
+def properties_key(property_names):
+    """Cache key of a PropertyName list (None = all properties)."""
+    return ",".join(sorted(property_names)) if property_names else ALL_PROPERTIES
+
+
+class WFSCache:
+    """
+    SQLite store of WFS requests. Safe to use from several threads and processes
+    (every call opens its own connection; writes are single transactions).
+    """
+    def __init__(self, path, ttl_s=None):
+        """path: SQLite file (created if missing). ttl_s: maximum age of usable entries; None = no expiry."""
+        self.path = Path(path)
+        self.ttl_s = ttl_s
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            if conn.execute("PRAGMA user_version").fetchone()[0] != CACHE_SCHEMA_VERSION:
+                conn.executescript("DROP TABLE IF EXISTS pages; DROP TABLE IF EXISTS tiles;")
+                conn.execute(f"PRAGMA user_version = {CACHE_SCHEMA_VERSION}")
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    @staticmethod
+    def _entry_area(row):
+        from shapely import from_wkb
+        from shapely.geometry import box
+        return from_wkb(row[5]) if row[5] is not None else box(*row[1:5])
+
+    def lookup(self, url, typename, crs, bbox, area=None, property_names=None, offline=False):
+        """
+        Returns the GML pages (zlib-compressed) of the entries whose union covers the requested area
+        (area, a shapely geometry, or the whole bbox), or None if it is not covered. Entries older
+        than the TTL are ignored unless offline.
+        """
+        import shapely
+        from shapely.geometry import box
+        minx, miny, maxx, maxy = bbox
+        query = ("SELECT id, minx, miny, maxx, maxy, area FROM tiles WHERE url=? AND typename=? AND crs=?"
+                 " AND properties IN (?, ?) AND minx < ? AND maxx > ? AND miny < ? AND maxy > ?")
+        params = [url, typename, crs, properties_key(property_names), ALL_PROPERTIES, maxx, minx, maxy, miny]
+        if self.ttl_s is not None and not offline:
+            query += " AND fetched_at >= ?"
+            params.append(time.time() - self.ttl_s)
+        with closing(self._connect()) as conn:
+            rows = conn.execute(query, params).fetchall()
+            if not rows: return None
+            requested = area if area is not None else box(*bbox)
+            entry_areas = [self._entry_area(row) for row in rows]
+            # Only the entries needed: one that covers the request alone, else all that intersect it
+            covering = [row[0] for row, entry_area in zip(rows, entry_areas) if entry_area.covers(requested)]
+            if covering:
+                tile_ids = covering[:1]
+            elif shapely.union_all(entry_areas).covers(requested):
+                tile_ids = [row[0] for row, entry_area in zip(rows, entry_areas) if entry_area.intersects(requested)]
+            else:
+                return None
+            placeholders = ",".join("?" * len(tile_ids))
+            pages = conn.execute(f"SELECT gml FROM pages WHERE tile_id IN ({placeholders}) ORDER BY tile_id, page", tile_ids).fetchall()
+        return [gml for (gml,) in pages]
+
+    def store(self, url, typename, crs, bbox, pages, area=None, property_names=None, compressed=False):
+        """
+        Stores the complete download of one request: a list of GML pages, raw or, with
+        compressed=True, already zlib-compressed. Entries of the same layer whose area lies
+        within the new one are replaced.
+        """
+        from shapely.geometry import box
+        blobs = list(pages) if compressed else [zlib.compress(page, 6) for page in pages]
+        new_area = area if area is not None else box(*bbox)
+        properties = properties_key(property_names)
+        with self._lock, closing(self._connect()) as conn, conn:
+            rows = conn.execute("SELECT id, minx, miny, maxx, maxy, area FROM tiles WHERE url=? AND typename=? AND crs=? AND properties=?"
+                                " AND minx >= ? AND miny >= ? AND maxx <= ? AND maxy <= ?", (url, typename, crs, properties, *bbox)).fetchall()
+            superseded = [(row[0],) for row in rows if new_area.covers(self._entry_area(row))]
+            conn.executemany("DELETE FROM tiles WHERE id=?", superseded)
+            tile_id = conn.execute("INSERT INTO tiles (url, typename, crs, properties, minx, miny, maxx, maxy, area, fetched_at)"
+                                   " VALUES (?,?,?,?,?,?,?,?,?,?)",
+                                   (url, typename, crs, properties, *bbox, area.wkb if area is not None else None, time.time())).lastrowid
+            conn.executemany("INSERT INTO pages (tile_id, page, gml) VALUES (?,?,?)",
+                             [(tile_id, page, gml) for page, gml in enumerate(blobs)])
+
+    def purge_expired(self):
+        """Deletes entries older than the TTL. Returns the number of deleted entries."""
+        if self.ttl_s is None: return 0
+        with self._lock, closing(self._connect()) as conn, conn:
+            return conn.execute("DELETE FROM tiles WHERE fetched_at < ?", (time.time() - self.ttl_s,)).rowcount